@@ -0,0 +1,92 @@
+import queue
+import threading
+from collections import OrderedDict
+
+import pygame
+
+# Decoded, pre-scaled scene backgrounds. Scenes reachable through leads_to are decoded and scaled
+# on a background thread ahead of time, so walking through a door is a dictionary lookup
+# instead of a JPEG decode + scale inside the event handler.
+
+BACKGROUND_SIZE = (900, 600)
+
+
+def scene_image_file(scene_name):
+    # Where main.py writes each scene's image (_generate_images_for_scene_and_icons)
+    return "scene_" + scene_name + ".jpeg"
+
+
+class SceneAssets:
+    def __init__(self, max_scenes=8, size=BACKGROUND_SIZE):
+        self.max_scenes = max_scenes
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # scene name -> (surface, converted); LRU order, most recently used last
+        self._surfaces = OrderedDict()
+        self._pending = set()
+        self._queue = queue.Queue()
+        threading.Thread(target=self._worker, daemon=True).start()
+
+    def _load(self, scene_name):
+        image = pygame.image.load(scene_image_file(scene_name))
+        return pygame.transform.scale(image, self.size)
+
+    def _store(self, scene_name, surface, converted):
+        with self._lock:
+            self._surfaces[scene_name] = (surface, converted)
+            self._surfaces.move_to_end(scene_name)
+            while len(self._surfaces) > self.max_scenes:
+                self._surfaces.popitem(last=False)
+
+    def _worker(self):
+        while True:
+            scene_name = self._queue.get()
+            try:
+                with self._lock:
+                    cached = scene_name in self._surfaces
+                if not cached:
+                    self._store(scene_name, self._load(scene_name), False)
+            except (pygame.error, FileNotFoundError) as e:
+                print(f"Prefetch of {scene_name} failed: {e}")
+            finally:
+                with self._lock:
+                    self._pending.discard(scene_name)
+
+    def put(self, scene_name, surface):
+        # An already scaled background from elsewhere (a resumed session's snapshot)
+        self._store(scene_name, surface, False)
+
+    def cached(self, scene_name):
+        # The scaled background if it's in the cache, without loading it or touching the LRU order
+        with self._lock:
+            entry = self._surfaces.get(scene_name)
+        return entry[0] if entry is not None else None
+
+    def prefetch(self, scene_names):
+        with self._lock:
+            wanted = [name for name in scene_names if name not in self._surfaces and name not in self._pending]
+            self._pending.update(wanted)
+        for scene_name in wanted:
+            self._queue.put(scene_name)
+
+    def get(self, scene_name):
+        with self._lock:
+            entry = self._surfaces.get(scene_name)
+            if entry is not None:
+                self._surfaces.move_to_end(scene_name)
+        if entry is None:
+            # Not prefetched (yet): load synchronously
+            self.misses += 1
+            surface = self._load(scene_name).convert()
+            self._store(scene_name, surface, True)
+            return surface
+
+        self.hits += 1
+        surface, converted = entry
+        if not converted:
+            # convert() needs the display, so it happens here on the main thread, once
+            surface = surface.convert()
+            self._store(scene_name, surface, True)
+        return surface
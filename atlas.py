@@ -0,0 +1,113 @@
+import json
+import math
+import os
+
+import pygame
+
+from world_store import write_json
+
+# Item icons. All of a scene's icons are painted by one image-generation call as a grid sprite
+# sheet; the sheet is sliced into cells and every scene's icons are packed into a single atlas
+# image for the world, with an index of where each icon sits. The game decodes the atlas once and
+# draws icons as subsurfaces of it.
+
+ICON_SIZE = (64, 64)
+# Icons per atlas row
+ATLAS_COLUMNS = 16
+ATLAS_IMAGE = "item_atlas.png"
+ATLAS_INDEX = "item_atlas.json"
+# Fraction of each sheet cell trimmed off every side, so gutters and neighbours don't bleed in
+CELL_INSET = 0.06
+
+
+def sheet_grid(count):
+    # (columns, rows) of the smallest near-square grid holding count icons
+    columns = max(1, math.ceil(math.sqrt(count)))
+    return columns, max(1, math.ceil(count / columns))
+
+
+def slice_sheet(path, count, icon_size=ICON_SIZE):
+    # The first count cells of the sheet, left to right and top to bottom, scaled to icon_size
+    sheet = pygame.image.load(path)
+    if sheet.get_bitsize() < 24:
+        sheet = sheet.convert(24)
+    columns, rows = sheet_grid(count)
+    cell_width, cell_height = sheet.get_width() / columns, sheet.get_height() / rows
+    inset_x, inset_y = cell_width * CELL_INSET, cell_height * CELL_INSET
+    icons = []
+    for i in range(count):
+        column, row = i % columns, i // columns
+        cell = pygame.Rect(round(column * cell_width + inset_x), round(row * cell_height + inset_y),
+                           round(cell_width - 2 * inset_x), round(cell_height - 2 * inset_y))
+        icons.append(pygame.transform.smoothscale(sheet.subsurface(cell), icon_size))
+    return icons
+
+
+class AtlasBuilder:
+    # Packs icons into fixed-size cells in the order scenes are added, so a scene's icons keep
+    # their place in the atlas as later scenes arrive
+    def __init__(self, icon_size=ICON_SIZE, columns=ATLAS_COLUMNS):
+        self.icon_size = icon_size
+        self.columns = columns
+        # scene name -> {item name: surface}
+        self._icons = {}
+
+    def add(self, scene_name, icons):
+        self._icons[scene_name] = dict(icons)
+
+    def save(self, directory="."):
+        # Writes the atlas image, then its index (so an index never points past the image it's read
+        # with), and returns the index
+        count = sum(len(icons) for icons in self._icons.values())
+        if not count:
+            return None
+        width, height = self.icon_size
+        columns = min(self.columns, count)
+        atlas = pygame.Surface((columns * width, math.ceil(count / columns) * height))
+        index = {"image": ATLAS_IMAGE, "size": list(atlas.get_size()), "icon_size": list(self.icon_size), "icons": {}}
+        slot = 0
+        for scene_name, icons in self._icons.items():
+            rects = index["icons"].setdefault(scene_name, {})
+            for item_name, icon in icons.items():
+                position = ((slot % columns) * width, (slot // columns) * height)
+                atlas.blit(icon, position)
+                rects[item_name] = [position[0], position[1], width, height]
+                slot += 1
+
+        image_path = os.path.join(directory, ATLAS_IMAGE)
+        # pygame picks the format from the extension, so the temp file keeps .png
+        tmp_image_path = image_path[:-len(".png")] + ".tmp.png"
+        pygame.image.save(atlas, tmp_image_path)
+        os.replace(tmp_image_path, image_path)
+
+        write_json(os.path.join(directory, ATLAS_INDEX), index, indent=None)
+        return index
+
+
+class ItemAtlas:
+    def __init__(self, index, surface):
+        self.surface = surface
+        # (scene name, item name) -> subsurface of the atlas (shares its pixels, nothing is copied)
+        self._icons = {}
+        bounds = surface.get_rect()
+        for scene_name, rects in index["icons"].items():
+            for item_name, rect in rects.items():
+                rect = pygame.Rect(rect)
+                if bounds.contains(rect):
+                    self._icons[(scene_name, item_name)] = surface.subsurface(rect)
+
+    @classmethod
+    def load(cls, index_path=ATLAS_INDEX):
+        # The atlas the index describes, decoded once, or None if there isn't one (yet)
+        try:
+            with open(index_path) as f:
+                index = json.load(f)
+            surface = pygame.image.load(os.path.join(os.path.dirname(index_path), index["image"]))
+        except (OSError, ValueError, KeyError, pygame.error):
+            return None
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        return cls(index, surface)
+
+    def icon(self, scene_name, item_name):
+        return self._icons.get((scene_name, item_name))
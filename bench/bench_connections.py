@@ -0,0 +1,82 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import openai
+import requests
+
+from stub_server import start_stub_server
+
+# Per-call connection overhead: a fresh openai.OpenAI client / bare requests.post per call
+# (the old behaviour) versus the shared pooled clients from http_clients.py.
+# Against the local stub this measures TCP setup + client construction only; against the real
+# APIs TLS handshakes make the difference larger.
+
+
+def time_calls(fn, n):
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def report(label, samples, connections):
+    print(f"{label:<28} mean {statistics.mean(samples):7.2f} ms  p50 {statistics.median(samples):7.2f} ms  connections {connections}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure per-call connection overhead")
+    parser.add_argument("-n", type=int, default=50, help="calls per backend")
+    args = parser.parse_args()
+
+    server, base_url = start_stub_server()
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+    os.environ["SD3_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    # Stub latencies and cached stub replies stay out of the real latency history and cache
+    work_dir = tempfile.mkdtemp(prefix="bench_connections-")
+    os.environ["GEN_LATENCY_HISTORY"] = os.path.join(work_dir, "latency_history.json")
+    os.environ["GEN_CACHE_DIR"] = os.path.join(work_dir, "gen_cache")
+
+    import http_clients
+
+    messages = [{"role": "user", "content": "hello"}]
+    sd3_url = base_url + "/v2beta/stable-image/generate/ultra"
+    sd3_kwargs = {"files": {"none": ''}, "data": {"prompt": "x", "aspect_ratio": "3:2", "output_format": "jpeg"}}
+
+    def fresh_openai():
+        client = openai.OpenAI(api_key="stub", base_url=base_url + "/v1")
+        client.chat.completions.create(model="gpt-4", messages=messages)
+
+    def pooled_openai():
+        http_clients.get_openai_client().chat.completions.create(model="gpt-4", messages=messages)
+
+    def fresh_sd3():
+        requests.post(sd3_url, **sd3_kwargs)
+
+    def pooled_sd3():
+        http_clients.get_session("sd3").post(sd3_url, timeout=http_clients.get_timeout(), **sd3_kwargs)
+
+    for label, fn in [
+        ("openai: new client per call", fresh_openai),
+        ("openai: shared client", pooled_openai),
+        ("sd3: bare requests.post", fresh_sd3),
+        ("sd3: shared session", pooled_sd3),
+    ]:
+        fn()  # warm up imports / pool
+        before = server.state.connections
+        samples = time_calls(fn, args.n)
+        report(label, samples, server.state.connections - before)
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+# Headless render-loop benchmark: runs game.play() under SDL's dummy video driver against a
+# fixture game_data.json, replaying a scripted input session (recorded with game.RECORD_INPUT, or
+# generated here: hovering items, solving the puzzles, walking between scenes), and reports
+# frame-time percentiles plus the time per phase (event handling, text rendering, blits, flip).
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+import game
+from assets import BACKGROUND_SIZE
+from atlas import ATLAS_INDEX, AtlasBuilder, slice_sheet
+from hit_index import ItemHitIndex, build_item_rects
+from render import TextCache
+from stub_server import make_jpeg
+from world_store import World, convert
+
+PHASES = ["events", "text", "blit", "flip", "frame"]
+
+
+def add_coordinates(game_data):
+    # Same non-overlapping grid the stub server answers vision calls with, for items that have none
+    for scene in game_data["scenes"].values():
+        for i, item in enumerate(scene["items"].values()):
+            item.setdefault("coordinates", [0.1 + (i % 4) * 0.25, 0.3 + (i // 4) * 0.4])
+    return game_data
+
+
+def prepare_world(game_data_path, workdir):
+    # Copy the world into workdir with everything game.play() reads from the current directory:
+    # the world index and scene shards (with item coordinates), scene images, an item icon atlas
+    # (sliced from the scene images if the world has none) and the cursor sprites
+    with open(game_data_path) as f:
+        game_data = add_coordinates(json.load(f))
+    source_dir = os.path.dirname(os.path.abspath(game_data_path))
+    image_bytes = None
+    for scene_name in game_data["scenes"]:
+        image_file = "scene_" + scene_name + ".jpeg"
+        if os.path.exists(os.path.join(source_dir, image_file)):
+            shutil.copy(os.path.join(source_dir, image_file), workdir)
+        else:
+            if image_bytes is None:
+                image_bytes = make_jpeg()
+            with open(os.path.join(workdir, image_file), "wb") as f:
+                f.write(image_bytes)
+    for cursor in ("ms_cursor.png", "ms_cursor2.png"):
+        shutil.copy(os.path.join(REPO_DIR, cursor), workdir)
+    if "item_atlas" not in game_data:
+        atlas = AtlasBuilder()
+        for scene_name, scene in game_data["scenes"].items():
+            icons = slice_sheet(os.path.join(workdir, "scene_" + scene_name + ".jpeg"), len(scene["items"]))
+            atlas.add(scene_name, zip(scene["items"], icons))
+        atlas.save(workdir)
+        game_data["item_atlas"] = ATLAS_INDEX
+    game_data["ready_scenes"] = list(game_data["scenes"])
+    convert(game_data, workdir)
+    return game_data
+
+
+def item_centers(game_data, scene_name):
+    background_topleft = (game.WINDOW_WIDTH // 2 - BACKGROUND_SIZE[0] // 2, 40)
+    item_rects = build_item_rects(game_data["scenes"][scene_name], BACKGROUND_SIZE, game.ITEM_SIZE)
+    return {name: rect.center for name, rect in ItemHitIndex(item_rects, background_topleft).rects.items()}
+
+
+def make_script(game_data, laps=3, gap=4):
+    # A play session for any world: hover every item, satisfy the puzzle requirements that live in
+    # the current scene, then use a path item to walk to the next scene; repeated `laps` times
+    action_rects, _ = game.layout_action_buttons(TextCache(), pygame.font.SysFont("None", 68))
+    buttons = {action: rect.center for action, (surface, rect) in action_rects.items()}
+    scenes = game_data["scenes"]
+    events = []
+    frame = 0
+
+    def add(kind, pos):
+        nonlocal frame
+        frame += gap
+        events.append({"frame": frame, "type": kind, "pos": list(pos), "button": 1} if kind == "click"
+                      else {"frame": frame, "type": kind, "pos": list(pos)})
+
+    current = next(name for name in scenes if game.is_start_scene(name))
+    unlocked = {name for name, scene in scenes.items() if not scene.get("is_locked")}
+    for _ in range(laps * len(scenes)):
+        centers = item_centers(game_data, current)
+        for pos in centers.values():
+            add("move", pos)
+        for puzzle in game_data["puzzles"].values():
+            for action, item_name in puzzle["requirements"]:
+                if item_name in centers:
+                    add("click", buttons[action])
+                    add("move", centers[item_name])
+                    add("click", centers[item_name])
+            if all(item_name in centers for _, item_name in puzzle["requirements"]):
+                unlocked.add(puzzle["result"]["unlocked_area"])
+        paths = [(name, item["leads_to"]) for name, item in scenes[current]["items"].items() if item.get("leads_to") in unlocked]
+        if not paths:
+            break
+        item_name, current = paths[0]
+        add("click", buttons["use"])
+        add("move", centers[item_name])
+        add("click", centers[item_name])
+    return {"events": events}
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless game-loop benchmark with scripted input replay")
+    parser.add_argument("--game-data", default=os.path.join(BENCH_DIR, "fixtures", "world.json"))
+    parser.add_argument("--script", help="replay script (game.RECORD_INPUT output); default: generated from the world")
+    parser.add_argument("--laps", type=int, default=3, help="walks through every scene in the generated script")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--full-redraw", action="store_true", help="compare against game.FULL_REDRAW")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "game_loop.json"))
+    args = parser.parse_args()
+
+    pygame.init()
+    screen = pygame.display.set_mode((game.WINDOW_WIDTH, game.WINDOW_HEIGHT))
+    game.FULL_REDRAW = args.full_redraw
+
+    if args.script:
+        with open(args.script) as f:
+            script = json.load(f)
+    else:
+        with open(args.game_data) as f:
+            script = make_script(add_coordinates(json.load(f)), laps=args.laps)
+
+    frames = []
+    start_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir:
+        for _ in range(args.repeat):
+            prepare_world(args.game_data, workdir)
+            os.chdir(workdir)
+            try:
+                world = World.load()
+                game.play(screen, world, input_source=game.ScriptedInput(script), on_frame=frames.append)
+            finally:
+                os.chdir(start_dir)
+        unlocked = [name for name in world.scene_names if not world.is_locked(name)]
+
+    results = {
+        "game_data": os.path.relpath(args.game_data, start_dir),
+        "script": args.script or f"generated ({args.laps} laps)",
+        "full_redraw": args.full_redraw,
+        "repeat": args.repeat,
+        "frames": len(frames),
+        "script_events": len(script["events"]),
+        "unlocked_scenes": unlocked,
+        "phases_ms": {},
+    }
+    print(f"{len(frames)} frames, {len(script['events'])} scripted events per run, unlocked: {', '.join(unlocked)}")
+    print(f"{'phase':<8} {'mean':>8} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+    for phase in PHASES:
+        values = [frame[phase] * 1000 for frame in frames]
+        stats = {
+            "mean": round(statistics.mean(values), 4),
+            "p50": round(percentile(values, 50), 4),
+            "p90": round(percentile(values, 90), 4),
+            "p99": round(percentile(values, 99), 4),
+            "max": round(max(values), 4),
+        }
+        results["phases_ms"][phase] = stats
+        print(f"{phase:<8} {stats['mean']:>8.3f} {stats['p50']:>8.3f} {stats['p90']:>8.3f} {stats['p99']:>8.3f} {stats['max']:>8.3f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to", args.output)
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    main()
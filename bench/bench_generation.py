@@ -0,0 +1,198 @@
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+# Offline end-to-end benchmark of the generation pipeline: starts the stub server with latency
+# roughly like the real backends, then generates worlds of several sizes under several concurrency
+# settings and reports per-stage and end-to-end timings. Each run is a fresh process (the limits
+# and pools are read from the environment at import time) working in its own temp directory with
+# the generation cache off. Results are written as JSON so runs can be compared over time.
+
+# Real backend latencies in seconds, scaled down by --time-scale so a sweep finishes quickly
+PROFILES = {
+    "realistic": {
+        "chat_latency": "lognormal:0.8,0.3",
+        "vision_latency": "lognormal:4.0,0.3",
+        "image_latency": "lognormal:8.0,0.25",
+        # ~120 characters/s of GPT-4 output
+        "stream_chunk_delay": 0.13,
+    },
+    "fast": {
+        "chat_latency": "0.1",
+        "vision_latency": "0.2",
+        "image_latency": "0.3",
+        "stream_chunk_delay": 0.005,
+    },
+}
+
+# progress message -> stage that has finished when it's emitted
+STAGE_MESSAGES = {
+    "Checking the story...": "story_written",
+    "Placing the items...": "story_ready",
+}
+
+
+def scale_latency(spec, factor):
+    # "lognormal:0.8,0.3" -> median scaled, sigma kept; plain numbers and ranges scaled outright
+    kind, _, args = spec.partition(":")
+    if not args:
+        return str(round(float(kind) * factor, 6))
+    values = [float(value) for value in args.split(",")]
+    if kind in ("lognormal", "normal"):
+        values[0] *= factor
+        if kind == "normal":
+            values[1] *= factor
+    else:
+        values = [value * factor for value in values]
+    return kind + ":" + ",".join(str(round(value, 6)) for value in values)
+
+
+def run_worker(args):
+    # Child process: one generate_world run, timings written to args.worker_output
+    import main
+
+    start = time.perf_counter()
+    stages = {}
+    scene_ready = []
+
+    def on_event(event):
+        now = round(time.perf_counter() - start, 4)
+        if event["type"] == "progress":
+            if event["message"].startswith("Painting") and "first_image_requested" not in stages:
+                stages["first_image_requested"] = now
+            stage = STAGE_MESSAGES.get(event["message"])
+            if stage is not None:
+                stages[stage] = now
+        elif event["type"] == "scene_ready":
+            scene_ready.append(now)
+            main.publish_game_data(event["game_data"], event["ready_scenes"])
+        elif event["type"] == "done":
+            stages["done"] = now
+            stages["backends"] = event["stats"]["backends"]
+
+    asyncio.run(main.generate_world("A benchmark adventure.", on_event=on_event, num_scenes=args.scenes, prompt_mode=args.prompt_mode))
+    end_to_end = time.perf_counter() - start
+
+    backends = stages.pop("backends", {})
+    stages.pop("done", None)
+    if scene_ready:
+        stages["first_scene_ready"] = scene_ready[0]
+    with open(args.worker_output, "w") as f:
+        json.dump({"end_to_end": round(end_to_end, 4), "stages": stages, "scene_ready": scene_ready, "backends": backends}, f)
+
+
+def run_config(base_url, scenes, concurrency, prompt_mode):
+    env = dict(
+        os.environ,
+        OPENAI_BASE_URL=base_url + "/v1",
+        SD3_BASE_URL=base_url,
+        OPENAI_API_KEY="stub",
+        SD3_API_KEY="stub",
+        GEN_CACHE="0",
+        GEN_MAX_WORKERS=str(concurrency),
+        GEN_OPENAI_CONCURRENCY=str(concurrency),
+        GEN_SD3_CONCURRENCY=str(concurrency),
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        output = os.path.join(workdir, "result.json")
+        subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--scenes", str(scenes),
+             "--prompt-mode", prompt_mode, "--worker-output", output],
+            cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL,
+        )
+        with open(output) as f:
+            return json.load(f)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def summarize(runs):
+    # Median of each timing over the repeats of one configuration
+    summary = {"end_to_end": round(statistics.median(run["end_to_end"] for run in runs), 4)}
+    for stage in runs[0]["stages"]:
+        values = [run["stages"][stage] for run in runs if stage in run["stages"]]
+        summary[stage] = round(statistics.median(values), 4)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline end-to-end generation benchmark against the stub server")
+    parser.add_argument("--scenes", default="2,4,8", help="comma-separated world sizes")
+    parser.add_argument("--concurrency", default="2,8", help="comma-separated worker/backend concurrency settings")
+    parser.add_argument("--prompt-modes", default="outline,single")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier applied to the profile's latencies")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "generation.json"))
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--prompt-mode", default="outline", help=argparse.SUPPRESS)
+    parser.add_argument("--worker-output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        args.scenes = int(args.scenes)
+        run_worker(args)
+        return
+
+    from stub_server import StubState, start_stub_server
+
+    profile = PROFILES[args.profile]
+    latency = {name: scale_latency(profile[name], args.time_scale) for name in ("chat_latency", "vision_latency", "image_latency")}
+    state = StubState(stream_chunk_delay=profile["stream_chunk_delay"] * args.time_scale, **latency)
+    server, base_url = start_stub_server(state=state)
+
+    results = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "profile": args.profile,
+            "time_scale": args.time_scale,
+            "latency": dict(latency, stream_chunk_delay=state.stream_chunk_delay),
+            "repeat": args.repeat,
+        },
+        "configs": [],
+    }
+
+    print(f"{'scenes':>6} {'conc':>4} {'mode':>8} {'story':>8} {'1st scene':>9} {'total':>8}")
+    for scenes in [int(n) for n in args.scenes.split(",")]:
+        for concurrency in [int(n) for n in args.concurrency.split(",")]:
+            for prompt_mode in args.prompt_modes.split(","):
+                runs = [run_config(base_url, scenes, concurrency, prompt_mode) for _ in range(args.repeat)]
+                summary = summarize(runs)
+                results["configs"].append({
+                    "scenes": scenes,
+                    "concurrency": concurrency,
+                    "prompt_mode": prompt_mode,
+                    "median": summary,
+                    "runs": runs,
+                })
+                print(f"{scenes:>6} {concurrency:>4} {prompt_mode:>8} {summary.get('story_ready', 0):>7.2f}s "
+                      f"{summary.get('first_scene_ready', 0):>8.2f}s {summary['end_to_end']:>7.2f}s")
+
+    server.shutdown()
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_generation import git_commit
+from stub_server import StubState, make_jpeg, start_stub_server
+
+# Tail latency of the SD3 and vision calls with and without hedging, against the stub with a
+# fraction of requests made to stall (--slow-rate, --slow-seconds). Each mode warms the latency
+# history first, then times --calls calls per stage at --concurrency, and reports p50/p95/p99, the
+# hedge rate and how many vision calls ran past their budget and fell back to default coordinates.
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))]
+
+
+def time_calls(fn, count, concurrency):
+    def timed(i):
+        start = time.perf_counter()
+        try:
+            fn(i)
+            return time.perf_counter() - start, False
+        except TimeoutError:
+            return time.perf_counter() - start, True
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(timed, range(count)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hedged-request tail latency benchmark against the stub")
+    parser.add_argument("--calls", type=int, default=100, help="timed calls per stage and mode")
+    parser.add_argument("--warmup", type=int, default=20, help="calls that fill the latency history first")
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--slow-rate", type=float, default=0.05)
+    parser.add_argument("--slow-seconds", type=float, default=2.0)
+    parser.add_argument("--percentile", type=float, default=90)
+    parser.add_argument("--max-rate", type=float, default=0.15)
+    parser.add_argument("--vision-budget", type=float, default=1.5, help="seconds; 0 for none")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "hedging.json"))
+    args = parser.parse_args()
+
+    state = StubState(image_latency="lognormal:0.3,0.2", vision_latency="lognormal:0.2,0.2",
+                      slow_rate=args.slow_rate, slow_seconds=args.slow_seconds)
+    server, base_url = start_stub_server(state=state)
+    work_dir = tempfile.mkdtemp(prefix="bench_hedging-")
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+    os.environ["SD3_BASE_URL"] = base_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    os.environ["GEN_CACHE"] = "0"
+    os.environ["GEN_LATENCY_HISTORY"] = os.path.join(work_dir, "latency_history.json")
+
+    import hedging
+    import main
+
+    image_path = os.path.join(work_dir, "scene")
+    with open(image_path + ".jpeg", "wb") as f:
+        f.write(make_jpeg())
+    items = ["lamp", "desk", "cat"]
+    stages = {
+        "sd3": lambda i: main.call_sd3(f"benchmark scene {i}", output_filename=os.path.join(work_dir, f"out_{i % 8}")),
+        "vision": lambda i: main.get_item_coordinates_in_image(image_path, items + [f"thing_{i}"]),
+    }
+
+    results = {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(), **vars(args)}, "modes": {}}
+    print(f"{'mode':<8} {'stage':<7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8} {'hedged':>7} {'wins':>5} {'budget':>7}")
+    for mode in ("off", "on"):
+        results["modes"][mode] = {}
+        for stage, fn in stages.items():
+            budget = args.vision_budget if stage == "vision" else 0.0
+            hedging.hedgers[stage] = hedging.Hedger(stage, hedging.hedgers[stage].backend, budget=budget, enabled=mode == "on",
+                                                    hedge_percentile=args.percentile, max_rate=args.max_rate)
+            time_calls(fn, args.warmup, args.concurrency)
+            hedger = hedging.hedgers[stage]
+            hedger.calls = hedger.hedges = hedger.hedge_wins = hedger.timeouts = 0
+            samples = time_calls(fn, args.calls, args.concurrency)
+            latencies = [seconds * 1000 for seconds, _ in samples]
+            summary = {
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "max_ms": round(max(latencies), 1),
+                "mean_ms": round(statistics.mean(latencies), 1),
+                "over_budget": sum(1 for _, timed_out in samples if timed_out),
+                **{key: value for key, value in hedger.stats().items() if key in ("hedges", "hedge_rate", "hedge_wins")},
+            }
+            results["modes"][mode][stage] = summary
+            print(f"{mode:<8} {stage:<7} {summary['p50_ms']:>8.1f} {summary['p95_ms']:>8.1f} {summary['p99_ms']:>8.1f} "
+                  f"{summary['max_ms']:>8.1f} {summary['hedge_rate'] or 0:>7.1%} {summary['hedge_wins']:>5} {summary['over_budget']:>7}")
+
+    for stage in stages:
+        off, on = results["modes"]["off"][stage], results["modes"]["on"][stage]
+        print(f"{stage}: p99 {off['p99_ms']:.0f} -> {on['p99_ms']:.0f} ms with {on['hedge_rate'] or 0:.1%} of calls hedged")
+
+    server.shutdown()
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+import argparse
+import copy
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from puzzles import PuzzleEngine
+
+# Click-handling micro-benchmark: the original scan over puzzles_progress (as game.py did it)
+# versus PuzzleEngine.interact, on synthetic worlds with many puzzles.
+
+ACTIONS = ["talk", "use", "look", "pick up"]
+
+
+def make_puzzles(n_puzzles, n_items, reqs_per_puzzle, rng):
+    puzzles = {}
+    for p in range(n_puzzles):
+        requirements = [[rng.choice(ACTIONS), f"item_{rng.randrange(n_items)}"] for _ in range(reqs_per_puzzle)]
+        puzzles[f"puzzle_{p}"] = {
+            "completion_text": "Done!",
+            "requirements": requirements,
+            "result": {"unlocked_area": f"scene_{p}"},
+        }
+    return puzzles
+
+
+def legacy_click(puzzles, puzzles_progress, unlocked, current_action, item_name):
+    for puzzle_name in puzzles_progress.keys():
+        if len(puzzles_progress[puzzle_name]["requirements"]) == 0:
+            unlocked.add(puzzles[puzzle_name]["result"]["unlocked_area"])
+            del puzzles_progress[puzzle_name]
+            break
+        for requirement in puzzles_progress[puzzle_name]["requirements"]:
+            requirement_action_name, requirement_item_name = requirement
+            if (current_action, item_name) == (requirement_action_name, requirement_item_name):
+                puzzles_progress[puzzle_name]["requirements"] = [req for req in puzzles_progress[puzzle_name]["requirements"] if req != [current_action, item_name]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Puzzle click-handling micro-benchmark")
+    parser.add_argument("--clicks", type=int, default=5000)
+    parser.add_argument("--reqs", type=int, default=3, help="requirements per puzzle")
+    args = parser.parse_args()
+
+    for n_puzzles in (1, 10, 100, 500):
+        rng = random.Random(n_puzzles)
+        n_items = max(7, n_puzzles * 2)
+        puzzles = make_puzzles(n_puzzles, n_items, args.reqs, rng)
+        clicks = [(rng.choice(ACTIONS), f"item_{rng.randrange(n_items)}") for _ in range(args.clicks)]
+
+        legacy_progress = copy.deepcopy(puzzles)
+        legacy_unlocked = set()
+        start = time.perf_counter()
+        for action, item in clicks:
+            legacy_click(puzzles, legacy_progress, legacy_unlocked, action, item)
+        legacy_us = (time.perf_counter() - start) / len(clicks) * 1e6
+
+        engine = PuzzleEngine(puzzles)
+        start = time.perf_counter()
+        for action, item in clicks:
+            engine.interact(action, item)
+        engine_us = (time.perf_counter() - start) / len(clicks) * 1e6
+
+        print(f"{n_puzzles:4d} puzzles: legacy {legacy_us:8.2f} us/click  engine {engine_us:6.2f} us/click")
+
+
+if __name__ == "__main__":
+    main()
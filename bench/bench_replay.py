@@ -0,0 +1,133 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from bench_generation import git_commit
+from stub_server import start_stub_server
+
+# Record/replay benchmark (replay.py). Records one world against the stub, then times replayed
+# generations of it: in-process generate_world calls and full `main.py --replay replay` processes
+# (what a CI regression run pays). Also times a cassette lookup by fingerprint against the linear
+# scan the old vcrpy matchers did, re-normalizing every recorded body with regexes per request.
+
+
+def vcr_normalize(body):
+    # What match_text_only / multipart_body_matcher did to each body before comparing
+    body = re.sub(r"--[0-9a-f]{32}", "", body)
+    body = re.sub(r"\s+", " ", body)
+    body = re.sub(r'"image_url":\s*\{[^}]*\}', "", body)
+    return body.strip()
+
+
+def linear_lookup(interactions, body):
+    wanted = vcr_normalize(body)
+    for entry in interactions:
+        if vcr_normalize(entry["body"]) == wanted:
+            return entry
+    return None
+
+
+def time_lookups(cassette_dir, repeat):
+    import replay
+
+    with open(os.path.join(cassette_dir, "index.json")) as f:
+        index = json.load(f)["interactions"]
+    # The same interactions as vcrpy stored them: full request bodies, looked up in order
+    interactions = [{"body": json.dumps({"model": entry["model"], "messages": [{"role": "user", "content": entry["prompt"]}], **entry["params"]})}
+                    for entry in index.values()]
+    requests = [(entry["backend"], entry["model"], entry["prompt"], entry["params"]) for entry in index.values()]
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for stored in interactions:
+            assert linear_lookup(interactions, stored["body"]) is not None
+    linear = (time.perf_counter() - start) / (repeat * len(requests))
+
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for backend, model, prompt, params in requests:
+            assert replay.fingerprint(backend, model, prompt, **params) in index
+    indexed = (time.perf_counter() - start) / (repeat * len(requests))
+    return {"interactions": len(requests), "linear_us": round(linear * 1e6, 2), "indexed_us": round(indexed * 1e6, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record once against the stub, then time replayed generations")
+    parser.add_argument("--scenes", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=20, help="in-process replays")
+    parser.add_argument("--processes", type=int, default=5, help="full main.py --replay replay runs")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "replay.json"))
+    args = parser.parse_args()
+
+    stub, stub_url = start_stub_server()
+    work_dir = tempfile.mkdtemp(prefix="bench_replay-")
+    cassette_dir = os.path.join(work_dir, "cassette")
+    env = {
+        "OPENAI_BASE_URL": stub_url + "/v1",
+        "SD3_BASE_URL": stub_url,
+        "OPENAI_API_KEY": os.getenv("OPENAI_API_KEY", "stub"),
+        "GEN_CACHE": "0",
+        "GEN_POOL_SIZE": "0",
+        "GEN_LATENCY_HISTORY": os.path.join(work_dir, "latency_history.json"),
+    }
+    os.environ.update(env)
+
+    import main as pipeline
+    import replay
+
+    description = "a haunted library"
+    replay.use_cassette(cassette_dir, "record")
+    start = time.perf_counter()
+    asyncio.run(pipeline.generate_world(description, num_scenes=args.scenes, output_dir=work_dir))
+    record_seconds = time.perf_counter() - start
+    print(f"recorded {replay.cassette.stats()['recorded']} interactions in {record_seconds:.2f}s")
+
+    replay.use_cassette(cassette_dir, "replay")
+    in_process = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        asyncio.run(pipeline.generate_world(description, num_scenes=args.scenes, output_dir=work_dir))
+        in_process.append(time.perf_counter() - start)
+    stub.shutdown()
+
+    # Whole processes with the stub gone: a request that isn't in the cassette fails the run
+    processes = []
+    for _ in range(args.processes):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(REPO_DIR, "main.py"), "--desc", description, "--scenes", str(args.scenes),
+                        "--replay", "replay", "--cassette", cassette_dir],
+                       cwd=work_dir, env={**os.environ, **env}, check=True, stdout=subprocess.DEVNULL)
+        processes.append(time.perf_counter() - start)
+
+    lookups = time_lookups(cassette_dir, 200)
+    summary = {
+        "record_seconds": round(record_seconds, 3),
+        "replay_in_process_median": round(statistics.median(in_process), 4),
+        "replay_process_median": round(statistics.median(processes), 3),
+        "lookup": lookups,
+    }
+    print(f"replay in-process: median {summary['replay_in_process_median'] * 1000:.1f} ms over {args.repeat} runs")
+    print(f"replay main.py process: median {summary['replay_process_median']:.2f}s over {args.processes} runs (includes interpreter start)")
+    print(f"lookup over {lookups['interactions']} interactions: linear re-normalizing scan {lookups['linear_us']} us, fingerprint index {lookups['indexed_us']} us")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(), **vars(args)},
+                   "summary": summary, "in_process": in_process, "processes": processes}, f, indent=2)
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from bench_generation import git_commit
+
+# Time to the first frame when resuming a saved session (session.py) against starting cold. Plays
+# a scripted session through the fixture world, saves it as game.py does on quit, then in fresh
+# processes (window already open, as it is by the time the player chooses) times:
+#   cold    the world index, the start scene decoded from its JPEG and scaled, progress from scratch
+#   state   the saved session's progress, its scene decoded from the JPEG (snapshot without pixels)
+#   resume  the saved session with its pre-scaled backgrounds read back as raw pixels
+
+
+def first_frame(mode, directory):
+    # One measurement in this (fresh) process; prints a JSON line
+    import game
+    from assets import SceneAssets
+    from session import load_session
+    from world_store import World
+
+    os.chdir(directory)
+    pygame.init()
+    screen = pygame.display.set_mode((game.WINDOW_WIDTH, game.WINDOW_HEIGHT))
+    frames = []
+
+    start = time.perf_counter()
+    world = World.load()
+    scene_assets = SceneAssets()
+    session = None
+    if mode != "cold":
+        session, surfaces = load_session(world)
+        if mode == "resume":
+            for scene_name, surface in surfaces:
+                scene_assets.put(scene_name, surface)
+    loaded = time.perf_counter()
+    # One frame, then get_events() returns None and play() comes back
+    game.play(screen, world, input_source=game.ScriptedInput({"events": []}, tail_frames=0), session=session, scene_assets=scene_assets,
+              on_frame=lambda phases: frames.append(time.perf_counter()))
+    print(json.dumps({"load_ms": (loaded - start) * 1000, "first_frame_ms": (frames[0] - start) * 1000,
+                      "jpeg_decodes": scene_assets.misses, "scene": session.current_scene if session else world.start_scene}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Resume-from-snapshot vs cold start, time to first frame")
+    parser.add_argument("--game-data", default=os.path.join(BENCH_DIR, "fixtures", "world.json"))
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "resume.json"))
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "DIR"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        first_frame(*args.child)
+        return
+
+    import game
+    from assets import SceneAssets
+    from bench_game_loop import make_script, prepare_world
+    from session import SESSION_FILE, save_session
+    from world_store import World
+
+    pygame.init()
+    screen = pygame.display.set_mode((game.WINDOW_WIDTH, game.WINDOW_HEIGHT))
+    results = {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(), **vars(args)}, "modes": {}}
+    start_dir = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir:
+        game_data = prepare_world(args.game_data, work_dir)
+        os.chdir(work_dir)
+        try:
+            # Walk through the world once, solving its puzzles, and quit where the script ends
+            world = World.load()
+            scene_assets = SceneAssets()
+            session = game.play(screen, world, input_source=game.ScriptedInput(make_script(game_data, laps=1)), scene_assets=scene_assets)
+            save_session(session, world, scene_assets)
+            with open(SESSION_FILE) as f:
+                snapshot = json.load(f)
+            pixels_bytes = os.path.getsize(snapshot["pixels"]) if snapshot["pixels"] else 0
+            state_only = dict(snapshot, pixels=None, surfaces=[])
+            state_dir = os.path.join(work_dir, "state_only")
+        finally:
+            os.chdir(start_dir)
+        print(f"Session saved in {session.current_scene}: {os.path.getsize(os.path.join(work_dir, SESSION_FILE))} bytes of state, "
+              f"{len(snapshot['surfaces'])} backgrounds in {pixels_bytes / 1e6:.1f} MB of pixels")
+
+        # The same session without its pixels, next to the same world
+        os.makedirs(state_dir)
+        for name in os.listdir(work_dir):
+            if name.endswith((".json", ".jpeg", ".png")) and name != SESSION_FILE:
+                os.link(os.path.join(work_dir, name), os.path.join(state_dir, name))
+        with open(os.path.join(state_dir, SESSION_FILE), "w") as f:
+            json.dump(state_only, f)
+
+        print(f"{'mode':<8} {'load ms':>8} {'first frame ms':>15} {'JPEG decodes':>13}")
+        for mode, directory in (("cold", work_dir), ("state", state_dir), ("resume", work_dir)):
+            runs = []
+            for _ in range(args.repeat):
+                output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, directory],
+                                        check=True, capture_output=True, text=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            summary = {
+                "scene": runs[0]["scene"],
+                "load_ms": round(statistics.median(run["load_ms"] for run in runs), 2),
+                "first_frame_ms": round(statistics.median(run["first_frame_ms"] for run in runs), 2),
+                "jpeg_decodes": runs[0]["jpeg_decodes"],
+            }
+            results["modes"][mode] = summary
+            print(f"{mode:<8} {summary['load_ms']:>8.2f} {summary['first_frame_ms']:>15.2f} {summary['jpeg_decodes']:>13}")
+
+    cold, resume = results["modes"]["cold"], results["modes"]["resume"]
+    print(f"First frame: {cold['first_frame_ms']:.1f} ms cold -> {resume['first_frame_ms']:.1f} ms resumed")
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+from bench_generation import PROFILES, git_commit, scale_latency
+from stub_server import StubState, start_stub_server
+
+# Load test of the generation service (gen_service.py): a burst of players submit descriptions at
+# once against the stub backends, each polls its own job and downloads its world like game.py does.
+# Reports how long players queued, waited for their START_ scene and for the whole world, how
+# many submissions were pushed back with 429, and the service's job throughput.
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def play_client(client_factory, index, num_scenes, dest_dir, results):
+    client = client_factory()
+    start = time.perf_counter()
+    job_id = client.submit(f"Player {index}'s adventure in a haunted library, take {index}.", num_scenes, max_wait=600)
+    submitted = time.perf_counter()
+    first_scene = None
+    while True:
+        status = client.status(job_id)
+        if first_scene is None and any(scene.upper().startswith("START") for scene in status["ready_scenes"]):
+            first_scene = time.perf_counter()
+        if status["state"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    if status["state"] == "done":
+        os.makedirs(dest_dir, exist_ok=True)
+        for name in status["files"]:
+            client.fetch(job_id, name, dest_dir)
+    results.append({
+        "state": status["state"],
+        "retries": client.retries,
+        "submit": submitted - start,
+        "queued": status["queued_seconds"],
+        "first_scene": (first_scene or time.perf_counter()) - start,
+        "total": time.perf_counter() - start,
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the generation service against the stub backends")
+    parser.add_argument("--players", type=int, default=16, help="players submitting at once")
+    parser.add_argument("--scenes", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue", type=int, default=8)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="realistic")
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier applied to the profile's latencies")
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "service.json"))
+    args = parser.parse_args()
+
+    profile = PROFILES[args.profile]
+    latency = {name: scale_latency(profile[name], args.time_scale) for name in ("chat_latency", "vision_latency", "image_latency")}
+    stub, stub_url = start_stub_server(state=StubState(stream_chunk_delay=profile["stream_chunk_delay"] * args.time_scale, **latency))
+    os.environ["OPENAI_BASE_URL"] = stub_url + "/v1"
+    os.environ["SD3_BASE_URL"] = stub_url
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    # Every player's world is generated, not served from the cache
+    os.environ["GEN_CACHE"] = "0"
+    # Stub latencies stay out of the real latency history
+    work_dir = tempfile.mkdtemp(prefix="bench_service-")
+    os.environ["GEN_LATENCY_HISTORY"] = os.path.join(work_dir, "latency_history.json")
+    os.environ["GEN_CACHE_DIR"] = os.path.join(work_dir, "gen_cache")
+
+    from gen_service import GenerationService, ServiceClient, start_service
+
+    service = GenerationService(os.path.join(work_dir, "jobs"), workers=args.workers, max_queue=args.queue)
+    server, service_url = start_service(port=0, service=service)
+
+    results = []
+    start = time.perf_counter()
+    threads = [
+        threading.Thread(target=play_client, args=(lambda: ServiceClient(service_url), i, args.scenes, os.path.join(work_dir, f"player_{i}"), results))
+        for i in range(args.players)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    done = [result for result in results if result["state"] == "done"]
+    summary = {"players": args.players, "done": len(done), "retried_submissions": sum(1 for result in results if result["retries"]),
+               "jobs_per_minute": round(len(done) / elapsed * 60, 2), "service": service.stats()}
+    print(f"{len(done)}/{args.players} worlds in {elapsed:.2f}s ({summary['jobs_per_minute']} jobs/min), "
+          f"{args.workers} workers, queue {args.queue}, {summary['retried_submissions']} players pushed back with 429")
+    print(f"{'':<12} {'p50':>8} {'p90':>8} {'max':>8}")
+    for key in ("submit", "queued", "first_scene", "total"):
+        values = [result[key] for result in done]
+        if values:
+            summary[key] = {"p50": round(percentile(values, 0.5), 3), "p90": round(percentile(values, 0.9), 3), "max": round(max(values), 3)}
+            print(f"{key:<12} {summary[key]['p50']:>7.2f}s {summary[key]['p90']:>7.2f}s {summary[key]['max']:>7.2f}s")
+
+    service.stop()
+    server.shutdown()
+    stub.shutdown()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump({
+            "meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(),
+                     "profile": args.profile, "time_scale": args.time_scale, "latency": latency},
+            "summary": summary,
+            "runs": results,
+        }, f, indent=2)
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
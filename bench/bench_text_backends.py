@@ -0,0 +1,79 @@
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_server import StubState, start_stub_server
+
+# Text backend throughput: time to first token, total time and characters/s of a story prompt per
+# backend (GPT-4 through the OpenAI API, a local model through Ollama, the in-process stub). The
+# first Ollama call is reported separately because it includes loading the model; keep_alive keeps
+# it resident for the rest. By default the backends are the local stub server with emulated latency;
+# --live uses whatever OPENAI_BASE_URL / OLLAMA_BASE_URL / OLLAMA_MODEL point at.
+
+
+def time_call(call_text, prompt):
+    first = []
+    start = time.perf_counter()
+
+    def on_text(delta):
+        if not first:
+            first.append(time.perf_counter() - start)
+
+    content = call_text(prompt, on_text)
+    total = time.perf_counter() - start
+    return {"ttft": first[0] if first else total, "total": total, "chars": len(content)}
+
+
+def report(label, samples):
+    ttft = statistics.median(sample["ttft"] for sample in samples) * 1000
+    total = statistics.median(sample["total"] for sample in samples) * 1000
+    chars_per_second = statistics.median(sample["chars"] / sample["total"] for sample in samples)
+    print(f"{label:<16} {len(samples):>3} {ttft:>10.1f} {total:>10.1f} {chars_per_second:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare text backend latency and throughput")
+    parser.add_argument("-n", type=int, default=5, help="calls per backend")
+    parser.add_argument("--backends", default="openai,ollama,stub")
+    parser.add_argument("--scenes", type=int, default=2, help="size of the world the prompt asks for")
+    parser.add_argument("--live", action="store_true", help="use the configured endpoints instead of the stub")
+    parser.add_argument("--model-load", type=float, default=2.0, help="stub: seconds to load the Ollama model")
+    args = parser.parse_args()
+
+    # Every call has to reach the backend
+    os.environ["GEN_CACHE"] = "0"
+    # Bench latencies stay out of the real latency history
+    work_dir = tempfile.mkdtemp(prefix="bench_text_backends-")
+    os.environ["GEN_LATENCY_HISTORY"] = os.path.join(work_dir, "latency_history.json")
+    os.environ["GEN_CACHE_DIR"] = os.path.join(work_dir, "gen_cache")
+    server = None
+    if not args.live:
+        state = StubState(chat_latency="0.3", stream_chunk_chars=16, stream_chunk_delay=0.01, model_load_seconds=args.model_load)
+        server, base_url = start_stub_server(state=state)
+        os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+        os.environ["OLLAMA_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+
+    import main
+
+    prompt = main.generate_prompt_from_description("A haunted library where the books whisper secrets.", args.scenes)
+    print(f"{'backend':<16} {'n':>3} {'ttft ms':>10} {'total ms':>10} {'chars/s':>10}")
+    for name in args.backends.split(","):
+        call_text = main.get_text_backend(name)
+        samples = [time_call(call_text, prompt) for _ in range(args.n)]
+        if name == "ollama":
+            report("ollama (load)", samples[:1])
+            samples = samples[1:] or samples
+        report(name, samples)
+
+    if server is not None:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import argparse
+import base64
+import io
+import math
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame
+
+from stub_server import StubState, start_stub_server
+
+# Vision-call payload benchmark: the full-size base64 JPEG (the old get_base64_image path) versus
+# the downscaled copies from vision_image.py. Reports request bytes, estimated gpt-4o image
+# tokens, encode time, and round-trip latency against the stub with an emulated upload link.
+
+PROMPT = "where is the center of the following items? Items: librarian,globe,oak_door."
+
+
+def busy_scene_jpeg(width=1536, height=1024, seed=0):
+    # Something with as much detail as an SD3 render, so the JPEG is a realistic size (kept in
+    # bench/results/ so the same file can be passed back in with --image)
+    rng = random.Random(seed)
+    surface = pygame.Surface((width, height))
+    surface.fill((30, 30, 50))
+    for _ in range(6000):
+        color = (rng.randrange(256), rng.randrange(256), rng.randrange(256))
+        rect = pygame.Rect(rng.randrange(width), rng.randrange(height), rng.randrange(2, 40), rng.randrange(2, 40))
+        surface.fill(color, rect)
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "busy_scene.jpeg")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    pygame.image.save(surface, path)
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def image_tokens(width, height, detail="auto"):
+    # gpt-4o pricing: low = 85; otherwise fit in 2048x2048, shortest side to 768, 170 per 512px tile + 85
+    if detail == "low":
+        return 85
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 170 * math.ceil(width / 512) * math.ceil(height / 512) + 85
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vision-call payload size and latency: full image vs downscaled")
+    parser.add_argument("--image", help="scene JPEG to use (default: a generated detailed 1536x1024 image)")
+    parser.add_argument("--sides", default="1024,768,512", help="downscaled longest sides to compare")
+    parser.add_argument("--upload-mbps", type=float, default=20.0, help="emulated upload bandwidth")
+    parser.add_argument("-n", type=int, default=10, help="calls per variant")
+    args = parser.parse_args()
+
+    pygame.init()
+    if args.image:
+        with open(args.image, "rb") as f:
+            image_bytes = f.read()
+    else:
+        image_bytes = busy_scene_jpeg()
+
+    server, base_url = start_stub_server(state=StubState(upload_bytes_per_second=args.upload_mbps * 125000))
+    os.environ["OPENAI_BASE_URL"] = base_url + "/v1"
+    os.environ.setdefault("OPENAI_API_KEY", "stub")
+    # Stub latencies and cached stub replies stay out of the real latency history and cache
+    work_dir = tempfile.mkdtemp(prefix="bench_vision-")
+    os.environ["GEN_LATENCY_HISTORY"] = os.path.join(work_dir, "latency_history.json")
+    os.environ["GEN_CACHE_DIR"] = os.path.join(work_dir, "gen_cache")
+
+    import http_clients
+    from vision_image import VisionImageCache
+
+    client = http_clients.get_openai_client()
+    width, height = pygame.image.load(io.BytesIO(image_bytes), "scene.jpeg").get_size()
+
+    def original_url():
+        return "data:image/jpeg;base64," + base64.b64encode(image_bytes).decode("utf-8")
+
+    variants = [("original", original_url, (width, height))]
+    for side in [int(side) for side in args.sides.split(",")]:
+        cache = VisionImageCache(max_side=side)
+        scale = min(1.0, side / max(width, height))
+        variants.append((f"max side {side}", lambda cache=cache: cache.data_url(image_bytes),
+                         (round(width * scale), round(height * scale))))
+
+    print(f"source image {width}x{height}, {len(image_bytes) / 1024:.0f} KiB, upload {args.upload_mbps} Mbps")
+    print(f"{'variant':<14} {'request KiB':>11} {'tokens':>6} {'encode ms':>9} {'call p50 ms':>11} {'call mean ms':>12}")
+    for label, make_url, size in variants:
+        start = time.perf_counter()
+        make_url()
+        encode_ms = (time.perf_counter() - start) * 1000
+
+        samples = []
+        before = server.state.bytes_received
+        for _ in range(args.n):
+            start = time.perf_counter()
+            client.chat.completions.create(
+                model="gpt-4o",
+                messages=[{"role": "user", "content": [
+                    {"type": "text", "text": PROMPT},
+                    {"type": "image_url", "image_url": {"url": make_url()}},
+                ]}],
+            )
+            samples.append((time.perf_counter() - start) * 1000)
+        request_kib = (server.state.bytes_received - before) / args.n / 1024
+        print(f"{label:<14} {request_kib:>11.1f} {image_tokens(*size):>6} {encode_ms:>9.1f} "
+              f"{statistics.median(samples):>11.1f} {statistics.mean(samples):>12.1f}")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
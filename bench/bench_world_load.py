@@ -0,0 +1,144 @@
+import argparse
+import copy
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from bench_generation import git_commit
+from world_store import World, convert, find_start_scene
+
+# World loading: the whole game_data.json (what game.py did before world_store.py) against the
+# sharded index + per-scene shards, for worlds of several sizes built from the fixture's scenes.
+# Every measurement runs in a fresh process and reports the time to the first scene, the memory
+# held once it's loaded (Python heap via tracemalloc, and RSS) and the memory held after walking
+# through every scene, where the sharded loader only keeps its most recent shards.
+
+
+def make_world(fixture, num_scenes):
+    # num_scenes copies of the fixture's scenes, chained so each one's path items lead to the next
+    # and each unlocked by a puzzle in the scene before it
+    templates = list(fixture["scenes"].values())
+    names = ["START_Scene_0"] + [f"Scene_{i}" for i in range(1, num_scenes)]
+    scenes = {}
+    puzzles = {}
+    for i, name in enumerate(names):
+        scene = copy.deepcopy(templates[i % len(templates)])
+        scene["is_locked"] = i > 0
+        next_scene = names[(i + 1) % num_scenes]
+        for j, item in enumerate(scene["items"].values()):
+            if item.get("leads_to", "n/a") != "n/a":
+                item["leads_to"] = next_scene
+            item["coordinates"] = [0.1 + (j % 4) * 0.25, 0.3 + (j // 4) * 0.4]
+        scenes[name] = scene
+        if i + 1 < num_scenes:
+            first_item = next(iter(scene["items"]))
+            puzzles[f"puzzle_{i}"] = {"type": "item_usage", "hint": "Try it.", "completion_text": "Something opened.",
+                                      "requirements": [["use", first_item]], "result": {"unlocked_area": next_scene}}
+    return {"scenes": scenes, "puzzles": puzzles}
+
+
+def rss_bytes():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def child(mode, directory, trace):
+    # One measurement in this (fresh) process; prints a JSON line
+    if trace:
+        tracemalloc.start()
+    rss_start = rss_bytes()
+    start = time.perf_counter()
+    if mode == "legacy":
+        with open(os.path.join(directory, "game_data.json")) as f:
+            game_data = json.load(f)
+        scenes = game_data["scenes"]
+        first = scenes[find_start_scene(list(scenes))]
+
+        def visit(scene_name):
+            return scenes[scene_name]
+    else:
+        world = World.load(directory)
+        first = world.scene(world.start_scene)
+        visit = world.scene
+        scenes = world.scene_names
+    first_scene = time.perf_counter() - start
+    result = {"first_scene_ms": first_scene * 1000, "rss_first": rss_bytes() - rss_start}
+    if trace:
+        result["heap_first"] = tracemalloc.get_traced_memory()[0]
+    assert first["items"]
+    for scene_name in list(scenes):
+        visit(scene_name)
+    result["rss_walk"] = rss_bytes() - rss_start
+    if trace:
+        result["heap_walk"] = tracemalloc.get_traced_memory()[0]
+    print(json.dumps(result))
+
+
+def measure(mode, directory, trace):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, directory] + (["--trace"] if trace else []),
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Startup time and memory of the whole-JSON loader vs the sharded world")
+    parser.add_argument("--game-data", default=os.path.join(BENCH_DIR, "fixtures", "world.json"), help="world whose scenes are copied")
+    parser.add_argument("--scenes", default="8,64,512", help="comma-separated world sizes")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "results", "world_load.json"))
+    parser.add_argument("--child", nargs=2, metavar=("MODE", "DIR"), help=argparse.SUPPRESS)
+    parser.add_argument("--trace", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(*args.child, args.trace)
+        return
+
+    with open(args.game_data) as f:
+        fixture = json.load(f)
+    results = {"meta": {"timestamp": datetime.now().isoformat(timespec="seconds"), "commit": git_commit(), **vars(args)}, "sizes": {}}
+    print(f"{'scenes':>6} {'loader':<8} {'json KB':>8} {'first ms':>9} {'heap KB':>8} {'RSS KB':>8} {'walk heap KB':>13} {'walk RSS KB':>12}")
+    with tempfile.TemporaryDirectory() as work_dir:
+        for num_scenes in [int(size) for size in args.scenes.split(",")]:
+            directory = os.path.join(work_dir, str(num_scenes))
+            os.makedirs(directory)
+            game_data = make_world(fixture, num_scenes)
+            with open(os.path.join(directory, "game_data.json"), "w") as f:
+                json.dump(game_data, f, indent=2)
+            convert(game_data, directory)
+            sizes = {"legacy": os.path.getsize(os.path.join(directory, "game_data.json")),
+                     "sharded": os.path.getsize(os.path.join(directory, "world_index.json"))}
+
+            results["sizes"][num_scenes] = {}
+            for mode in ("legacy", "sharded"):
+                timed = [measure(mode, directory, trace=False) for _ in range(args.repeat)]
+                traced = measure(mode, directory, trace=True)
+                summary = {
+                    "read_bytes": sizes[mode],
+                    "first_scene_ms": round(statistics.median(run["first_scene_ms"] for run in timed), 3),
+                    "rss_first_kb": round(statistics.median(run["rss_first"] for run in timed) / 1024),
+                    "rss_walk_kb": round(statistics.median(run["rss_walk"] for run in timed) / 1024),
+                    "heap_first_kb": round(traced["heap_first"] / 1024),
+                    "heap_walk_kb": round(traced["heap_walk"] / 1024),
+                }
+                results["sizes"][num_scenes][mode] = summary
+                print(f"{num_scenes:>6} {mode:<8} {summary['read_bytes'] / 1024:>8.1f} {summary['first_scene_ms']:>9.2f} {summary['heap_first_kb']:>8} "
+                      f"{summary['rss_first_kb']:>8} {summary['heap_walk_kb']:>13} {summary['rss_walk_kb']:>12}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print("Results written to", args.output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,328 @@
+import argparse
+import io
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pygame
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from stub_backend import coordinates_reply, reply_text
+
+# Local stand-in for the OpenAI chat-completions, Ollama generate and Stability stable-image
+# endpoints, so the generation pipeline can be exercised (and timed) without API keys or network
+# access. Point main.py at it with OPENAI_BASE_URL=http://host:port/v1 SD3_BASE_URL=http://host:port
+# (and OLLAMA_BASE_URL=http://host:port for GEN_TEXT_BACKEND=ollama)
+
+def make_jpeg(width=1536, height=1024):
+    # Simple gradient so the scene has something to scale/decode
+    surface = pygame.Surface((width, height))
+    for y in range(0, height, 8):
+        shade = 40 + (y * 160) // height
+        surface.fill((shade // 2, shade // 3, shade), pygame.Rect(0, y, width, 8))
+    buf = io.BytesIO()
+    pygame.image.save(surface, buf, "scene.jpeg")
+    return buf.getvalue()
+
+
+def parse_keep_alive(value):
+    # Ollama keep_alive: seconds as a number, or a duration like "30s", "5m", "1h" (default 5m)
+    if value is None:
+        return 300.0
+    if isinstance(value, (int, float)):
+        return float(value)
+    units = {"s": 1, "m": 60, "h": 3600}
+    if value[-1:] in units:
+        return float(value[:-1]) * units[value[-1]]
+    return float(value)
+
+
+def parse_latency(spec):
+    # Latency distribution in seconds: "0.5" (fixed), "uniform:LOW,HIGH", "normal:MEAN,SD" or
+    # "lognormal:MEDIAN,SIGMA". Returns a function rng -> seconds.
+    if spec is None or spec == "":
+        return lambda rng: 0.0
+    kind, _, args = str(spec).partition(":")
+    if not args:
+        seconds = float(kind)
+        return lambda rng: seconds
+    values = [float(value) for value in args.split(",")]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1])
+    raise ValueError(f"unknown latency distribution {spec!r}")
+
+
+class StubState:
+    def __init__(self, world_json=None, image_bytes=None, stream_chunk_chars=16, stream_chunk_delay=0.0,
+                 error_rate=0.0, error_status=429, retry_after=None, seed=0,
+                 chat_latency=None, vision_latency=None, image_latency=None, upload_bytes_per_second=None,
+                 model_load_seconds=0.0, slow_rate=0.0, slow_seconds=0.0):
+        # world_json=None: the two-scene fixture, or a synthetic world when the prompt asks for more scenes
+        self.world_json = world_json
+        self.image_bytes = image_bytes if image_bytes is not None else make_jpeg()
+        # Streamed completions are sent stream_chunk_chars at a time, stream_chunk_delay seconds apart;
+        # non-streamed ones take as long as the stream would have
+        self.stream_chunk_chars = stream_chunk_chars
+        self.stream_chunk_delay = stream_chunk_delay
+        # Fraction of requests answered with error_status (and Retry-After, if set) instead
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        # Time before the reply (or the first streamed chunk) per endpoint; see parse_latency
+        self.latency = {
+            "chat": parse_latency(chat_latency),
+            "vision": parse_latency(vision_latency),
+            "image": parse_latency(image_latency),
+        }
+        # Fraction of requests that stall for an extra slow_seconds (a tail-latency straggler)
+        self.slow_rate = slow_rate
+        self.slow_seconds = slow_seconds
+        self.slow_requests = 0
+        # Emulated client upload bandwidth: request bodies cost len(body) / upload_bytes_per_second
+        self.upload_bytes_per_second = upload_bytes_per_second
+        # Ollama: time to load a model that isn't resident; it stays loaded for the request's keep_alive
+        self.model_load_seconds = model_load_seconds
+        self.models_loaded_until = {}
+        self.model_loads = 0
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self.endpoint_requests = {"chat": 0, "vision": 0, "image": 0}
+
+    def load_model(self, model, keep_alive):
+        # Seconds spent loading the model for this request (0 if it's still resident)
+        with self.lock:
+            now = time.monotonic()
+            load_seconds = 0.0
+            if self.models_loaded_until.get(model, 0) < now:
+                load_seconds = self.model_load_seconds
+                self.model_loads += 1
+            self.models_loaded_until[model] = now + load_seconds + parse_keep_alive(keep_alive)
+        if load_seconds:
+            time.sleep(load_seconds)
+        return load_seconds
+
+    def should_fail(self):
+        with self.lock:
+            if self.error_rate and self.rng.random() < self.error_rate:
+                self.errors += 1
+                return True
+            return False
+
+    def wait(self, endpoint):
+        with self.lock:
+            self.endpoint_requests[endpoint] += 1
+            delay = self.latency[endpoint](self.rng)
+            if self.slow_rate and self.rng.random() < self.slow_rate:
+                self.slow_requests += 1
+                delay += self.slow_seconds
+        if delay:
+            time.sleep(delay)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; without this keep-alive requests stall ~40ms
+    # on Nagle + delayed ACK and the stub would dominate every measurement
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        with self.server.state.lock:
+            self.server.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        state = self.server.state
+        with state.lock:
+            state.requests += 1
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with state.lock:
+            state.bytes_received += len(body)
+        if state.upload_bytes_per_second:
+            time.sleep(len(body) / state.upload_bytes_per_second)
+
+        if state.should_fail():
+            self.send_error_response(state.error_status, state.retry_after)
+        elif self.path.endswith("/chat/completions"):
+            request = json.loads(body)
+            state.wait("vision" if isinstance(request["messages"][-1]["content"], list) else "chat")
+            if request.get("stream"):
+                self.stream_chat_completion(request)
+            else:
+                reply = self.chat_completion(request)
+                if state.stream_chunk_delay:
+                    # Same output rate as a streamed reply, all of it waited out before responding
+                    chunks = math.ceil(len(reply["choices"][0]["message"]["content"]) / state.stream_chunk_chars)
+                    time.sleep(chunks * state.stream_chunk_delay)
+                self.send_json(200, reply)
+        elif self.path.endswith("/api/generate"):
+            request = json.loads(body)
+            load_seconds = state.load_model(request.get("model", "stub"), request.get("keep_alive"))
+            state.wait("chat")
+            self.ollama_generate(request, load_seconds)
+        elif self.path.endswith("/stable-image/generate/ultra"):
+            state.wait("image")
+            self.send_bytes(200, state.image_bytes, "image/jpeg")
+        else:
+            self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def reply_text(self, request):
+        content = request["messages"][-1]["content"]
+        if isinstance(content, list):
+            # Vision call: answer with coordinates for whatever items were asked about
+            return coordinates_reply(" ".join(part.get("text", "") for part in content if part.get("type") == "text"))
+        return reply_text(content, self.server.state.world_json)
+
+    def chat_completion(self, request):
+        reply = self.reply_text(request)
+        return {
+            "id": "chatcmpl-stub",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": reply},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }
+
+    def stream_chat_completion(self, request):
+        # Server-sent events, one chat.completion.chunk per slice of the reply, chunked encoding
+        state = self.server.state
+        reply = self.reply_text(request)
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": "chatcmpl-stub",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "stub"),
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        events = [chunk({"role": "assistant", "content": ""})]
+        for i in range(0, len(reply), state.stream_chunk_chars):
+            events.append(chunk({"content": reply[i:i + state.stream_chunk_chars]}))
+        events.append(chunk({}, "stop"))
+
+        for event in events:
+            self.write_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            if state.stream_chunk_delay:
+                time.sleep(state.stream_chunk_delay)
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    def ollama_generate(self, request, load_seconds):
+        # Newline-delimited JSON, one object per slice of the reply and a final one with timings
+        state = self.server.state
+        reply = reply_text(request["prompt"], state.world_json)
+        chunks = [reply[i:i + state.stream_chunk_chars] for i in range(0, len(reply), state.stream_chunk_chars)]
+        done = {
+            "model": request.get("model", "stub"),
+            "response": "",
+            "done": True,
+            "load_duration": int(load_seconds * 1e9),
+            "eval_count": len(chunks),
+            "eval_duration": int(len(chunks) * state.stream_chunk_delay * 1e9),
+        }
+        if not request.get("stream", True):
+            time.sleep(len(chunks) * state.stream_chunk_delay)
+            self.send_json(200, {**done, "response": reply})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        for chunk in chunks:
+            self.write_chunk((json.dumps({"model": done["model"], "response": chunk, "done": False}) + "\n").encode("utf-8"))
+            if state.stream_chunk_delay:
+                time.sleep(state.stream_chunk_delay)
+        self.write_chunk((json.dumps(done) + "\n").encode("utf-8"))
+        self.write_chunk(b"")
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+
+    def send_error_response(self, status, retry_after=None):
+        data = json.dumps({"error": {"message": f"stub injected {status}", "type": "stub_error", "code": status}}).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        if retry_after is not None:
+            self.send_header("Retry-After", str(retry_after))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, payload):
+        self.send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json")
+
+    def send_bytes(self, status, data, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_stub_server(host="127.0.0.1", port=0, state=None, handler=StubHandler):
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.state = state if state is not None else StubState()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stub for the OpenAI and Stability endpoints")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--stream-chunk-chars", type=int, default=16)
+    parser.add_argument("--stream-chunk-delay", type=float, default=0.0, help="seconds between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests to fail")
+    parser.add_argument("--error-status", type=int, default=429)
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds on injected errors")
+    parser.add_argument("--chat-latency", default=None, help="e.g. 0.8, uniform:0.5,1.5, lognormal:1.0,0.4")
+    parser.add_argument("--vision-latency", default=None)
+    parser.add_argument("--image-latency", default=None)
+    parser.add_argument("--upload-mbps", type=float, default=None, help="emulated client upload bandwidth")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="fraction of requests that stall for --slow-seconds")
+    parser.add_argument("--slow-seconds", type=float, default=0.0)
+    parser.add_argument("--model-load", type=float, default=0.0, help="Ollama: seconds to load a model that isn't resident")
+    args = parser.parse_args()
+
+    state = StubState(stream_chunk_chars=args.stream_chunk_chars, stream_chunk_delay=args.stream_chunk_delay,
+                      error_rate=args.error_rate, error_status=args.error_status, retry_after=args.retry_after,
+                      chat_latency=args.chat_latency, vision_latency=args.vision_latency, image_latency=args.image_latency,
+                      upload_bytes_per_second=args.upload_mbps * 125000 if args.upload_mbps else None,
+                      model_load_seconds=args.model_load, slow_rate=args.slow_rate, slow_seconds=args.slow_seconds)
+    server, base_url = start_stub_server(args.host, args.port, state)
+    print(f"Stub listening on {base_url}")
+    print(f"  OPENAI_BASE_URL={base_url}/v1 SD3_BASE_URL={base_url} OLLAMA_BASE_URL={base_url}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,184 @@
+import hashlib
+import os
+import re
+import tempfile
+import threading
+
+# On-disk, content-addressed cache for generation calls (GPT-4 text, GPT-4o vision, SD3 images).
+# Entries are keyed by a hash of the model, the normalized prompt, any image bytes and the
+# backend's endpoint (so a run against the local stub never fills the cache for the real API),
+# written atomically so concurrent process_scene threads never see half-written files, and
+# evicted least-recently-used first once the directory grows past max_bytes. The directory's size is
+# counted once and then kept as a running total, so only a put that takes it over the limit
+# walks the tree; eviction goes down to EVICT_TO of the limit so the next few puts don't.
+
+CACHE_DIR = os.getenv("GEN_CACHE_DIR", ".gen_cache")
+CACHE_MAX_MB = int(os.getenv("GEN_CACHE_MAX_MB", "512"))
+CACHE_ENABLED = os.getenv("GEN_CACHE", "1") != "0"
+# Eviction stops once the cache is down to this fraction of max_bytes
+EVICT_TO = 0.9
+
+
+def normalize_prompt(prompt):
+    # Whitespace differences (indentation in the prompt template, trailing newlines from stdin)
+    # shouldn't cause a cache miss
+    return re.sub(r"\s+", " ", prompt).strip()
+
+
+def make_key(model, prompt, image_bytes=None, **params):
+    h = hashlib.sha256()
+    h.update(model.encode("utf-8"))
+    h.update(b"\0")
+    h.update(normalize_prompt(prompt).encode("utf-8"))
+    h.update(b"\0")
+    if image_bytes is not None:
+        h.update(hashlib.sha256(image_bytes).digest())
+    for name in sorted(params):
+        h.update(f"\0{name}={params[name]}".encode("utf-8"))
+    return h.hexdigest()
+
+
+class DiskCache:
+    def __init__(self, directory=CACHE_DIR, max_bytes=CACHE_MAX_MB * 1024 * 1024, enabled=CACHE_ENABLED):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # key -> _Flight for requests currently being computed (single-flight)
+        self._in_flight = {}
+        # Bytes on disk as of the last walk plus what's been put since; None until first needed.
+        # Other processes sharing the directory make it drift, which the next eviction corrects.
+        self._size = None
+        self.walks = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        # Bump mtime so eviction treats this entry as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def put(self, key, data):
+        if not self.enabled:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file in the same directory, then rename over the target (atomic on POSIX/NTFS)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            try:
+                replaced = os.path.getsize(path)
+            except OSError:
+                replaced = 0
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        with self._lock:
+            if self._size is None:
+                self._size = self._entries()[1]
+            else:
+                self._size += len(data) - replaced
+            over = self._size > self.max_bytes
+        if over:
+            self.evict()
+
+    def _entries(self):
+        # [(mtime, size, path)] of every entry, and their total size
+        self.walks += 1
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.startswith(".tmp-"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        return entries, total
+
+    def evict(self):
+        if not os.path.isdir(self.directory):
+            return
+        entries, total = self._entries()
+        if total > self.max_bytes:
+            # Oldest access first
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._size = total
+
+    def get_or_compute(self, key, compute):
+        # Returns the cached bytes for key, or runs compute() once (even if several threads
+        # ask for the same key at the same time) and stores its bytes result.
+        data = self.get(key)
+        if data is not None:
+            with self._lock:
+                self.hits += 1
+            return data
+
+        with self._lock:
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self._in_flight[key] = flight
+                self.misses += 1
+            else:
+                self.hits += 1
+
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        try:
+            flight.value = compute()
+            self.put(key, flight.value)
+            return flight.value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.event.set()
+
+
+class _Flight:
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+generation_cache = DiskCache()
@@ -1,21 +1,61 @@
 import os
 import sys
 import json
-import subprocess
+import asyncio
+import queue
+import threading
 import time
 import pygame
 from enum import Enum
 
+from assets import SceneAssets
+from atlas import ATLAS_IMAGE, ATLAS_INDEX, ICON_SIZE, ItemAtlas
+from hit_index import ItemHitIndex, build_item_rects
+from puzzles import PuzzleEngine
+from render import DirtyRenderer, Sprites, TextCache, load_cursors
+from session import SessionState, clear_session, load_session, read_snapshot, save_session
+from main import generate_world, publish_game_data
+from gen_service import SERVICE_URL, ServiceClient
+from world_pool import POOL_SIZE, WorldPool, spawn_refill
+from world_store import WORLD_INDEX, World, shard_file, write_json
+
 DEBUG_GAMEPLAY = False
 # DEBUG_GAMEPLAY = True
 
 DEBUG_ITEMS = False
 # DEBUG_ITEMS = True
 
+# Hit the ellipse inside each item's square instead of the whole square
+ROUND_ITEM_REGIONS = False
+
+# Redraw the whole screen every frame instead of only the regions that changed
+FULL_REDRAW = False
+# FULL_REDRAW = True
+
+ACTIVE_FPS = 60
+# Frame rate once there's been no input for IDLE_AFTER_MS
+IDLE_FPS = 10
+IDLE_AFTER_MS = 1000
+
+# Print how long each scene transition frame took
+DEBUG_FRAME_TIMES = False
+# DEBUG_FRAME_TIMES = True
+
+# Save the session's input as a replay script (see bench/bench_game_loop.py)
+RECORD_INPUT = None
+# RECORD_INPUT = "input_script.json"
+
 WINDOW_WIDTH, WINDOW_HEIGHT = 1000, 800
 RGB_PINK = (255, 105, 180)
 INTERACTION_TEXT_POS = (WINDOW_WIDTH//2, 25)
 
+ACTIONS = ["talk", "use", "look", "pick up"]
+PADDING = 20
+BUTTON_Y = WINDOW_HEIGHT - 80
+ITEM_SIZE = 140
+# Picked-up items shown in the bottom-right corner, most recent last
+INVENTORY_SLOTS = 4
+
 data_file = "game_data.json"
 
 def get_user_text(screen, font, prompt_text, width, height):
@@ -46,261 +86,547 @@ def get_user_text(screen, font, prompt_text, width, height):
         clock.tick(30)
     return input_text
 
-# Initialize game
-pygame.init()
-screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
-pygame.display.set_caption("Point-and-Click Adventure")
-clock = pygame.time.Clock()
-
-# Load fonts
-action_button_font = pygame.font.SysFont("None", 68)
-interaction_text_font = pygame.font.SysFont(None, 48)
-font = pygame.font.SysFont(None, 48)
-
-if not DEBUG_GAMEPLAY:
-    # Remove old game data
-    if os.path.exists("game_data.json"):
-        os.remove("game_data.json")
-
-    # description = input("Enter a description for your point-and-click adventure: ")
-    description = get_user_text(screen, font, "Describe your point-and-click adventure:", WINDOW_WIDTH, WINDOW_HEIGHT)
-    # Run main.py and pass description via stdin
-    subprocess.run([sys.executable, "main.py"], input=description + "\n", text=True)
-
-    # Wait for game_data.json to appear
-    while not os.path.exists(data_file):
-        time.sleep(0.1)
-
-# Load game data
-with open(data_file, 'r') as f:
-    game_data = json.load(f)
-
-# Ensure requirements is a list of lists (e.g. [['use', 'door']] instead of ['use', 'door'])
-for puzzle_name in game_data["puzzles"].keys():
-    if type(game_data["puzzles"][puzzle_name]["requirements"][0]) == str:
-        game_data["puzzles"][puzzle_name]["requirements"] = [game_data["puzzles"][puzzle_name]["requirements"]]
-
-# Load puzzles
-puzzles = game_data.get("puzzles", {})
-
-# Remaining requirements for each puzzle
-puzzles_progress = puzzles
-
-
-# Load first scene
-scenes = game_data.get("scenes", {})
-
-current_scene = list(scenes.keys())[0]
-for scene in scenes.keys():
-    if "START" in scene.upper():
-        current_scene = scene
-
-scene_info = scenes[current_scene]
-scene_image_file = "scene_" + current_scene + ".jpeg" # TODO: Hardcoded for now
-
-background = pygame.image.load(scene_image_file).convert()
-background = pygame.transform.scale(background, (900, 600))
-background_rect = background.get_rect()
-background_rect.midtop = (WINDOW_WIDTH//2, 40)
-
-# Load cursor
-cursor_img = pygame.image.load("ms_cursor.png").convert_alpha()
-cursor_img = pygame.transform.scale(cursor_img, (40, 40))
-pygame.mouse.set_visible(False)
-
-# Load text, buttons
-interaction_text = interaction_text_font.render("", False, RGB_PINK)
-interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
+def layout_action_buttons(text_cache, action_button_font):
+    # {action: (surface, rect)} along the bottom of the window, and the x where the row ends
+    action_rects = {}
+    x_offset = PADDING
+    for act in ACTIONS:
+        surf = text_cache.render(action_button_font, act.title(), False, (255, 255, 255))
+        rect = surf.get_rect(topleft=(x_offset, BUTTON_Y))
+        action_rects[act] = (surf, rect)
+        x_offset += rect.width + PADDING
+    return action_rects, x_offset
+
+def is_start_scene(scene_name):
+    return "START" in scene_name.upper()
+
+def run_generation(description, events, pool=None):
+    # Worker thread: run the async generator in-process, forwarding its events to the main loop.
+    # pool: the WorldPool that had no match for description; the finished world is added to it.
+    def on_event(event):
+        if event["type"] == "done":
+            # Keep game_data.json around for DEBUG_GAMEPLAY runs
+            publish_game_data(event["game_data"], event["game_data"]["scenes"].keys())
+            if pool is not None:
+                try:
+                    pool.add(description, event["game_data"])
+                except Exception as e:
+                    print("Couldn't add the world to the pool:", e)
+        events.put(event)
+
+    try:
+        asyncio.run(generate_world(description, on_event=on_event))
+    except Exception as e:
+        events.put({"type": "error", "message": str(e)})
+
+def run_service_generation(description, events, base_url=SERVICE_URL):
+    # Worker thread: have the generation service build the world, downloading each scene's shard and
+    # image as it's published and forwarding the same events run_generation would
+    try:
+        client = ServiceClient(base_url)
+        job_id = client.submit(description)
+        ready_scenes = []
+        message = None
+        while True:
+            status = client.status(job_id)
+            if status["message"] != message:
+                message = status["message"]
+                if status["state"] == "queued" and status["position"]:
+                    message = f"{message} ({status['position']} ahead of you)"
+                events.put({"type": "progress", "message": message})
+            new_scenes = []
+            if len(status["ready_scenes"]) > len(ready_scenes):
+                # The world index says which scenes are ready; their files are fetched before the
+                # index is written here, so the game never sees a scene it can't load
+                index = json.loads(client.read(job_id, WORLD_INDEX))
+                new_scenes = [scene for scene in index["ready_scenes"] if scene not in ready_scenes]
+                for scene_name in new_scenes:
+                    client.fetch(job_id, "scene_" + scene_name + ".jpeg")
+                    client.fetch(job_id, shard_file(scene_name))
+                if ATLAS_INDEX in status["files"]:
+                    # Image before index, same order they're written in
+                    client.fetch(job_id, ATLAS_IMAGE)
+                    client.fetch(job_id, ATLAS_INDEX)
+                write_json(WORLD_INDEX, index)
+                for scene_name in new_scenes:
+                    ready_scenes.append(scene_name)
+                    events.put({"type": "scene_ready", "scene_name": scene_name, "ready_scenes": list(ready_scenes)})
+            if status["state"] == "failed":
+                events.put({"type": "error", "message": status["error"]})
+                return
+            if status["state"] == "done" and not new_scenes:
+                events.put({"type": "done"})
+                return
+            time.sleep(0.25)
+    except Exception as e:
+        events.put({"type": "error", "message": str(e)})
+
+def wait_for_start_scene(screen, font, events):
+    # Keep the window alive (and show progress) while the START_ scene is generated, then open the
+    # world the generator is writing to the current directory
+    message = "Generating your adventure..."
+    while True:
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                pygame.quit()
+                sys.exit()
 
-# Load hover text
-hover_text = font.render("", False, (255, 255, 255))
-hover_text_rect = hover_text.get_rect(bottomright=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2 + 500))
+        try:
+            gen_event = events.get(timeout=0.05)
+        except queue.Empty:
+            gen_event = None
 
-actions = ["talk", "use", "look", "pick up"]
-action_rects = {}
-PADDING = 20
-btn_y = WINDOW_HEIGHT - 80
-x_offset = PADDING
-for act in actions:
-    surf = action_button_font.render(act.title(), False, (255, 255, 255))
-    rect = surf.get_rect(topleft=(x_offset, btn_y))
-    action_rects[act] = (surf, rect)
-    x_offset += rect.width + PADDING
+        if gen_event is not None:
+            if gen_event["type"] == "progress":
+                message = gen_event["message"]
+            elif gen_event["type"] == "error":
+                print("ERROR: generation failed:", gen_event["message"])
+                pygame.quit()
+                sys.exit(1)
+            elif gen_event["type"] == "scene_ready" and any(is_start_scene(scene) for scene in gen_event["ready_scenes"]):
+                return World.load()
 
-current_action = None
+        screen.fill((0, 0, 0))
+        loading_surface = font.render(message, True, (255, 255, 255))
+        screen.blit(loading_surface, loading_surface.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2)))
+        pygame.display.flip()
 
-hint_surf = font.render("Hint", False, (255, 255, 255))
-hint_button_rect = hint_surf.get_rect(topleft=(x_offset, btn_y))
+def apply_generation_events(events, world):
+    # Pick up the scenes the generator has finished since the last frame (their shards are loaded
+    # when they're entered); returns the new ones
+    refresh = False
+    while True:
+        try:
+            gen_event = events.get_nowait()
+        except queue.Empty:
+            break
+        if gen_event["type"] == "error":
+            print("ERROR: generation failed:", gen_event["message"])
+        if gen_event["type"] == "scene_ready" and gen_event["scene_name"] not in world.ready_scenes:
+            refresh = True
+    return world.refresh() if refresh else []
+
+def main():
+    # Initialize game
+    pygame.init()
+    screen = pygame.display.set_mode((WINDOW_WIDTH, WINDOW_HEIGHT))
+    pygame.display.set_caption("Point-and-Click Adventure")
+
+    font = pygame.font.SysFont(None, 48)
+
+    session = None
+    scene_assets = SceneAssets()
+    if not DEBUG_GAMEPLAY:
+        # The last world can be picked up where it was left, once it's finished generating
+        world = World.load()
+        resumable = world is not None and world.index.get("generation_complete") and read_snapshot(world) is not None
+        prompt = "Describe a new adventure, or press Enter to continue:" if resumable else "Describe your point-and-click adventure:"
+
+        # description = input("Enter a description for your point-and-click adventure: ")
+        description = get_user_text(screen, font, prompt, WINDOW_WIDTH, WINDOW_HEIGHT)
+
+        if resumable and not description.strip():
+            # Saved state plus backgrounds already scaled to the screen: nothing to generate or decode
+            session, surfaces = load_session(world) or (None, [])
+            for scene_name, surface in surfaces:
+                scene_assets.put(scene_name, surface)
+            generation_events = None
+        else:
+            # Remove old game data
+            for old_file in ("game_data.json", WORLD_INDEX, ATLAS_INDEX, ATLAS_IMAGE):
+                if os.path.exists(old_file):
+                    os.remove(old_file)
+            clear_session()
+
+            # A matching pre-generated world starts instantly; either way the pool gets topped up
+            world = None
+            pool = None
+            if POOL_SIZE > 0:
+                pool = WorldPool()
+                game_data = pool.claim(description)
+                spawn_refill()
+                if game_data is not None:
+                    # Worlds pooled before the sharded format only have game_data.json
+                    world = World.load() or World.from_game_data(game_data)
+
+            if world is not None:
+                generation_events = None
+            else:
+                # Generate the world on a worker thread so the window stays responsive
+                generation_events = queue.Queue()
+                if SERVICE_URL:
+                    generate, extra = run_service_generation, {}
+                else:
+                    generate, extra = run_generation, {"pool": pool}
+                threading.Thread(target=generate, args=(description, generation_events), kwargs=extra, daemon=True).start()
+
+                # Start playing as soon as the START_ scene is ready
+                world = wait_for_start_scene(screen, font, generation_events)
+    else:
+        generation_events = None
+        # Load the last world: the index and its start scene; older worlds only have game_data.json
+        world = World.load()
+        if world is None:
+            with open(data_file, 'r') as f:
+                world = World.from_game_data(json.load(f))
+
+    input_source = RecordingInput() if RECORD_INPUT else LiveInput()
+    session = play(screen, world, generation_events, input_source, session=session, scene_assets=scene_assets)
+    try:
+        save_session(session, world, scene_assets)
+    except OSError as e:
+        print("Couldn't save the session:", e)
+    if RECORD_INPUT:
+        input_source.save(RECORD_INPUT)
+        print("Input script written to", RECORD_INPUT)
+    pygame.quit()
+
+class LiveInput:
+    # Where play() gets its input: the real event queue and mouse. bench/bench_game_loop.py
+    # swaps in a scripted replay with the same two methods.
+    realtime = True
+
+    def get_events(self):
+        return pygame.event.get()
+
+    def mouse_pos(self):
+        return pygame.mouse.get_pos()
+
+# Input events that matter to the game loop, as stored in replay scripts:
+# {"frame": n, "type": "click" | "move" | "key" | "quit", "pos": [x, y], "button": 1, "key": k, "unicode": "a"}
+SCRIPT_EVENT_TYPES = {
+    pygame.MOUSEBUTTONDOWN: "click",
+    pygame.MOUSEMOTION: "move",
+    pygame.KEYDOWN: "key",
+    pygame.QUIT: "quit",
+}
+
+class RecordingInput(LiveInput):
+    def __init__(self):
+        self.frame = 0
+        self.script = []
+
+    def get_events(self):
+        events = pygame.event.get()
+        for event in events:
+            kind = SCRIPT_EVENT_TYPES.get(event.type)
+            if kind is None:
+                continue
+            entry = {"frame": self.frame, "type": kind}
+            if hasattr(event, "pos"):
+                entry["pos"] = list(event.pos)
+            if kind == "click":
+                entry["button"] = event.button
+            elif kind == "key":
+                entry["key"] = event.key
+                entry["unicode"] = event.unicode
+            self.script.append(entry)
+        self.frame += 1
+        return events
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"events": self.script}, f, indent=1)
+
+class ScriptedInput:
+    # Replays a recorded script frame by frame, as fast as the loop can go. The mouse position
+    # follows the script's pos fields; get_events returns None once the script (plus tail_frames
+    # of idle frames to let the last clicks settle) is done.
+    realtime = False
+
+    def __init__(self, script, tail_frames=30):
+        self.frames = {}
+        for entry in script["events"]:
+            self.frames.setdefault(entry["frame"], []).append(entry)
+        self.last_frame = max(self.frames, default=0) + tail_frames
+        self.frame = 0
+        self.pos = (0, 0)
+
+    def get_events(self):
+        if self.frame > self.last_frame:
+            return None
+        # Keep the (dummy) display's own queue drained; only scripted events reach the game
+        pygame.event.get()
+        events = []
+        for entry in self.frames.get(self.frame, ()):
+            if "pos" in entry:
+                self.pos = tuple(entry["pos"])
+            if entry["type"] == "click":
+                events.append(pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=self.pos, button=entry.get("button", 1)))
+            elif entry["type"] == "move":
+                events.append(pygame.event.Event(pygame.MOUSEMOTION, pos=self.pos, rel=(0, 0), buttons=(0, 0, 0)))
+            elif entry["type"] == "key":
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=entry["key"], unicode=entry.get("unicode", "")))
+            elif entry["type"] == "quit":
+                events.append(pygame.event.Event(pygame.QUIT))
+        self.frame += 1
+        return events
+
+    def mouse_pos(self):
+        return self.pos
+
+def play(screen, world, generation_events=None, input_source=None, on_frame=None, session=None, scene_assets=None):
+    # The game loop over a world_store.World. Runs until QUIT (or until input_source.get_events()
+    # returns None), then returns the SessionState to save. session (a SessionState) resumes a
+    # saved one; scene_assets can come in already holding its backgrounds.
+    # on_frame, if given, is called after every frame with the seconds spent in each phase:
+    # {"events", "text", "blit", "flip", "frame"} (text = font rasterizing on TextCache misses).
+    if input_source is None:
+        input_source = LiveInput()
+    clock = pygame.time.Clock()
 
-# Prepare item rects
-ITEM_SIZE = 140
-item_rects = {}
-for name, info in scene_info.get("items", {}).items():
-    coords = info.get("coordinates", [0.5, 0.5])
-    x = int(coords[0] * background.get_width())
-    y = int(coords[1] * background.get_height())
-    rect = pygame.Rect(0, 0, ITEM_SIZE, ITEM_SIZE)
-    rect.center = (x, y)
-    item_rects[name] = rect
-
-# Main loop
-running = True
-while running:
-    for event in pygame.event.get():
-        cursor_img = pygame.image.load("ms_cursor.png").convert_alpha()
-        cursor_img = pygame.transform.scale(cursor_img, (50, 50))
-
-        mx, my = pygame.mouse.get_pos()
-        if event.type == pygame.QUIT:
-            running = False
-        elif event.type == pygame.MOUSEBUTTONDOWN:
-            # Check action button click
-            for act, (surf, rect) in action_rects.items():
-                if rect.collidepoint((mx, my)):
-                    current_action = act
-            # Check hint button click
-            if hint_button_rect:
-                if hint_button_rect.collidepoint((mx, my)):
-                    # Show a hint for the current scene
-                    hint = scene_info.get("hint", "No hint available.")
-                    interaction_text = interaction_text_font.render(hint, False, RGB_PINK)
-                    interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
-            # Check item click
-            for item_name, rect in item_rects.items():
-                adjusted_rect = rect.copy()
-                adjusted_rect.topleft = (
-                    rect.left + background_rect.left,
-                    rect.top + background_rect.top
-                )
-                if adjusted_rect.collidepoint((mx, my)) and current_action:
-                    print(f"{current_action.title()} on {item_name}")
-
-                    # Set interaction text based on action
-                    item_info = scene_info["items"][item_name]
-                    if current_action in item_info["interactions"]:
-                        interaction_text = interaction_text_font.render(item_info["interactions"][current_action], False, RGB_PINK)
-                        interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
-                    else:
-                        interaction_text = interaction_text_font.render(
-                            "I don't feel like doing that.", False, (255, 255, 255)
-                        )
-                        interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
-
-                    leads_to = scene_info["items"][item_name]["leads_to"]
-                    if leads_to != "n/a" and game_data["scenes"][leads_to]["is_locked"] == False:
-                        scene_info = scenes[leads_to]
-                        
-                        # Set background to new scene
-                        scene_image_file = "scene_" + leads_to + ".jpeg"
-                        # Load and scale the new scene
-                        background = pygame.image.load(scene_image_file).convert()
-                        background = pygame.transform.scale(background, (900, 600))
-
-                        # Recompute the rect and position it
-                        background_rect = background.get_rect()
-                        background_rect.midtop = (WINDOW_WIDTH // 2, 40)
-
-                        # Recompute items and their rects
-                        item_rects = {}
-                        for name, info in scene_info.get("items", {}).items():
-                            coords = info.get("coordinates", [0.5, 0.5])
-                            x = int(coords[0] * background.get_width())
-                            y = int(coords[1] * background.get_height())
-                            rect = pygame.Rect(0, 0, ITEM_SIZE, ITEM_SIZE)
-                            rect.center = (x, y)
-                            item_rects[name] = rect
-                        
-                        break
-                    else:
-                        # Check if current (action, item) matches any puzzle requirements
-                        stop_iteration = False
-                        for puzzle_name in puzzles_progress.keys():
-                            if len(puzzles_progress[puzzle_name]["requirements"]) == 0:
-                                # Unlock scene
-                                unlocked_scene = puzzles[puzzle_name]["result"]["unlocked_area"]
-                                game_data["scenes"][unlocked_scene]["is_locked"] = False
-
-                                del puzzles_progress[puzzle_name]
-                                break
-                            for requirement in puzzles_progress[puzzle_name]["requirements"]:
-                                requirement_action_name, requirement_item_name = requirement
-                                if (current_action, item_name) == (requirement_action_name, requirement_item_name):
-                                    # If the current action matches a puzzle requirement, remove the requirement
-                                    puzzles_progress[puzzle_name]["requirements"] = [req for req in puzzles_progress[puzzle_name]["requirements"] if req != [current_action, item_name]]
-                                    
-                                    # Display puzzle completion text
-                                    interaction_text = interaction_text_font.render(
-                                        puzzles_progress[puzzle_name]["completion_text"], False, (255, 204, 102)
-                                    )
-                                    interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
-
-                    if leads_to != "n/a" and game_data["scenes"][leads_to]["is_locked"] == True:
+    # Load fonts
+    action_button_font = pygame.font.SysFont("None", 68)
+    interaction_text_font = pygame.font.SysFont(None, 48)
+    font = pygame.font.SysFont(None, 48)
+
+    # Load puzzles; the engine tracks which requirements have been met
+    puzzles = world.puzzles
+    puzzle_engine = PuzzleEngine(puzzles)
+
+
+    # Load first scene; other scenes' shards are read when they're entered
+    current_scene = world.start_scene
+    if session is not None:
+        current_scene = session.current_scene
+        puzzle_engine.restore(session.puzzle_progress)
+        for unlocked_scene in session.unlocked_scenes:
+            world.unlock(unlocked_scene)
+
+    # Scenes whose image and coordinates are available; the rest are picked up in the background
+    ready_scenes = world.ready_scenes
+
+    # Decode and pre-scale every scene reachable from the start in the background
+    if scene_assets is None:
+        scene_assets = SceneAssets()
+    scene_assets.prefetch([scene for scene in world.reachable(current_scene) if scene in ready_scenes])
+
+    scene_info = world.scene(current_scene)
+    background = scene_assets.get(current_scene)
+    background_rect = background.get_rect()
+    background_rect.midtop = (WINDOW_WIDTH//2, 40)
+
+    # Item icons: one decoded atlas, icons are subsurfaces of it. It grows as scenes are generated.
+    item_atlas = ItemAtlas.load(world.item_atlas or ATLAS_INDEX)
+    inventory = list(session.inventory) if session is not None else []
+    # Stands in for the hover icon when there's nothing to show, so the layer list keeps its shape
+    blank_icon = pygame.Surface(ICON_SIZE, pygame.SRCALPHA)
+    hover_icon = blank_icon
+
+    # Load cursors once; text surfaces come from a cache instead of font.render every frame
+    sprites = load_cursors(Sprites())
+    cursor_img = sprites["cursor"]
+    pygame.mouse.set_visible(False)
+    text_cache = TextCache()
+
+    # Load text, buttons. The text on screen is also kept as (text, color), for saving the session.
+    interaction_message = None
+    interaction_text = text_cache.render(interaction_text_font, "", False, RGB_PINK)
+    interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
+
+    def show_interaction(text, color):
+        nonlocal interaction_message, interaction_text, interaction_text_rect
+        interaction_message = (text, color)
+        interaction_text = text_cache.render(interaction_text_font, text, False, color)
+        interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
+
+    if session is not None and session.interaction_text:
+        show_interaction(*session.interaction_text)
+
+    # Load hover text
+    hover_text = text_cache.render(font, "", False, (255, 255, 255))
+    hover_text_rect = hover_text.get_rect(bottomright=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2 + 500))
+
+    action_rects, x_offset = layout_action_buttons(text_cache, action_button_font)
+    btn_y = BUTTON_Y
+
+    current_action = None
+
+    hint_surf = text_cache.render(font, "Hint", False, (255, 255, 255))
+    hint_button_rect = hint_surf.get_rect(topleft=(x_offset, btn_y))
+
+    # Prepare item rects, indexed in screen space for hit testing
+    item_rects = build_item_rects(scene_info, background.get_size(), ITEM_SIZE)
+    item_index = ItemHitIndex(item_rects, background_rect.topleft, round_regions=ROUND_ITEM_REGIONS)
+
+    # Main loop
+    renderer = DirtyRenderer(screen, full_redraw=FULL_REDRAW)
+    last_input_ms = pygame.time.get_ticks()
+    running = True
+    while running:
+        frame_start = time.perf_counter()
+        text_start = text_cache.render_seconds
+
+        if generation_events is not None:
+            new_scenes = apply_generation_events(generation_events, world)
+            if new_scenes:
+                ready_scenes = world.ready_scenes
+                scene_assets.prefetch([scene for scene in world.reachable(current_scene) if scene in new_scenes])
+                item_atlas = ItemAtlas.load(world.item_atlas or ATLAS_INDEX) or item_atlas
+
+        transition_time = None
+
+        events = input_source.get_events()
+        if events is None:
+            # Scripted input has run out
+            break
+        for event in events:
+            last_input_ms = pygame.time.get_ticks()
+
+            mx, my = input_source.mouse_pos()
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type in (pygame.WINDOWEXPOSED, pygame.WINDOWRESTORED, pygame.VIDEOEXPOSE):
+                # The window's contents were lost (uncovered, restored from minimized): repaint it all next frame
+                renderer.invalidate()
+            elif event.type == pygame.MOUSEBUTTONDOWN:
+                # Check action button click
+                for act, (surf, rect) in action_rects.items():
+                    if rect.collidepoint((mx, my)):
+                        current_action = act
+                # Check hint button click
+                if hint_button_rect:
+                    if hint_button_rect.collidepoint((mx, my)):
+                        # Show a hint for the current scene
                         hint = scene_info.get("hint", "No hint available.")
-                        interaction_text = interaction_text_font.render(hint, False, RGB_PINK)
-                        interaction_text_rect = interaction_text.get_rect(center=INTERACTION_TEXT_POS)
-        else:
-            for item_name, rect in item_rects.items():
-                adjusted_rect = rect.copy()
-                adjusted_rect.topleft = (
-                    rect.left + background_rect.left,
-                    rect.top + background_rect.top
-                )
+                        show_interaction(hint, RGB_PINK)
+                # Check item click
+                for item_name in item_index.items_at((mx, my)):
+                    if current_action:
+                        print(f"{current_action.title()} on {item_name}")
+
+                        # Set interaction text based on action
+                        item_info = scene_info["items"][item_name]
+                        if current_action in item_info["interactions"]:
+                            show_interaction(item_info["interactions"][current_action], RGB_PINK)
+                            if current_action == "pick up" and item_info.get("leads_to", "n/a") == "n/a" and (current_scene, item_name) not in inventory:
+                                inventory.append((current_scene, item_name))
+                        else:
+                            show_interaction("I don't feel like doing that.", (255, 255, 255))
+
+                        leads_to = scene_info["items"][item_name]["leads_to"]
+                        if leads_to != "n/a" and not world.is_locked(leads_to) and leads_to not in ready_scenes:
+                            # Unlocked, but the generator hasn't finished painting it yet
+                            show_interaction("This area is still being painted...", (255, 255, 255))
+                        elif leads_to != "n/a" and not world.is_locked(leads_to):
+                            transition_start = time.perf_counter()
+                            current_scene = leads_to
+                            scene_info = world.scene(leads_to)
+
+                            # Set background to new scene (already decoded and scaled if prefetched)
+                            background = scene_assets.get(leads_to)
+
+                            # Recompute the rect and position it
+                            background_rect = background.get_rect()
+                            background_rect.midtop = (WINDOW_WIDTH // 2, 40)
+
+                            # Recompute items and their rects
+                            item_rects = build_item_rects(scene_info, background.get_size(), ITEM_SIZE)
+                            item_index = ItemHitIndex(item_rects, background_rect.topleft, round_regions=ROUND_ITEM_REGIONS)
+
+                            transition_time = time.perf_counter() - transition_start
+                            break
+                        else:
+                            # Check if current (action, item) matches any puzzle requirements
+                            result = puzzle_engine.interact(current_action, item_name)
+                            for puzzle_name in result.solved:
+                                # Display puzzle completion text
+                                show_interaction(puzzles[puzzle_name]["completion_text"], (255, 204, 102))
+                            for unlocked_scene in result.unlocked_scenes:
+                                # Unlock scene
+                                world.unlock(unlocked_scene)
+
+                        if leads_to != "n/a" and world.is_locked(leads_to):
+                            hint = scene_info.get("hint", "No hint available.")
+                            show_interaction(hint, RGB_PINK)
+            elif event.type == pygame.MOUSEMOTION:
+                cursor_img = sprites["cursor"]
+                hover_icon = blank_icon
+                item_name = item_index.item_at((mx, my))
                 # Event cursor hovers over item
-                if adjusted_rect.collidepoint((mx, my)):
-                    cursor_img = pygame.image.load("ms_cursor2.png").convert_alpha()
-                    cursor_img = pygame.transform.scale(cursor_img, (50, 50))
+                if item_name is not None:
+                    cursor_img = sprites["cursor_hover"]
+                    if item_atlas is not None:
+                        hover_icon = item_atlas.icon(current_scene, item_name) or blank_icon
 
                     if current_action:
-                        hover_text = font.render((current_action + " " + ' '.join(item_name.split('_'))).title(), False, (0, 255, 255))
+                        hover_text = text_cache.render(font, (current_action + " " + ' '.join(item_name.split('_'))).title(), False, (0, 255, 255))
                     else:
-                        hover_text = font.render("", False, (255, 255, 255))
-
-                    break
-
-    # Clear screen
-    screen.fill((0, 0, 0))
-
-    # Draw background
-    screen.blit(background, background_rect)
-    
-    if DEBUG_ITEMS:
-        # Draw interactable items
-        for name, rect in item_rects.items():
-            # Offset rect position by background's top-left
-            draw_rect = rect.copy()
-            draw_rect.topleft = (
-                rect.left + background_rect.left,
-                rect.top + background_rect.top
-            )
-            pygame.draw.rect(screen, (200, 50, 50), draw_rect, 2)
-
-            # Draw label relative to adjusted rect
-            label = font.render(name, True, (255, 255, 255))
-            lbl_rect = label.get_rect(midbottom=(draw_rect.centerx, draw_rect.top - 5))
-            screen.blit(label, lbl_rect)
-
-    # Draw action buttons
-    for act, (surf, rect) in action_rects.items():
-        # Highlight selected
-        color = (255, 255, 0) if act == current_action else (255, 255, 255)
-        surf = action_button_font.render(act.title(), False, color)
-        screen.blit(surf, rect)
-    # Draw hint button
-    hint_button = action_button_font.render("Clue", False, (255, 255, 255))
-    hint_button_rect = hint_button.get_rect(topleft=(hint_button_rect.centerx, btn_y))
-
-    # Draw interaction text
-    screen.blit(interaction_text, interaction_text_rect)
-
-    # Draw hover text
-    hover_text_rect = hover_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2 + 270))
-    screen.blit(hover_text, hover_text_rect)
-
-    # Draw cursor
-    mouse_x, mouse_y = pygame.mouse.get_pos()
-    screen.blit(cursor_img, (mouse_x, mouse_y))
-
-    pygame.display.flip()
-    clock.tick(60)
-
-pygame.quit()
+                        hover_text = text_cache.render(font, "", False, (255, 255, 255))
+
+        events_end = time.perf_counter()
+        text_in_events = text_cache.render_seconds - text_start
+
+        def draw_debug_items(surface):
+            # Draw interactable items (already in screen space)
+            for name, draw_rect in item_index.rects.items():
+                pygame.draw.rect(surface, (200, 50, 50), draw_rect, 2)
+
+                # Draw label relative to adjusted rect
+                label = text_cache.render(font, name, True, (255, 255, 255))
+                lbl_rect = label.get_rect(midbottom=(draw_rect.centerx, draw_rect.top - 5))
+                surface.blit(label, lbl_rect)
+
+        # Background first, then everything drawn on top of it
+        layers = [(background, background_rect)]
+
+        # Action buttons
+        for act, (surf, rect) in action_rects.items():
+            # Highlight selected
+            color = (255, 255, 0) if act == current_action else (255, 255, 255)
+            surf = text_cache.render(action_button_font, act.title(), False, color)
+            layers.append((surf, rect))
+        # Hint button
+        hint_button = text_cache.render(action_button_font, "Clue", False, (255, 255, 255))
+        hint_button_rect = hint_button.get_rect(topleft=(hint_button_rect.centerx, btn_y))
+
+        # Interaction text
+        layers.append((interaction_text, interaction_text_rect))
+
+        # Hover text
+        hover_text_rect = hover_text.get_rect(center=(WINDOW_WIDTH//2, WINDOW_HEIGHT//2 + 270))
+        layers.append((hover_text, hover_text_rect))
+        layers.append((hover_icon, hover_icon.get_rect(midright=(hover_text_rect.left - PADDING // 2, hover_text_rect.centery))))
+
+        # Inventory, right-aligned along the button row
+        if item_atlas is not None:
+            for slot, (scene_name, item_name) in enumerate(reversed(inventory[-INVENTORY_SLOTS:])):
+                icon = item_atlas.icon(scene_name, item_name)
+                if icon is not None:
+                    layers.append((icon, icon.get_rect(topright=(WINDOW_WIDTH - PADDING - slot * (ICON_SIZE[0] + PADDING // 2), btn_y))))
+
+        # Cursor
+        mouse_x, mouse_y = input_source.mouse_pos()
+        layers.append((cursor_img, cursor_img.get_rect(topleft=(mouse_x, mouse_y))))
+
+        # Only the regions that changed are redrawn and pushed to the display
+        blit_start, flip_start = renderer.blit_seconds, renderer.flip_seconds
+        renderer.draw(layers, overlay=draw_debug_items if DEBUG_ITEMS else None)
+
+        if on_frame is not None:
+            on_frame({
+                "events": events_end - frame_start - text_in_events,
+                "text": text_cache.render_seconds - text_start,
+                "blit": renderer.blit_seconds - blit_start,
+                "flip": renderer.flip_seconds - flip_start,
+                "frame": time.perf_counter() - frame_start,
+            })
+
+        # Scripted replays run flat out, since the frame cost is what's being measured
+        if input_source.realtime:
+            if pygame.time.get_ticks() - last_input_ms > IDLE_AFTER_MS:
+                # Nothing's happening: sleep until the next event (or the idle tick) instead of spinning at 60 FPS
+                event = pygame.event.wait(1000 // IDLE_FPS)
+                if event.type != pygame.NOEVENT:
+                    pygame.event.post(event)
+                clock.tick()
+            else:
+                clock.tick(ACTIVE_FPS)
+
+        if DEBUG_FRAME_TIMES and transition_time is not None:
+            print(f"Transition to {current_scene}: {transition_time * 1000:.1f} ms in handler, frame {clock.get_rawtime()} ms ({scene_assets.hits} cache hits, {scene_assets.misses} misses)")
+
+    return SessionState(current_scene, puzzle_engine.snapshot(), world.unlocked, inventory, interaction_message)
+
+if __name__ == "__main__":
+    main()
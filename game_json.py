@@ -0,0 +1,349 @@
+import json
+import os
+import re
+import threading
+
+from world_store import write_json
+
+# Local validation + repair of the world JSON returned by the LLM. This covers everything the
+# second GPT-4 "fix JSON" prompt asks for (syntax, leads_to into the second scene, requirement
+# verbs, puzzle items living in the START_ scene) so that round trip only happens when the
+# local pass can't fix the document.
+
+ACTIONS = ["talk", "use", "look", "pick up"]
+
+# Verbs the model tends to use instead of the four actions the game knows
+ACTION_ALIASES = {
+    "pick_up": "pick up",
+    "pickup": "pick up",
+    "pick-up": "pick up",
+    "take": "pick up",
+    "grab": "pick up",
+    "speak": "talk",
+    "talk to": "talk",
+    "talk_to": "talk",
+    "ask": "talk",
+    "examine": "look",
+    "inspect": "look",
+    "look at": "look",
+    "look_at": "look",
+    "open": "use",
+    "push": "use",
+    "pull": "use",
+}
+
+# Item names that are probably the way into another scene
+PATH_WORDS = ["door", "gate", "path", "stair", "portal", "exit", "entrance", "passage", "tunnel",
+              "bridge", "road", "archway", "arch", "hatch", "trapdoor", "ladder", "elevator", "corridor"]
+
+STATS_FILE = os.getenv("GEN_REPAIR_STATS", "repair_stats.json")
+
+
+class GameJsonError(ValueError):
+    pass
+
+
+def strip_fences(text):
+    match = re.search(r"```(?:json)?\s*\n(.*?)```", text, re.DOTALL)
+    if match:
+        text = match.group(1)
+    # Drop any chatter before the first { or after the last }
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end == -1:
+        raise GameJsonError("no JSON object found")
+    return text[start:end + 1]
+
+
+def fix_syntax(text):
+    # Trailing commas before } or ]
+    text = re.sub(r",(\s*[}\]])", r"\1", text)
+    # Missing commas between a value and the next key on a new line (the prompt template itself
+    # leaves one out after "interactions")
+    text = re.sub(r'(["}\]\d]|true|false|null)(\s*\n\s*")', r"\1,\2", text)
+    # The template's "completion_text: " typo, copied verbatim by the model
+    text = text.replace('"completion_text: "', '"completion_text": "')
+    return text
+
+
+def parse(text):
+    text = strip_fences(text)
+    try:
+        return json.loads(text), []
+    except json.JSONDecodeError:
+        pass
+    try:
+        return json.loads(fix_syntax(text)), ["syntax"]
+    except json.JSONDecodeError as e:
+        raise GameJsonError(f"invalid JSON after syntax repair: {e}")
+
+
+def name_key(name):
+    return re.sub(r"[\s_\-]+", "", str(name)).lower()
+
+
+def resolve_name(name, candidates):
+    # Match names that only differ in case/spaces/underscores (e.g. "Oak Door" vs "oak_door")
+    if name in candidates:
+        return name
+    wanted = name_key(name)
+    for candidate in candidates:
+        if name_key(candidate) == wanted:
+            return candidate
+    return None
+
+
+def normalize_action(action):
+    action = str(action).strip().lower()
+    if action in ACTIONS:
+        return action
+    return ACTION_ALIASES.get(action)
+
+
+def repair_game_data(game_data):
+    repairs = []
+    scenes = game_data.get("scenes")
+    if not isinstance(scenes, dict) or not scenes:
+        raise GameJsonError("missing scenes")
+    if not isinstance(game_data.get("puzzles"), dict):
+        raise GameJsonError("missing puzzles")
+
+    start_scenes = [name for name in scenes if name.upper().startswith("START")]
+    if len(start_scenes) != 1:
+        raise GameJsonError(f"expected exactly one START_ scene, found {len(start_scenes)}")
+    start_scene = start_scenes[0]
+    other_scenes = [name for name in scenes if name != start_scene]
+
+    for scene_name, scene in scenes.items():
+        if not isinstance(scene, dict):
+            raise GameJsonError(f"scene {scene_name} is not an object")
+        if not isinstance(scene.get("scene_description"), str):
+            raise GameJsonError(f"scene {scene_name} has no scene_description")
+        if not isinstance(scene.get("items"), dict) or not scene["items"]:
+            raise GameJsonError(f"scene {scene_name} has no items")
+        for item_name, item in scene["items"].items():
+            if not isinstance(item, dict):
+                raise GameJsonError(f"item {scene_name}/{item_name} is not an object")
+            if not isinstance(item.get("interactions"), dict):
+                item["interactions"] = {}
+                repairs.append(f"{scene_name}/{item_name}: interactions")
+            for action in list(item["interactions"]):
+                normalized = normalize_action(action)
+                if normalized is not None and normalized != action:
+                    item["interactions"].setdefault(normalized, item["interactions"].pop(action))
+                    repairs.append(f"{scene_name}/{item_name}: interaction {action}")
+
+            leads_to = item.get("leads_to", "n/a")
+            if leads_to != "n/a":
+                resolved = resolve_name(leads_to, scenes) if isinstance(leads_to, str) else None
+                leads_to = resolved if resolved not in (None, scene_name) else "n/a"
+            if leads_to != item.get("leads_to"):
+                item["leads_to"] = leads_to
+                repairs.append(f"{scene_name}/{item_name}: leads_to")
+
+    # At least one START_ item has to lead to the second scene
+    if other_scenes:
+        start_items = scenes[start_scene]["items"]
+        if not any(item["leads_to"] in other_scenes for item in start_items.values()):
+            path_items = [name for name in start_items if any(word in name.lower() for word in PATH_WORDS)]
+            if not path_items:
+                raise GameJsonError(f"no item in {start_scene} leads to another scene")
+            start_items[path_items[0]]["leads_to"] = other_scenes[0]
+            repairs.append(f"{start_scene}/{path_items[0]}: leads_to")
+
+    start_item_names = list(scenes[start_scene]["items"].keys())
+    unlocked_by_puzzles = set()
+    for puzzle_name, puzzle in game_data["puzzles"].items():
+        if not isinstance(puzzle, dict):
+            raise GameJsonError(f"puzzle {puzzle_name} is not an object")
+        result = puzzle.get("result") or {}
+        if not isinstance(result, dict):
+            raise GameJsonError(f"puzzle {puzzle_name} has a malformed result {result!r}")
+        unlocked_area = result.get("unlocked_area")
+        resolved = resolve_name(unlocked_area, scenes) if isinstance(unlocked_area, str) else None
+        if resolved is None:
+            if len(other_scenes) != 1:
+                raise GameJsonError(f"puzzle {puzzle_name} unlocks unknown scene {unlocked_area}")
+            resolved = other_scenes[0]
+        if resolved != unlocked_area:
+            puzzle["result"] = {"unlocked_area": resolved}
+            repairs.append(f"{puzzle_name}: unlocked_area")
+        unlocked_by_puzzles.add(resolved)
+
+        # Two-scene worlds: requirements come from the START_ scene. Bigger worlds may also use
+        # items from other scenes, as long as it isn't the scene the puzzle unlocks.
+        if len(scenes) > 2:
+            allowed_items = start_item_names + [item for name, scene in scenes.items()
+                                                if name not in (start_scene, resolved) for item in scene["items"]]
+        else:
+            allowed_items = start_item_names
+
+        requirements = puzzle.get("requirements")
+        if not isinstance(requirements, list) or not requirements:
+            raise GameJsonError(f"puzzle {puzzle_name} has no requirements")
+        # ['use', 'door'] -> [['use', 'door']]
+        if isinstance(requirements[0], str):
+            requirements = [requirements]
+            repairs.append(f"{puzzle_name}: requirements nesting")
+
+        fixed = []
+        for requirement in requirements:
+            if not isinstance(requirement, list) or len(requirement) != 2:
+                raise GameJsonError(f"puzzle {puzzle_name} has malformed requirement {requirement}")
+            action = normalize_action(requirement[0])
+            if action is None:
+                raise GameJsonError(f"puzzle {puzzle_name} uses unknown action {requirement[0]}")
+            item_name = resolve_name(requirement[1], allowed_items)
+            if item_name is None:
+                raise GameJsonError(f"puzzle {puzzle_name} uses {requirement[1]}, which isn't in {start_scene}")
+            if [action, item_name] != requirement:
+                repairs.append(f"{puzzle_name}: requirement {requirement}")
+            fixed.append([action, item_name])
+        puzzle["requirements"] = fixed
+        puzzle.setdefault("completion_text", puzzle.get("hint", ""))
+
+    # A locked scene no puzzle unlocks could never be entered
+    for scene_name in other_scenes:
+        if scenes[scene_name].get("is_locked") and scene_name not in unlocked_by_puzzles:
+            scenes[scene_name]["is_locked"] = False
+            repairs.append(f"{scene_name}: is_locked")
+
+    if scenes[start_scene].get("is_locked") is not False:
+        scenes[start_scene]["is_locked"] = False
+        repairs.append(f"{start_scene}: is_locked")
+
+    unreachable = unreachable_scenes(scenes, game_data["puzzles"], start_scene)
+    if unreachable:
+        raise GameJsonError(f"scenes {', '.join(unreachable)} can't be reached from {start_scene}")
+
+    return game_data, repairs
+
+
+def unreachable_scenes(scenes, puzzles, start_scene):
+    # Plays the world out from the START_ scene: walk every leads_to into an unlocked scene, solve
+    # every puzzle whose items are all in scenes reached so far, repeat until nothing changes.
+    # Whatever isn't reached by then (a scene nothing leads to, a puzzle needing an item from
+    # behind its own lock) can't be played.
+    unlocked = {name for name, scene in scenes.items() if not scene.get("is_locked")}
+    reachable = {start_scene}
+    solved = set()
+    changed = True
+    while changed:
+        changed = False
+        for scene_name in list(reachable):
+            for item in scenes[scene_name]["items"].values():
+                if item["leads_to"] in unlocked and item["leads_to"] not in reachable:
+                    reachable.add(item["leads_to"])
+                    changed = True
+        items_at_hand = {item_name for scene_name in reachable for item_name in scenes[scene_name]["items"]}
+        for puzzle_name, puzzle in puzzles.items():
+            if puzzle_name not in solved and all(item_name in items_at_hand for _, item_name in puzzle["requirements"]):
+                solved.add(puzzle_name)
+                unlocked.add(puzzle["result"]["unlocked_area"])
+                changed = True
+    return [name for name in scenes if name not in reachable]
+
+
+def repair_game_json(text):
+    # Returns (game_data, repairs); raises GameJsonError when the local pass can't fix it
+    game_data, repairs = parse(text)
+    if not isinstance(game_data, dict):
+        raise GameJsonError("top level is not an object")
+    game_data, data_repairs = repair_game_data(game_data)
+    return game_data, repairs + data_repairs
+
+
+
+# Two-stage generation (see generate_outline_prompt in main.py): a short outline with scene names,
+# item names, leads_to and the puzzles, then one detail completion per scene. The pieces are
+# merged back into the usual game_data shape and go through repair_game_data like a single-call world.
+
+def parse_outline(text):
+    outline, repairs = parse(text)
+    if not isinstance(outline, dict) or not isinstance(outline.get("scenes"), dict) or not outline["scenes"]:
+        raise GameJsonError("outline has no scenes")
+    if not isinstance(outline.get("puzzles"), dict):
+        raise GameJsonError("outline has no puzzles")
+    for scene_name, scene in outline["scenes"].items():
+        if not isinstance(scene, dict):
+            raise GameJsonError(f"outline scene {scene_name} is not an object")
+        items = scene.get("items")
+        if isinstance(items, list):
+            items = {name: "n/a" for name in items}
+            repairs.append(f"{scene_name}: item list")
+        if not isinstance(items, dict) or not items:
+            raise GameJsonError(f"outline scene {scene_name} has no items")
+        # {"item": "Scene"} is the outline format, but accept {"item": {"leads_to": "Scene"}} too
+        scene["items"] = {name: value.get("leads_to", "n/a") if isinstance(value, dict) else value
+                          for name, value in items.items()}
+    # The detail prompts read the puzzles before repair_game_data sees them, so check their shape here
+    for puzzle_name, puzzle in outline["puzzles"].items():
+        if not isinstance(puzzle, dict):
+            raise GameJsonError(f"outline puzzle {puzzle_name} is not an object")
+        if not isinstance(puzzle.get("result") or {}, dict):
+            raise GameJsonError(f"outline puzzle {puzzle_name} has a malformed result {puzzle['result']!r}")
+        requirements = puzzle.get("requirements")
+        if not isinstance(requirements, list) or not requirements:
+            raise GameJsonError(f"outline puzzle {puzzle_name} has no requirements")
+        if isinstance(requirements[0], str):
+            puzzle["requirements"] = requirements = [requirements]
+            repairs.append(f"{puzzle_name}: requirements nesting")
+        for requirement in requirements:
+            if not isinstance(requirement, list) or len(requirement) != 2 or not all(isinstance(part, str) for part in requirement):
+                raise GameJsonError(f"outline puzzle {puzzle_name} has malformed requirement {requirement}")
+    return outline, repairs
+
+
+def merge_scene_details(outline, details):
+    # details: {scene_name: detail text}. Returns (game_data, repairs) or raises GameJsonError.
+    repairs = []
+    scenes = {}
+    for scene_name, scene in outline["scenes"].items():
+        detail, detail_repairs = parse(details[scene_name])
+        repairs += [f"{scene_name}: {repair}" for repair in detail_repairs]
+        if not isinstance(detail, dict) or not isinstance(detail.get("scene_description"), str):
+            raise GameJsonError(f"scene {scene_name} detail has no scene_description")
+        detail_items = detail.get("items") if isinstance(detail.get("items"), dict) else {}
+
+        # Item names and leads_to come from the outline so the puzzles keep pointing at real items
+        items = {}
+        for item_name, leads_to in scene["items"].items():
+            detail_name = resolve_name(item_name, detail_items)
+            item = detail_items[detail_name] if detail_name is not None else None
+            if not isinstance(item, dict):
+                item = {"description": item_name.replace("_", " "), "interactions": {}}
+                repairs.append(f"{scene_name}/{item_name}: missing detail")
+            items[item_name] = {
+                "description": item.get("description", ""),
+                "interactions": item.get("interactions"),
+                "leads_to": leads_to,
+            }
+
+        scenes[scene_name] = {
+            "scene_description": detail["scene_description"],
+            "items": items,
+            "is_locked": scene.get("is_locked", not scene_name.upper().startswith("START")),
+            "hint": detail.get("hint", ""),
+        }
+
+    game_data, data_repairs = repair_game_data({"scenes": scenes, "puzzles": outline["puzzles"]})
+    return game_data, repairs + data_repairs
+
+_stats_lock = threading.Lock()
+
+
+def record_repair_outcome(outcome):
+    # outcome: "valid" (no changes), "repaired" (fixed locally) or "llm_fallback"
+    # Counts are kept across runs in STATS_FILE so the fallback rate can be tracked over time
+    with _stats_lock:
+        try:
+            with open(STATS_FILE) as f:
+                stats = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            stats = {}
+        stats[outcome] = stats.get(outcome, 0) + 1
+        # Only bookkeeping: a stats file that can't be written mustn't fail the world
+        try:
+            write_json(STATS_FILE, stats, indent=2)
+        except OSError as e:
+            print(f"Couldn't save JSON repair stats to {STATS_FILE}: {e}")
+    return stats
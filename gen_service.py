@@ -0,0 +1,348 @@
+import argparse
+import asyncio
+import collections
+import json
+import mimetypes
+import os
+import shutil
+import statistics
+import threading
+import time
+import uuid
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from main import generate_world, publish_game_data
+from scheduler import backend_load, backends_saturated
+from world_store import write_bytes
+
+# Generation service for many players at once. Each job generates into its own directory, so
+# concurrent worlds never clobber each other's game_data.json or scene images. Jobs wait in a
+# bounded queue for a worker thread; a worker only starts a new job while the backends (shared by
+# every job through scheduler.py) have spare capacity, and once the queue is full new submissions
+# are refused with 429 and a Retry-After estimated from recent job times.
+#
+#   POST /jobs {"description": str, "scenes": n}   -> 202 {"job_id": str}, or 429 when full
+#   GET  /jobs/<id>                                -> job status (state, ready_scenes, files, ...)
+#   GET  /jobs/<id>/files/<name>                   -> game_data.json, world_index.json, a scene shard or image
+#   GET  /stats                                    -> queue, worker, backend and latency figures
+#
+# game.py uses it when GEN_SERVICE_URL is set.
+
+SERVICE_URL = os.getenv("GEN_SERVICE_URL")
+SERVICE_HOST = os.getenv("GEN_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.getenv("GEN_SERVICE_PORT", "8780"))
+SERVICE_DIR = os.getenv("GEN_SERVICE_DIR", ".gen_jobs")
+# Jobs generated at once; each one already fans out across scenes
+SERVICE_WORKERS = int(os.getenv("GEN_SERVICE_WORKERS", "4"))
+# Jobs allowed to wait for a worker before submissions are refused
+SERVICE_QUEUE = int(os.getenv("GEN_SERVICE_QUEUE", "16"))
+# Finished jobs (and their files) are deleted this many seconds after they finish
+SERVICE_JOB_TTL = float(os.getenv("GEN_SERVICE_JOB_TTL", "3600"))
+
+
+def safe_file_name(name):
+    # File names come from scene names, so spaces, apostrophes etc. are fine; anything that could
+    # leave the job's directory isn't
+    return bool(name) and "/" not in name and "\\" not in name and ".." not in name and "\0" not in name
+
+
+class QueueFull(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"generation queue is full, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class Job:
+    def __init__(self, description, num_scenes, directory):
+        self.id = uuid.uuid4().hex[:12]
+        self.description = description
+        self.num_scenes = num_scenes
+        self.directory = os.path.join(directory, self.id)
+        self.state = "queued"
+        self.message = "Waiting for a generator..."
+        self.ready_scenes = []
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+
+    def status(self, position=None):
+        files = sorted(os.listdir(self.directory)) if os.path.isdir(self.directory) else []
+        return {
+            "job_id": self.id,
+            "state": self.state,
+            "message": self.message,
+            "position": position,
+            "ready_scenes": list(self.ready_scenes),
+            "files": [name for name in files if not name.startswith(".tmp-")],
+            "error": self.error,
+            "queued_seconds": round((self.started or time.time()) - self.created, 2),
+            "seconds": round((self.finished or time.time()) - self.started, 2) if self.started else None,
+        }
+
+
+class GenerationService:
+    def __init__(self, directory=SERVICE_DIR, workers=SERVICE_WORKERS, max_queue=SERVICE_QUEUE, job_ttl=SERVICE_JOB_TTL):
+        self.directory = directory
+        self.workers = workers
+        self.max_queue = max_queue
+        self.job_ttl = job_ttl
+        self.jobs = {}
+        self.queue = collections.deque()
+        self.running = 0
+        self.rejected = 0
+        self.held_seconds = 0.0
+        self.durations = collections.deque(maxlen=50)
+        self._cond = threading.Condition()
+        self._stopping = False
+        os.makedirs(directory, exist_ok=True)
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, description, num_scenes=None):
+        with self._cond:
+            self._expire()
+            if len(self.queue) >= self.max_queue:
+                self.rejected += 1
+                raise QueueFull(self._retry_after())
+            job = Job(description, num_scenes, self.directory)
+            self.jobs[job.id] = job
+            self.queue.append(job)
+            self._cond.notify()
+            return job
+
+    def status(self, job_id):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return None
+            position = self.queue.index(job) + 1 if job.state == "queued" else None
+            return job.status(position)
+
+    def file_path(self, job_id, name):
+        with self._cond:
+            job = self.jobs.get(job_id)
+        if job is None or not safe_file_name(name):
+            return None
+        path = os.path.join(job.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def stats(self):
+        with self._cond:
+            states = collections.Counter(job.state for job in self.jobs.values())
+            durations = list(self.durations)
+            return {
+                "workers": self.workers,
+                "running": self.running,
+                "queued": len(self.queue),
+                "max_queue": self.max_queue,
+                "jobs": dict(states),
+                "rejected": self.rejected,
+                "held_seconds": round(self.held_seconds, 2),
+                "job_seconds_p50": round(statistics.median(durations), 2) if durations else None,
+                "backends": backend_load(),
+            }
+
+    def stop(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+    def _retry_after(self):
+        # Roughly when a queue slot frees up: one job's time per round of workers ahead of it
+        typical = statistics.median(self.durations) if self.durations else 10.0
+        return max(1.0, typical * len(self.queue) / max(self.workers, 1))
+
+    def _expire(self):
+        now = time.time()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished is not None and now - job.finished > self.job_ttl:
+                del self.jobs[job_id]
+                shutil.rmtree(job.directory, ignore_errors=True)
+
+    def _next_job(self):
+        # Blocks until there's a job and the backends can take more work, or the service stops
+        with self._cond:
+            while True:
+                if self._stopping:
+                    return None
+                if self.queue and self.running and backends_saturated():
+                    # Starting another job now would only add to the backend queues; a job that
+                    # waits here can still be started by the first worker to see spare capacity
+                    held_from = time.monotonic()
+                    self._cond.wait(0.1)
+                    self.held_seconds += time.monotonic() - held_from
+                    continue
+                if self.queue:
+                    job = self.queue.popleft()
+                    job.state = "running"
+                    job.started = time.time()
+                    self.running += 1
+                    return job
+                self._cond.wait()
+
+    def _work(self):
+        while True:
+            job = self._next_job()
+            if job is None:
+                return
+            try:
+                self._generate(job)
+                job.state = "done"
+                job.message = "Done"
+            except Exception as e:
+                job.state = "failed"
+                job.error = str(e)
+                print(f"Job {job.id} failed: {e}")
+            with self._cond:
+                job.finished = time.time()
+                self.running -= 1
+                if job.state == "done":
+                    self.durations.append(job.finished - job.started)
+                self._cond.notify_all()
+
+    def _generate(self, job):
+        os.makedirs(job.directory, exist_ok=True)
+        data_path = os.path.join(job.directory, "game_data.json")
+
+        def on_event(event):
+            if event["type"] == "progress":
+                job.message = event["message"]
+            elif event["type"] == "scene_ready":
+                publish_game_data(event["game_data"], event["ready_scenes"], data_path)
+                job.ready_scenes = list(event["ready_scenes"])
+
+        asyncio.run(generate_world(job.description, on_event=on_event, num_scenes=job.num_scenes, output_dir=job.directory))
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        service = self.server.service
+        if self.path.rstrip("/") != "/jobs":
+            return self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            description = str(request["description"])
+            num_scenes = int(request["scenes"]) if request.get("scenes") else None
+        except (ValueError, KeyError, TypeError) as e:
+            return self.send_json(400, {"error": f"bad request: {e}"})
+        try:
+            job = service.submit(description, num_scenes)
+        except QueueFull as e:
+            return self.send_json(429, {"error": str(e)}, {"Retry-After": str(round(e.retry_after))})
+        self.send_json(202, {"job_id": job.id})
+
+    def do_GET(self):
+        service = self.server.service
+        # Split before decoding, so an encoded slash stays inside its part (and is refused there)
+        parts = [urllib.parse.unquote(part) for part in urllib.parse.urlsplit(self.path).path.strip("/").split("/")]
+        if parts == ["stats"]:
+            return self.send_json(200, service.stats())
+        if len(parts) == 2 and parts[0] == "jobs":
+            status = service.status(parts[1])
+            if status is None:
+                return self.send_json(404, {"error": "no such job"})
+            return self.send_json(200, status)
+        if len(parts) == 4 and parts[0] == "jobs" and parts[2] == "files":
+            path = service.file_path(parts[1], parts[3])
+            if path is None:
+                return self.send_json(404, {"error": "no such file"})
+            with open(path, "rb") as f:
+                data = f.read()
+            content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+            return self.send_bytes(200, data, content_type)
+        self.send_json(404, {"error": f"unknown endpoint {self.path}"})
+
+    def send_json(self, status, payload, headers=None):
+        self.send_bytes(status, json.dumps(payload).encode("utf-8"), "application/json", headers)
+
+    def send_bytes(self, status, data, content_type, headers=None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_service(host=SERVICE_HOST, port=SERVICE_PORT, service=None):
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service if service is not None else GenerationService()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+class ServiceClient:
+    def __init__(self, base_url=SERVICE_URL):
+        # Imported here so the service itself doesn't need a client session
+        from http_clients import get_session, get_timeout
+        self.base_url = base_url.rstrip("/")
+        self.session = get_session("service")
+        self.timeout = get_timeout()
+        self.retries = 0
+
+    def submit(self, description, num_scenes=None, max_wait=300.0):
+        # Returns the job id, waiting out 429s for up to max_wait seconds
+        deadline = time.monotonic() + max_wait
+        while True:
+            response = self.session.post(f"{self.base_url}/jobs", json={"description": description, "scenes": num_scenes}, timeout=self.timeout)
+            if response.status_code != 429:
+                response.raise_for_status()
+                return response.json()["job_id"]
+            delay = float(response.headers.get("Retry-After", "1"))
+            if time.monotonic() + delay > deadline:
+                raise QueueFull(delay)
+            self.retries += 1
+            time.sleep(delay)
+
+    def status(self, job_id):
+        response = self.session.get(f"{self.base_url}/jobs/{job_id}", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def read(self, job_id, name):
+        response = self.session.get(f"{self.base_url}/jobs/{job_id}/files/{urllib.parse.quote(name)}", timeout=self.timeout)
+        response.raise_for_status()
+        return response.content
+
+    def fetch(self, job_id, name, dest_dir="."):
+        content = self.read(job_id, name)
+        # Write to a temp file then rename, so the game never loads a half-written image
+        path = os.path.join(dest_dir, name)
+        write_bytes(path, content)
+        return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve world generation to many players")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--dir", default=SERVICE_DIR)
+    parser.add_argument("--workers", type=int, default=SERVICE_WORKERS)
+    parser.add_argument("--queue", type=int, default=SERVICE_QUEUE, help="jobs allowed to wait before submissions get 429")
+    args = parser.parse_args()
+
+    service = GenerationService(args.dir, workers=args.workers, max_queue=args.queue)
+    server, base_url = start_service(args.host, args.port, service)
+    print(f"Generation service on {base_url} ({args.workers} workers, queue {args.queue})")
+    print(f"  GEN_SERVICE_URL={base_url} python3 game.py")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        service.stop()
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from http_clients import base_url
+from scheduler import CallProgress, limiters
+from tracing import span
+from world_store import write_json
+
+# Hedged requests for the slow generation stages (SD3 images, gpt-4o coordinates). Once a call has
+# taken longer than a high percentile of that stage's recent latencies, a duplicate is sent and
+# whichever answers first wins; the other is cancelled if it hasn't started, otherwise its result
+# is thrown away. Only a single request is hedged: the delay and the latency history count the
+# time a request spends at the backend, not its wait for a scheduler slot, and a call that has
+# had to retry (a 429 or 5xx, so the backend is struggling) is never hedged, nor does a hedge
+# retry. Hedges go through the same scheduler limits as any other request, are skipped while the
+# backend is saturated, and are capped at a fraction of calls so a slow backend isn't hit with
+# twice the load. A stage can also have a latency budget, after which the call gives up
+# with TimeoutError and the caller falls back (coordinates default to the middle of the image).
+
+HEDGE_ENABLED = os.getenv("GEN_HEDGE", "1") != "0"
+# Hedge once a call is slower than this percentile of the stage's recent latencies
+HEDGE_PERCENTILE = float(os.getenv("GEN_HEDGE_PERCENTILE", "90"))
+# Latencies needed before the percentile is trusted
+HEDGE_MIN_SAMPLES = int(os.getenv("GEN_HEDGE_MIN_SAMPLES", "8"))
+# Most calls that may be hedged, as a fraction of all calls
+HEDGE_MAX_RATE = float(os.getenv("GEN_HEDGE_MAX_RATE", "0.15"))
+# Seconds before a stage gives up (0 = no budget)
+SD3_BUDGET = float(os.getenv("GEN_SD3_BUDGET", "0"))
+VISION_BUDGET = float(os.getenv("GEN_VISION_BUDGET", "60"))
+# Latency history is kept across runs, per endpoint, so a fresh process can hedge from its first
+# call (and a stub run doesn't teach the real backend's hedge delay)
+HISTORY_PATH = os.getenv("GEN_LATENCY_HISTORY", os.path.join(os.getenv("GEN_CACHE_DIR", ".gen_cache"), "latency_history.json"))
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Hedger:
+    def __init__(self, name, backend, budget=0.0, enabled=HEDGE_ENABLED, hedge_percentile=HEDGE_PERCENTILE,
+                 min_samples=HEDGE_MIN_SAMPLES, max_rate=HEDGE_MAX_RATE, history=200):
+        self.name = name
+        self.backend = backend
+        self.budget = budget
+        self.enabled = enabled
+        self.hedge_percentile = hedge_percentile
+        self.min_samples = min_samples
+        self.max_rate = max_rate
+        self._lock = threading.Lock()
+        # Time each request spent at the backend, from getting its scheduler slot to its response:
+        # winners, the losers that answered after them, and (as far as they got) requests abandoned
+        # at the budget. The hedge delay is a percentile of these.
+        self.history = deque(maxlen=history)
+        # Latency of every completed call as the caller saw it (hedged or not)
+        self.latencies = deque(maxlen=history)
+        # What the same calls would have taken without hedging (the first request's own latency)
+        self.unhedged = deque(maxlen=history)
+        # Hedged calls wait on two requests at once, so they need threads of their own
+        self._pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix=f"hedge-{name}")
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+
+    def hedge_delay(self):
+        # Seconds to wait on the first request before hedging, or None to not hedge this call
+        with self._lock:
+            if not self.enabled or len(self.history) < self.min_samples:
+                return None
+            # calls already counts this one, so the cap holds from the very first call
+            if self.hedges + 1 > self.max_rate * self.calls:
+                return None
+            return percentile(self.history, self.hedge_percentile)
+
+    def call(self, fn, *args):
+        # fn is sent through the backend's scheduler limiter, once or (hedged) twice
+        limiter = limiters[self.backend]
+        start = time.monotonic()
+        with self._lock:
+            self.calls += 1
+        deadline = start + self.budget if self.budget else None
+
+        futures = {}
+        # Requests whose time is already in the history
+        counted = set()
+
+        def submit(progress, **options):
+            future = self._pool.submit(limiter.call_with_progress, progress, fn, args, **options)
+            future.add_done_callback(lambda future: self._record_answered(future, progress, counted))
+            futures[future] = progress
+            return future
+
+        progress = CallProgress()
+        primary = submit(progress)
+        primary.add_done_callback(lambda future: self._record_unhedged(future, time.monotonic() - start))
+        delay = self.hedge_delay()
+        if delay is not None and self._wait_to_hedge(progress, delay, deadline) and not limiter.saturated():
+            with self._lock:
+                self.hedges += 1
+            with span(f"{self.name}.hedge", "scheduler", after_ms=round(delay * 1000, 1)):
+                submit(CallProgress(), max_retries=0)
+
+        error = None
+        pending = set(futures)
+        while pending:
+            done, pending = wait(pending, timeout=self._remaining(None, deadline), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if future is not primary:
+                        with self._lock:
+                            self.hedge_wins += 1
+                    self._record(self.latencies, time.monotonic() - start)
+                    self._record_request(futures[future], futures[future].request_seconds, counted)
+                    return future.result()
+                error = error or future.exception()
+        if pending:
+            for other in pending:
+                other.cancel()
+                # Still at the backend: it took at least this long, which the history has to know
+                started = futures[other].request_started
+                if started is not None:
+                    self._record_request(futures[other], time.monotonic() - started, counted)
+            with self._lock:
+                self.timeouts += 1
+            raise TimeoutError(f"{self.name} took longer than its {self.budget:.0f}s budget")
+        raise error
+
+    def _wait_to_hedge(self, progress, delay, deadline):
+        # Wait until the first request has been at the backend for delay seconds (time queued for a
+        # slot doesn't count). False if the call finishes first, has to retry, or runs out of budget.
+        with progress.changed:
+            while True:
+                if progress.finished or progress.retries or self._expired(deadline):
+                    return False
+                if progress.request_started is None:
+                    timeout = self._remaining(None, deadline)
+                else:
+                    hedge_at = progress.request_started + delay
+                    if time.monotonic() >= hedge_at:
+                        return True
+                    timeout = self._remaining(hedge_at, deadline)
+                progress.changed.wait(timeout)
+
+    def _remaining(self, until, deadline):
+        ends = [end for end in (until, deadline) if end is not None]
+        return max(0.0, min(ends) - time.monotonic()) if ends else None
+
+    def _expired(self, deadline):
+        return deadline is not None and time.monotonic() >= deadline
+
+    def _record(self, samples, seconds):
+        with self._lock:
+            samples.append(seconds)
+
+    def _record_request(self, progress, seconds, counted):
+        # Each request goes into the history once, whichever of the caller, its own completion or
+        # the budget gets to it first
+        with self._lock:
+            if progress not in counted:
+                counted.add(progress)
+                self.history.append(seconds)
+
+    def _record_answered(self, future, progress, counted):
+        if not future.cancelled() and future.exception() is None:
+            self._record_request(progress, progress.request_seconds, counted)
+
+    def _record_unhedged(self, future, seconds):
+        if not future.cancelled() and future.exception() is None:
+            self._record(self.unhedged, seconds)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "calls": self.calls,
+                "hedges": self.hedges,
+                "hedge_rate": round(self.hedges / self.calls, 3) if self.calls else None,
+                "hedge_wins": self.hedge_wins,
+                "timeouts": self.timeouts,
+            }
+            for label, samples in (("", self.latencies), ("unhedged_", self.unhedged), ("request_", self.history)):
+                if samples:
+                    for pct in (50, 95, 99):
+                        stats[f"{label}p{pct}_ms"] = round(percentile(samples, pct) * 1000, 1)
+            return stats
+
+    def load_history(self, samples):
+        with self._lock:
+            self.history.extend(samples)
+
+    def history_snapshot(self):
+        with self._lock:
+            return list(self.history)
+
+
+hedgers = {
+    "sd3": Hedger("sd3", "sd3", budget=SD3_BUDGET),
+    "vision": Hedger("vision", "openai", budget=VISION_BUDGET),
+}
+
+
+def hedged(stage, fn, *args):
+    return hedgers[stage].call(fn, *args)
+
+
+def hedging_stats():
+    return {name: hedger.stats() for name, hedger in hedgers.items()}
+
+
+def _read_history(path):
+    # {stage: {endpoint: [seconds]}}; anything else (an older file without endpoints) is ignored
+    try:
+        with open(path) as f:
+            history = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(history, dict):
+        return {}
+    return {name: endpoints for name, endpoints in history.items() if isinstance(endpoints, dict)}
+
+
+def load_latency_history(path=HISTORY_PATH):
+    history = _read_history(path)
+    for name, hedger in hedgers.items():
+        samples = history.get(name, {}).get(base_url(hedger.backend))
+        if isinstance(samples, list):
+            hedger.load_history(samples)
+
+
+def save_latency_history(path=HISTORY_PATH):
+    # Only this run's endpoints are replaced; other endpoints' histories are kept
+    history = _read_history(path)
+    for name, hedger in hedgers.items():
+        history.setdefault(name, {})[base_url(hedger.backend)] = hedger.history_snapshot()
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    write_json(path, history, indent=None)
+
+
+load_latency_history()
@@ -0,0 +1,53 @@
+import pygame
+
+# Screen-space hit testing for scene items. Item rects are shifted into screen space once per
+# scene and bucketed into a uniform grid, so a click or hover only tests the few items whose
+# rects overlap the cell under the mouse instead of copying and testing every rect.
+
+CELL_SIZE = 100
+
+
+class ItemHitIndex:
+    def __init__(self, item_rects, offset=(0, 0), cell_size=CELL_SIZE, round_regions=False):
+        # item_rects: item name -> Rect relative to the background; offset: background topleft
+        # round_regions: hit the ellipse inscribed in each rect rather than the whole square
+        self.cell_size = cell_size
+        self.round_regions = round_regions
+        self.rects = {name: rect.move(offset) for name, rect in item_rects.items()}
+        self.cells = {}
+        for name, rect in self.rects.items():
+            for cx in range(rect.left // cell_size, (rect.right - 1) // cell_size + 1):
+                for cy in range(rect.top // cell_size, (rect.bottom - 1) // cell_size + 1):
+                    self.cells.setdefault((cx, cy), []).append(name)
+
+    def _hit(self, name, pos):
+        rect = self.rects[name]
+        if not rect.collidepoint(pos):
+            return False
+        if not self.round_regions:
+            return True
+        rx, ry = rect.width / 2, rect.height / 2
+        dx, dy = (pos[0] - rect.centerx) / rx, (pos[1] - rect.centery) / ry
+        return dx * dx + dy * dy <= 1
+
+    def items_at(self, pos):
+        # Every item under pos, in the scene's item order (cells are filled in that order)
+        candidates = self.cells.get((pos[0] // self.cell_size, pos[1] // self.cell_size), ())
+        return [name for name in candidates if self._hit(name, pos)]
+
+    def item_at(self, pos):
+        hits = self.items_at(pos)
+        return hits[0] if hits else None
+
+
+def build_item_rects(scene_info, background_size, item_size):
+    # Item rects relative to the background, centered on each item's coordinates
+    item_rects = {}
+    for name, info in scene_info.get("items", {}).items():
+        coords = info.get("coordinates", [0.5, 0.5])
+        x = int(coords[0] * background_size[0])
+        y = int(coords[1] * background_size[1])
+        rect = pygame.Rect(0, 0, item_size, item_size)
+        rect.center = (x, y)
+        item_rects[name] = rect
+    return item_rects
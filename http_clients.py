@@ -0,0 +1,86 @@
+import os
+import threading
+
+import httpx
+import openai
+import requests
+from requests.adapters import HTTPAdapter
+
+# Shared, connection-pooled HTTP clients for every generation backend. Building a new
+# openai.OpenAI client or calling bare requests.post pays DNS + TCP + TLS setup on every call;
+# these are created once per process and reused (keep-alive) by all worker threads.
+
+# Worker threads in generate_world; pools are sized so every worker can hold a live connection
+MAX_WORKERS = int(os.getenv("GEN_MAX_WORKERS", "8"))
+CONNECT_TIMEOUT = float(os.getenv("GEN_CONNECT_TIMEOUT", "10"))
+READ_TIMEOUT = float(os.getenv("GEN_READ_TIMEOUT", "180"))
+
+# Base URLs are overridable so the backends can be pointed at a local stub (see bench/stub_server.py)
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+SD3_BASE_URL = os.getenv("SD3_BASE_URL", "https://api.stability.ai")
+OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
+
+# Where the openai client goes when OPENAI_BASE_URL isn't set
+OPENAI_DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+_lock = threading.Lock()
+_sessions = {}
+_openai_client = None
+
+
+def base_url(backend):
+    # The endpoint a backend's requests go to, as configured now (part of the cache key, so a stub
+    # run's replies are never served to a run against the real API)
+    if backend == "openai":
+        return (OPENAI_BASE_URL or OPENAI_DEFAULT_BASE_URL).rstrip("/")
+    if backend == "sd3":
+        return SD3_BASE_URL.rstrip("/")
+    if backend == "ollama":
+        return OLLAMA_BASE_URL.rstrip("/")
+    raise ValueError(f"unknown backend {backend}")
+
+
+def get_timeout():
+    # (connect, read) tuple in the form requests expects
+    return (CONNECT_TIMEOUT, READ_TIMEOUT)
+
+
+def get_session(backend):
+    with _lock:
+        session = _sessions.get(backend)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=MAX_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[backend] = session
+        return session
+
+
+def get_openai_client():
+    global _openai_client
+    with _lock:
+        if _openai_client is None:
+            http_client = httpx.Client(
+                limits=httpx.Limits(max_connections=MAX_WORKERS, max_keepalive_connections=MAX_WORKERS),
+                timeout=httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT),
+            )
+            _openai_client = openai.OpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                base_url=OPENAI_BASE_URL,
+                http_client=http_client,
+                # Retries/backoff are handled by scheduler.py so they respect the per-backend limits
+                max_retries=0,
+            )
+        return _openai_client
+
+
+def close_clients():
+    global _openai_client
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+        if _openai_client is not None:
+            _openai_client.close()
+            _openai_client = None
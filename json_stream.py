@@ -0,0 +1,104 @@
+import json
+
+# Incremental JSON scanner for the streamed world JSON. It tracks just enough structure (object
+# keys along the current path) to notice when scenes.<name>.scene_description has been fully
+# received, so the scene's image can be requested while the rest of the document is still
+# streaming. It's deliberately forgiving: chatter/fences before the first { are skipped and
+# missing or trailing commas don't throw it off.
+
+KEY, COLON, VALUE, AFTER_VALUE = range(4)
+
+
+class _Frame:
+    def __init__(self, is_object):
+        self.is_object = is_object
+        self.key = None
+        self.state = KEY if is_object else VALUE
+
+
+class SceneDescriptionStream:
+    def __init__(self, on_scene_description, scene_name=None):
+        # scene_name: the document is a single scene (per-scene detail completions), so look for a
+        # top-level scene_description and report it under this name
+        self.on_scene_description = on_scene_description
+        self.scene_name = scene_name
+        self.stack = []
+        self.started = False
+        self.finished = False
+        self.in_string = False
+        self.escape = False
+        self.string_chars = []
+        self.text = []
+
+    def feed(self, chunk):
+        self.text.append(chunk)
+        for ch in chunk:
+            if self.finished:
+                return
+            if self.in_string:
+                self._string_char(ch)
+            elif not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.stack.append(_Frame(True))
+            else:
+                self._structural_char(ch)
+
+    def getvalue(self):
+        return "".join(self.text)
+
+    def _string_char(self, ch):
+        if self.escape:
+            self.escape = False
+        elif ch == "\\":
+            self.escape = True
+        elif ch == '"':
+            self.in_string = False
+            self._string_done("".join(self.string_chars))
+            self.string_chars = []
+            return
+        self.string_chars.append(ch)
+
+    def _structural_char(self, ch):
+        frame = self.stack[-1]
+        if ch == '"':
+            self.in_string = True
+        elif ch in "{[":
+            if frame.is_object:
+                frame.state = AFTER_VALUE
+            self.stack.append(_Frame(ch == "{"))
+        elif ch in "}]":
+            self.stack.pop()
+            if not self.stack:
+                self.finished = True
+        elif ch == ":":
+            if frame.is_object:
+                frame.state = VALUE
+        elif ch == ",":
+            if frame.is_object:
+                frame.state = KEY
+        elif not ch.isspace():
+            # A bare value (true, false, null, a number): a string after it with no comma is the next key
+            if frame.is_object and frame.state == VALUE:
+                frame.state = AFTER_VALUE
+
+    def _string_done(self, raw):
+        try:
+            value = json.loads('"' + raw + '"')
+        except json.JSONDecodeError:
+            value = raw
+        frame = self.stack[-1]
+        if not frame.is_object:
+            return
+        if frame.state in (KEY, AFTER_VALUE):
+            # A string right after a value with no comma is still the next key
+            frame.key = value
+            frame.state = COLON
+            return
+        frame.state = AFTER_VALUE
+        path = [f.key for f in self.stack]
+        if self.scene_name is not None:
+            if path == ["scene_description"]:
+                self.on_scene_description(self.scene_name, value)
+        elif len(path) == 3 and path[0] == "scenes" and path[2] == "scene_description":
+            self.on_scene_description(path[1], value)
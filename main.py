@@ -1,128 +1,168 @@
 import argparse
+import asyncio
+import copy
+import hashlib
 import sys
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait
 
 from datetime import datetime
+import time
 
-import requests
 import json
 # from diffusers import DiffusionPipeline
 # import torch
-import openai
-import base64
 from typing import Dict, Tuple
 
-import vcr
 import re
-from functools import lru_cache
 
 from dotenv import load_dotenv
 import os
 load_dotenv()
 
-RECORD_MODE = "all"
+from atlas import ATLAS_INDEX, AtlasBuilder, sheet_grid, slice_sheet
+from cache import generation_cache, make_key
+from game_json import GameJsonError, merge_scene_details, parse_outline, record_repair_outcome, repair_game_json
+from hedging import hedged, hedging_stats, save_latency_history
+from json_stream import SceneDescriptionStream
+import replay
+from replay import recorded
+from scheduler import check_response, schedule, scheduler_stats
+from stub_backend import reply_text
+from vision_image import VISION_DETAIL, vision_images
+from world_store import WorldWriter, write_json
+from tracing import span, tracer, TRACE_PATH
+from http_clients import MAX_WORKERS, OLLAMA_BASE_URL, SD3_BASE_URL, base_url, get_openai_client, get_session, get_timeout
+
+# Number of scenes in a generated world (override per call with generate_world(num_scenes=...))
+NUM_SCENES = int(os.getenv("GEN_SCENES", "2"))
+# "outline": short outline call, then one detail call per scene in parallel; "single": one call for the whole world
+PROMPT_MODE = os.getenv("GEN_PROMPT_MODE", "outline")
+# Which model writes the story: "openai" (GPT-4), "ollama" (local model) or "stub" (canned replies, no model)
+TEXT_BACKEND = os.getenv("GEN_TEXT_BACKEND", "openai")
+OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "llama3:8b")
+# How long Ollama keeps the model loaded after a request, so the next run doesn't pay the load again
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Paint item icons (one sprite sheet call per scene, packed into item_atlas.png). Off by default: it
+# doubles the SD3 calls per world, and the game draws items without icons just fine.
+ITEM_ICONS = os.getenv("GEN_ITEM_ICONS", "0") != "0"
 SD3_API_KEY = os.getenv("SD3_API_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 
-# TODO: Function not needed anymore, can use match_text_only() to compare responses instead
-@lru_cache(maxsize=None)
-def get_base64_image(image_path):
-    with open(image_path, "rb") as f:
-        return base64.b64encode(f.read()).decode("utf-8")
-    
-my_vcr = vcr.VCR()
-def match_text_only(r1, r2):
-    try:
-        b1 = json.loads(r1.body)
-        b2 = json.loads(r2.body)
-
-        def extract_text(msg_list):
-            return [entry["text"] for m in msg_list for entry in m["content"] if entry["type"] == "text"]
-
-        text1 = extract_text(b1["messages"])
-        text2 = extract_text(b2["messages"])
-
-        return text1 == text2
-    except Exception:
-        return False
-
-def normalize_multipart(body_bytes):
-    # Decode bytes safely
-    body = body_bytes.decode('utf-8', errors='ignore')
-    
-    # Strip dynamic boundary lines
-    # Replace boundary markers like: --{boundary}\r\n
-    body = re.sub(r"--[a-f0-9]{32,}(\r\n|\n)?", "--<boundary>\n", body)
-    
-    # Remove Content-Disposition lines
-    body = re.sub(r"Content-Disposition:.*?\r?\n", "", body, flags=re.IGNORECASE)
-    
-    # Remove any remaining headers inside the parts
-    body = re.sub(r"Content-Type:.*?\r?\n", "", body, flags=re.IGNORECASE)
-
-    # Remove any empty lines and normalize whitespace
-    body = "\n".join(line.strip() for line in body.strip().splitlines() if line.strip())
-
-    return body
-
-def multipart_body_matcher(r1, r2):
-    try:
-        b1 = normalize_multipart(r1.body)
-        b2 = normalize_multipart(r2.body)
-        return b1 == b2
-    except Exception:
-        return False
-
-my_vcr.register_matcher('text_only', match_text_only)
-my_vcr.register_matcher("clean_multipart", multipart_body_matcher)
-
-# @my_vcr.use_cassette('fixtures/vcr_cassettes/ollama.yaml', match_on=['method', 'uri', 'body'], record_mode=RECORD_MODE)
-def call_ollama(prompt):
-    print("Start Llama3 call at", datetime.now().time().strftime("%H:%M:%S"))
-
-    headers = {"Content-Type": "application/json"}
-    response = requests.post(
-        "http://localhost:11434/api/generate",
-        headers=headers,
-        data=json.dumps({
-            "model": "llama3:8b",
-            "prompt": prompt,
-            "stream": False
-        })
-    )
+def call_ollama(prompt, on_text=None):
+    # Same contract as call_openai. The reply is always streamed (newline-delimited JSON) so the read
+    # timeout applies between chunks rather than to the whole generation.
+    print(f"Start {OLLAMA_MODEL} call at", datetime.now().time().strftime("%H:%M:%S"))
+    streamed = []
+
+    def request_completion():
+        response = get_session("ollama").post(
+            f"{OLLAMA_BASE_URL}/api/generate",
+            headers={"Content-Type": "application/json"},
+            data=json.dumps({
+                "model": OLLAMA_MODEL,
+                "prompt": prompt,
+                "stream": True,
+                "keep_alive": OLLAMA_KEEP_ALIVE,
+            }),
+            timeout=get_timeout(),
+            stream=True,
+        )
+        with response:
+            check_response(response)
+            if response.status_code != 200:
+                raise Exception(f"Ollama HTTP {response.status_code}: {response.text[:200]}")
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    chunk = json.loads(line)
+                    if "error" in chunk:
+                        raise Exception("Ollama: " + str(chunk["error"]))
+                    if chunk.get("response"):
+                        streamed.append(chunk["response"])
+                        if on_text is not None:
+                            on_text(chunk["response"])
+                    if chunk.get("done"):
+                        trace["load_ms"] = round(chunk.get("load_duration", 0) / 1e6, 1)
+                        trace["eval_tokens"] = chunk.get("eval_count", 0)
+                        break
+            except Exception as e:
+                if streamed and on_text is not None:
+                    # Part of the text already went to on_text; a retry would feed it twice
+                    raise RuntimeError(f"{OLLAMA_MODEL} stream failed after {len(streamed)} chunks: {e}") from e
+                streamed.clear()
+                raise
+        return "".join(streamed).encode("utf-8")
+
+    key = make_key("ollama:" + OLLAMA_MODEL, prompt, backend="ollama", endpoint=base_url("ollama"))
+    with span("ollama.generate", model=OLLAMA_MODEL, streamed=on_text is not None, request_bytes=len(prompt.encode("utf-8")), cache="hit") as trace:
+        def compute():
+            trace["cache"] = "miss"
+            return schedule("ollama", request_completion)
+        content = recorded("ollama", OLLAMA_MODEL, prompt, lambda: generation_cache.get_or_compute(key, compute)).decode("utf-8")
+        trace["response_bytes"] = len(content.encode("utf-8"))
+        if on_text is not None and not streamed:
+            on_text(content)
+
+    print(f"Finish {OLLAMA_MODEL} call at", datetime.now().time().strftime("%H:%M:%S"))
 
-    if response.status_code == 200:
-        response_text = response.text
-        data = json.loads(response_text)
-        actual_response = data['response']
+    return content
 
-        return actual_response
-    
-    print("Start Llama3 call at", datetime.now().time().strftime("%H:%M:%S"))
+def call_stub_text(prompt, on_text=None):
+    # Canned replies from stub_backend.py, for running the pipeline with no text model at all
+    with span("stub.text", request_bytes=len(prompt.encode("utf-8"))):
+        content = reply_text(prompt)
+    if on_text is not None:
+        on_text(content)
+    return content
 
-    return "Error: " + str(response.status_code) + " " + response.text
+def get_text_backend(name=None):
+    # The call_* function for a text backend name (default GEN_TEXT_BACKEND)
+    name = name or TEXT_BACKEND
+    if name not in TEXT_BACKENDS:
+        raise ValueError(f"unknown text backend {name!r} (expected one of {', '.join(TEXT_BACKENDS)})")
+    return TEXT_BACKENDS[name]
+
+def generate_prompt_from_description(description, num_scenes=2):
+    if num_scenes == 2:
+        wording = {
+            "scene_count": "Two scenes",
+            "path_rule": "one of the items HAS to be a path to the other scene.",
+            "puzzle_count": "A single puzzle",
+            "requirement_rule": "Requirements must ONLY use items in the first scene.",
+            "unlock_rule": "The puzzle always results in unlocking the second scene.",
+            "leads_to_rule": "AT LEAST one item has to lead to the other scene",
+        }
+    else:
+        wording = {
+            "scene_count": f"{num_scenes} scenes",
+            "path_rule": "at least one of the items HAS to be a path to another scene, and every scene must be reachable from the starting scene.",
+            "puzzle_count": f"{num_scenes - 1} puzzles (one for each locked scene)",
+            "requirement_rule": "Requirements must ONLY use items in the starting scene or in scenes unlocked by earlier puzzles.",
+            "unlock_rule": "Each puzzle results in unlocking a different locked scene; every scene except the starting scene is locked.",
+            "leads_to_rule": "AT LEAST one item has to lead to another scene",
+        }
 
-def generate_prompt_from_description(description):
     return """You will be given a description of a point-and-click adventure game. Based on that description, generate a structured JSON object that includes:
 
-    1. Two scenes, each with:
+    1. {scene_count}, each with:
     - scene_description: a beautiful description of the scene that mentions the items present
-    - items: a dictionary where each key is the item name. one of the items HAS to be a path to the other scene. **each scene has 7 items, 1 or 2 items are people**
+    - items: a dictionary where each key is the item name. {path_rule} **each scene has 7 items, 1 or 2 items are people**
     - description: should be short with some light humor, 8 words or less
     - interactions: a dictionary where keys are interaction types (interaction types are "talk", "use", "look", and "pick up") and values are the corresponding dialogue or behavior
     - the name of the starting scene should be prefixed with "START_"
 
-    2. A single puzzle, with:
+    2. {puzzle_count}, with:
     - id: a unique identifier like "puzzle_1"
     - type: one of "item_combination", "item_usage", "dialog", or "environment"
     - description: a short summary of the puzzle
-    - requirements: item(s), interaction(s), or conditions required to solve the puzzle. Requirements must ONLY use items in the first scene.
+    - requirements: item(s), interaction(s), or conditions required to solve the puzzle. {requirement_rule}
     - result: must be exactly:
     "result": {{
         "unlocked_area": {{name of scene unlocked}}
     }}
     
-    The puzzle always results in unlocking the second scene.
+    {unlock_rule}
 
     The output must exactly match this format:
 
@@ -136,7 +176,7 @@ def generate_prompt_from_description(description):
                     "interactions": {{
                         {{interaction_type}}: {{dialogue after performing the interaction}}
                     }}
-                    "leads_to": {{if the item is a path that leads to another scene, then value is the scene name, otherwise value is "n/a". AT LEAST one item has to lead to the other scene}}
+                    "leads_to": {{if the item is a path that leads to another scene, then value is the scene name, otherwise value is "n/a". {leads_to_rule}}}
                 }}
             }},
             "is_locked": {{false for the first scene, otherwise true}},
@@ -158,43 +198,147 @@ def generate_prompt_from_description(description):
     }}
     }}
 
-    Description: {}
+    Description: {description}
+    Now generate the JSON output, and make sure it's valid and parsable by Python's json.load(). Do not add any other text.
+    """.format(description=description, **wording)
+
+def generate_outline_prompt(description, num_scenes=2):
+    # Stage one of the two-stage generator: only names, paths and puzzles, so it stays short
+    if num_scenes == 2:
+        requirement_rule = "Requirements must ONLY use items in the starting scene."
+    else:
+        requirement_rule = "Requirements must ONLY use items in the starting scene or in scenes unlocked by earlier puzzles."
+
+    return """You will be given a description of a point-and-click adventure game. Based on that description, generate the OUTLINE of the game as a JSON object. Number of scenes: {num_scenes}.
+
+    - each scene has 7 items, 1 or 2 items are people. Item names are short, use underscores instead of spaces
+    - the name of the starting scene should be prefixed with "START_"
+    - for each item, give the name of the scene it leads to if it's a path to another scene, otherwise "n/a". Every scene must be reachable from the starting scene
+    - every scene except the starting scene is locked, and there is one puzzle per locked scene that unlocks it
+    - {requirement_rule} Interaction types are "talk", "use", "look", and "pick up"
+
+    The output must exactly match this format:
+
+    {{
+    "scenes": {{
+        {{scene name}}: {{
+            "items": {{
+                {{item name}}: {{scene name this item leads to, or "n/a"}}
+            }},
+            "is_locked": {{false for the starting scene, otherwise true}}
+        }}
+    }},
+    "puzzles": {{
+        {{puzzle_name}}: {{
+            "type": {{one of "item_combination", "item_usage", "dialog", or "environment"}},
+            "hint": {{dialogue that hints at what to do, 8 words or less}},
+            "completion_text": {{Text to display when the puzzle is solved, 8 words or less}},
+            "requirements": [
+                [{{interaction_type}}, {{item name}}]
+            ],
+            "result": {{
+                "unlocked_area": {{scene name}}
+            }}
+        }}
+    }}
+    }}
+
+    Description: {description}
     Now generate the JSON output, and make sure it's valid and parsable by Python's json.load(). Do not add any other text.
-    """.format(description)
+    """.format(description=description, num_scenes=num_scenes, requirement_rule=requirement_rule)
+
+def generate_scene_detail_prompt(description, outline, scene_name):
+    # Stage two: everything the outline left out for one scene. The puzzles are included so the
+    # dialogue and hint can point at them.
+    scene = outline["scenes"][scene_name]
+    puzzles = {name: puzzle for name, puzzle in outline["puzzles"].items()
+               if any(requirement[1] in scene["items"] for requirement in puzzle.get("requirements", []) if isinstance(requirement, list) and len(requirement) == 2)
+               or (puzzle.get("result") or {}).get("unlocked_area") == scene_name}
+
+    return """You are writing one scene of a point-and-click adventure game. The game's scenes: {scene_names}.
+    Write the scene "{scene_name}". Its items are: {item_names}.
+    Paths in this scene: {paths}
+    Puzzles involving this scene: {puzzles}
+
+    Generate a JSON object with:
+    - scene_description: a beautiful description of the scene that mentions the items present
+    - items: for each item above (use the exact names), a description (short with some light humor, 8 words or less) and interactions: a dictionary where keys are interaction types ("talk", "use", "look", and "pick up") and values are the corresponding dialogue or behavior
+    - hint: hint dialogue for the related puzzle, written from the perspective of the main character, 8 words or less
 
-# @my_vcr.use_cassette('fixtures/vcr_cassettes/sd3.yaml', match_on=['method', 'uri', 'clean_multipart'], record_mode=RECORD_MODE)
-def call_sd3(prompt, output_filename="sd3_output"):
+    The output must exactly match this format:
+
+    {{
+    "scene_description": {{beautiful description of this scene}},
+    "items": {{
+        {{item name}}: {{
+            "description": {{Short humorous description}},
+            "interactions": {{
+                {{interaction_type}}: {{dialogue after performing the interaction}}
+            }}
+        }}
+    }},
+    "hint": {{hint dialogue}}
+    }}
+
+    Description: {description}
+    Now generate the JSON output, and make sure it's valid and parsable by Python's json.load(). Do not add any other text.
+    """.format(
+        description=description,
+        scene_names=", ".join(outline["scenes"]),
+        scene_name=scene_name,
+        item_names=", ".join(scene["items"]),
+        paths=", ".join(f"{item} leads to {target}" for item, target in scene["items"].items() if target != "n/a") or "none",
+        puzzles=json.dumps(puzzles) if puzzles else "none",
+    )
+
+def call_sd3(prompt, output_filename="sd3_output", aspect_ratio="3:2"):
     print("Start SD3 call at", datetime.now().time().strftime("%H:%M:%S"))
 
     # print(f"prompt={prompt} ({type(prompt)}), output_filename={output_filename} ({type(output_filename)})")
 
-    response = requests.post(
-        f"https://api.stability.ai/v2beta/stable-image/generate/ultra",
-        headers={
-            "authorization": f"Bearer {SD3_API_KEY}",
-            "accept": "image/*"
-        },
-        files={"none": ''},
-        data={
-            "prompt": prompt,
-            "aspect_ratio": "3:2",
-            "output_format": "jpeg",
-        },
-    )
+    def request_image():
+        response = get_session("sd3").post(
+            f"{SD3_BASE_URL}/v2beta/stable-image/generate/ultra",
+            headers={
+                "authorization": f"Bearer {SD3_API_KEY}",
+                "accept": "image/*"
+            },
+            files={"none": ''},
+            data={
+                "prompt": prompt,
+                "aspect_ratio": aspect_ratio,
+                "output_format": "jpeg",
+            },
+            timeout=get_timeout(),
+        )
+        check_response(response)
+        if response.status_code != 200:
+            raise Exception(str(response.json()))
+        return response.content
+
+    key = make_key("sd3-ultra", prompt, aspect_ratio=aspect_ratio, output_format="jpeg", backend="sd3", endpoint=base_url("sd3"))
+    with span("sd3.generate", output=output_filename, request_bytes=len(prompt.encode("utf-8")), cache="hit") as trace:
+        def compute():
+            trace["cache"] = "miss"
+            return hedged("sd3", request_image)
+        image_bytes = recorded("sd3", "sd3-ultra", prompt, lambda: generation_cache.get_or_compute(key, compute),
+                               side_file=".jpeg", aspect_ratio=aspect_ratio, output_format="jpeg")
+        trace["response_bytes"] = len(image_bytes)
 
     print("Finish SD3 call at", datetime.now().time().strftime("%H:%M:%S"))
 
-    if response.status_code == 200:
-        with open(f"./{output_filename}.jpeg", 'wb') as file:
-            file.write(response.content)
-    else:
-        raise Exception(str(response.json()))
+    with open(f"{output_filename}.jpeg", 'wb') as file:
+        file.write(image_bytes)
     
-def generate_images_for_scene_and_icons(scene_name, scene_description, scene_items):
+def generate_images_for_scene_and_icons(scene_name, scene_description, scene_items, output_dir="."):
+    with span("generate_images", scene=scene_name):
+        return _generate_images_for_scene_and_icons(scene_name, scene_description, scene_items, output_dir)
+
+def _generate_images_for_scene_and_icons(scene_name, scene_description, scene_items, output_dir="."):
     filenames = []
     
     scene_prompt = f"Aesthetic pixel game art VGA 90’s style. {scene_description}"
-    output_filename = f"scene_{scene_name}"
+    output_filename = os.path.join(output_dir, f"scene_{scene_name}")
     filenames.append(output_filename)
 
     print(scene_name + " / " + scene_prompt + " / " + str(scene_items))
@@ -203,67 +347,372 @@ def generate_images_for_scene_and_icons(scene_name, scene_description, scene_ite
 
     return filenames
 
-# @my_vcr.use_cassette('fixtures/vcr_cassettes/openai.yaml', match_on=['method', 'uri', 'body'], record_mode=RECORD_MODE)
-def call_openai(prompt):
+def generate_icon_sheet_prompt(item_names, columns, rows):
+    return (f"Aesthetic pixel game art VGA 90’s style inventory icons. A sprite sheet laid out as a grid of {columns} columns and {rows} rows "
+            f"of equal square cells on a plain white background, one centered object per cell, no text, no borders. "
+            f"In reading order, left to right and top to bottom: {', '.join(name.replace('_', ' ') for name in item_names)}. "
+            f"Any remaining cells are empty.")
+
+def generate_item_icons(scene_name, item_names, output_dir="."):
+    # {item name: icon surface} for the scene's items, from a single image call. Icons are
+    # decoration, so a failed sheet leaves the scene without them rather than failing the world.
+    with span("generate_icons", scene=scene_name, items=len(item_names)):
+        if not item_names:
+            return {}
+        columns, rows = sheet_grid(len(item_names))
+        output_filename = os.path.join(output_dir, f"icons_{scene_name}")
+        try:
+            call_sd3(generate_icon_sheet_prompt(item_names, columns, rows), output_filename=output_filename, aspect_ratio="1:1")
+            icons = slice_sheet(output_filename + ".jpeg", len(item_names))
+            # Only the packed atlas ships with the world
+            os.remove(output_filename + ".jpeg")
+        except Exception as e:
+            print(f"Icon sheet for {scene_name} failed ({e}), continuing without icons")
+            return {}
+        return dict(zip(item_names, icons))
+
+def call_openai(prompt, on_text=None):
+    # If on_text is given the completion is streamed and on_text is called with each text delta
+    # as it arrives (or once with the whole text on a cache hit)
     print("Start GPT-4 text call at", datetime.now().time().strftime("%H:%M:%S"))
-
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-
-    response = client.chat.completions.create(
-        model="gpt-4",
-        messages=[{"role": "user", "content": prompt}],
-    )
-
-    # Get the raw text
-    content = response.choices[0].message.content
+    streamed = []
+
+    def request_completion():
+        client = get_openai_client()
+
+        if on_text is None:
+            response = client.chat.completions.create(
+                model="gpt-4",
+                messages=[{"role": "user", "content": prompt}],
+            )
+
+            # Get the raw text
+            return response.choices[0].message.content.encode("utf-8")
+
+        stream = client.chat.completions.create(
+            model="gpt-4",
+            messages=[{"role": "user", "content": prompt}],
+            stream=True,
+        )
+        try:
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    streamed.append(chunk.choices[0].delta.content)
+                    on_text(chunk.choices[0].delta.content)
+        except Exception as e:
+            if streamed:
+                # Part of the text already went to on_text; a retry would feed it twice
+                raise RuntimeError(f"GPT-4 stream failed after {len(streamed)} chunks: {e}") from e
+            raise
+        return "".join(streamed).encode("utf-8")
+
+    key = make_key("gpt-4", prompt, backend="openai", endpoint=base_url("openai"))
+    with span("openai.chat", model="gpt-4", streamed=on_text is not None, request_bytes=len(prompt.encode("utf-8")), cache="hit") as trace:
+        def compute():
+            trace["cache"] = "miss"
+            return schedule("openai", request_completion)
+        content = recorded("openai", "gpt-4", prompt, lambda: generation_cache.get_or_compute(key, compute)).decode("utf-8")
+        trace["response_bytes"] = len(content.encode("utf-8"))
+        if on_text is not None and not streamed:
+            on_text(content)
 
     print("Finish GPT-4 text at", datetime.now().time().strftime("%H:%M:%S"))
 
     return content
 
-# @my_vcr.use_cassette('fixtures/vcr_cassettes/openai.yaml', match_on=['method', 'uri', 'text_only'], record_mode=RECORD_MODE)
+TEXT_BACKENDS = {"openai": call_openai, "ollama": call_ollama, "stub": call_stub_text}
+
 def call_openai_with_image(image_filename_without_extension, prompt):
     print("Start GPT-4 image analysis call at", datetime.now().time().strftime("%H:%M:%S"))
 
-    client = openai.OpenAI(api_key=OPENAI_API_KEY)
-
-    full_image_path = f"./{image_filename_without_extension}.jpeg"
+    full_image_path = f"{image_filename_without_extension}.jpeg"
 
     if not os.path.exists(full_image_path):
         print(f"ERROR: Image file not found at {full_image_path} for OpenAI call.")
         return "Error: Image file not found."
 
-    base64_image_data = get_base64_image(full_image_path)
-    
-    image_data_url = f"data:image/jpeg;base64,{base64_image_data}"
-
-    response = client.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {
-                "role": "user",
-                "content": [
-                    {"type": "text", "text": prompt},
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": image_data_url
+    with open(full_image_path, "rb") as f:
+        image_bytes = f.read()
+
+    def request_analysis():
+        client = get_openai_client()
+
+        # Downscaled copy, encoded once per distinct image content
+        image_data_url = vision_images.data_url(image_bytes)
+        trace["request_bytes"] = len(prompt.encode("utf-8")) + len(image_data_url)
+
+        response = client.chat.completions.create(
+            model="gpt-4o",
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_data_url,
+                                "detail": VISION_DETAIL
+                            }
                         }
-                    }
-                ]
-            }
-        ]
-    )
+                    ]
+                }
+            ]
+        )
+        return response.choices[0].message.content.encode("utf-8")
+
+    key = make_key("gpt-4o", prompt, image_bytes=image_bytes, max_side=vision_images.max_side, detail=VISION_DETAIL,
+                   backend="openai", endpoint=base_url("openai"))
+    with span("openai.vision", model="gpt-4o", image_bytes=len(image_bytes), cache="hit") as trace:
+        def compute():
+            trace["cache"] = "miss"
+            return hedged("vision", request_analysis)
+        # Fingerprinted on the image too: two scenes with the same item names get their own coordinates
+        content = recorded("vision", "gpt-4o", prompt, lambda: generation_cache.get_or_compute(key, compute),
+                           image=hashlib.sha256(image_bytes).hexdigest()).decode("utf-8")
+        trace["response_bytes"] = len(content.encode("utf-8"))
 
     print("Finish GPT-4 image analysis call at", datetime.now().time().strftime("%H:%M:%S"))
 
-    return response.choices[0].message.content
+    return content
 
 def get_item_coordinates_in_image(image_filename, item_names):
     prompt = f"in terms of distance ratio between left and right, top and bottom of the image (starting from left and top), where is the center of the following items? (Format your response as lines of object_name,x,y and nothing else in your response. For example, object1_name,0.52,0.57\nobject2_name,0.32,0.78) Items: {','.join(item_names)}. If you're not sure, just give your best guess."
     
     return call_openai_with_image(image_filename, prompt)
 
+def verify_game_json(unverified_game_json, call_text=call_openai):
+    with span("verify_game_json", request_bytes=len(unverified_game_json)):
+        return _verify_game_json(unverified_game_json, call_text)
+
+def _verify_game_json(unverified_game_json, call_text=call_openai):
+    # Try the local validator/repairer first; only pay for a second GPT-4 round trip if it can't fix things
+    try:
+        game_data, repairs = repair_game_json(unverified_game_json)
+        stats = record_repair_outcome("repaired" if repairs else "valid")
+        if repairs:
+            print("Repaired game JSON locally:", ", ".join(repairs))
+        print("JSON repair stats:", stats)
+        return game_data
+    except GameJsonError as e:
+        stats = record_repair_outcome("llm_fallback")
+        print("Local JSON repair failed (" + str(e) + "), asking the model to fix it. JSON repair stats:", stats)
+
+    prompt = "Fix any syntactical mistakes in this JSON structure, including removing trailing commas that would cause errors, **if it's already valid JSON then return it unchanged, don't say anything else in your reply**. Ensure that at least one leads_to value under the first scene (the one under the item most likely to lead to the second scene) is set to the name of the second scene. Ensure the first element of the 'requirements' key is 'talk', 'use', 'look', or 'pick up'. Ensure that the puzzle only uses items found in the starting scene: {}".format(unverified_game_json)
+    verified_game_json_str = call_text(prompt)
+    try:
+        game_data, _ = repair_game_json(verified_game_json_str)
+        return game_data
+    except GameJsonError:
+        pass
+    match = re.search(r"```json\n(.*?)```", verified_game_json_str, re.DOTALL)
+    if match:
+        payload = match.group(1)
+        return json.loads(payload)
+    return json.loads(verified_game_json_str)
+
+def process_scene(scene_tuple, image_future=None, output_dir="."):
+    with span("process_scene", scene=scene_tuple[0]):
+        return _process_scene(scene_tuple, image_future, output_dir)
+
+def _process_scene(scene_tuple, image_future=None, output_dir="."):
+    # image_future: scene image already requested while the world JSON was streaming
+    scene_name, info = scene_tuple
+    item_names = list(info["items"].keys())
+    if image_future is not None:
+        with span("wait_for_image", scene=scene_name):
+            filenames = image_future.result()
+    else:
+        filenames = generate_images_for_scene_and_icons(scene_name, info["scene_description"], item_names, output_dir)
+    scene_filename = filenames[0]
+
+    coords = {}
+    if item_names:
+        try:
+            item_coords_str = get_item_coordinates_in_image(scene_filename, item_names)
+        except TimeoutError as e:
+            # Over the vision budget: every item goes in the middle, same as an "n/a" answer
+            print(f"{e}, placing {scene_name}'s items at the default position")
+            return scene_name, {item_name: (0.5, 0.5) for item_name in item_names}
+        for line in item_coords_str.splitlines():
+            parts = line.strip().split(',')
+            if len(parts) == 3:
+                item_name = parts[0].strip()
+                if parts[1] == "n/a" or parts[2] == "n/a":
+                    coords[item_name] = (0.5, 0.5)
+                else:
+                    x = float(parts[1].strip())
+                    y = float(parts[2].strip())
+                    coords[item_name] = (x, y)
+
+    return scene_name, coords
+
+async def write_story_from_outline(description, num_scenes, run_blocking, on_scene_description, call_text=call_openai):
+    # Outline first, then every scene's details at once: the story takes as long as the outline plus
+    # the slowest scene instead of one completion covering every scene. Returns None if the pieces
+    # don't add up to a valid world, and the caller falls back to the single-call prompt.
+    def write_outline():
+        with span("outline", scenes=num_scenes):
+            return call_text(generate_outline_prompt(description, num_scenes))
+
+    def write_scene(scene_name, stream):
+        with span("scene_detail", scene=scene_name):
+            return call_text(generate_scene_detail_prompt(description, outline, scene_name), stream.feed)
+
+    outline_json = await run_blocking(write_outline)
+    try:
+        outline, _ = parse_outline(outline_json)
+    except GameJsonError as e:
+        print("Outline unusable (" + str(e) + "), generating the world in one call")
+        return None
+
+    scene_names = list(outline["scenes"])
+    streams = [SceneDescriptionStream(on_scene_description, scene_name=name) for name in scene_names]
+    details = await asyncio.gather(*[
+        run_blocking(write_scene, name, stream)
+        for name, stream in zip(scene_names, streams)
+    ])
+
+    try:
+        game_data, repairs = merge_scene_details(outline, dict(zip(scene_names, details)))
+    except GameJsonError as e:
+        record_repair_outcome("llm_fallback")
+        print("Scene details don't fit the outline (" + str(e) + "), generating the world in one call")
+        return None
+    stats = record_repair_outcome("repaired" if repairs else "valid")
+    if repairs:
+        print("Repaired game JSON locally:", ", ".join(repairs))
+    print("JSON repair stats:", stats)
+    return game_data
+
+async def generate_world(description, on_event=None, num_scenes=None, prompt_mode=None, output_dir=".", text_backend=None):
+    # In-process generation API. on_event (if given) is called with progress dicts:
+    #   {"type": "progress", "message": str}
+    #   {"type": "scene_ready", "scene_name": str, "ready_scenes": [str], "game_data": dict}
+    #   {"type": "done", "game_data": dict, "stats": dict}
+    # game_data in events is a snapshot, safe to keep and mutate on another thread. on_event may be
+    # called from worker threads, so it needs to be thread-safe (e.g. queue.Queue.put).
+    # Scene images are written to output_dir as scene_<name>.jpeg, item icons (GEN_ITEM_ICONS) to
+    # item_atlas.png + item_atlas.json, named in game_data["item_atlas"], and the world itself as
+    # world_index.json + one scene_<name>.json per scene (world_store.py), each scene's shard written
+    # before its scene_ready event. text_backend picks the model that writes the story (see
+    # TEXT_BACKENDS; default GEN_TEXT_BACKEND).
+    def emit(event_type, **fields):
+        if on_event is not None:
+            on_event({"type": event_type, **fields})
+
+    # Blocking backend calls run on a pool the same size as the shared HTTP connection pools
+    call_text = get_text_backend(text_backend)
+    executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    try:
+        with span("generate_world", description_bytes=len(description), scenes=num_scenes or NUM_SCENES, prompt_mode=prompt_mode or PROMPT_MODE, text_backend=text_backend or TEXT_BACKEND):
+            return await _generate_world(description, emit, executor, num_scenes or NUM_SCENES, prompt_mode or PROMPT_MODE, output_dir, call_text)
+    finally:
+        executor.shutdown(wait=False)
+        try:
+            save_latency_history()
+        except OSError as e:
+            print("Couldn't save latency history:", e)
+
+async def _generate_world(description, emit, executor, num_scenes, prompt_mode, output_dir, call_text):
+    loop = asyncio.get_running_loop()
+    start_time = time.perf_counter()
+
+    def run_blocking(fn, *args):
+        return loop.run_in_executor(executor, fn, *args)
+
+    # Scene images are requested as soon as each scene_description has streamed in, so image
+    # generation overlaps with the rest of the world JSON instead of waiting for all of it.
+    # Keyed by (scene name, scene description): a world from the single-call fallback may reuse a
+    # discarded outline's scene name for a different scene.
+    image_futures = {}
+
+    def paint_scene(scene_name, scene_description, earlier):
+        # Images of a discarded outline that were already being painted write the same file, so
+        # they have to finish first
+        wait(earlier)
+        return generate_images_for_scene_and_icons(scene_name, scene_description, [], output_dir)
+
+    def on_scene_description(scene_name, scene_description):
+        key = (scene_name, scene_description)
+        if key not in image_futures or image_futures[key].cancelled():
+            emit("progress", message=f"Painting {scene_name.replace('_', ' ')}...")
+            earlier = [future for (name, _), future in image_futures.items() if name == scene_name and not future.done()]
+            image_futures[key] = executor.submit(paint_scene, scene_name, scene_description, earlier)
+
+    emit("progress", message="Writing the story...")
+    game_data = None
+    with span("story", prompt_mode=prompt_mode):
+        if prompt_mode == "outline":
+            game_data = await write_story_from_outline(description, num_scenes, run_blocking, on_scene_description, call_text)
+            if game_data is None:
+                # Don't pay for images of the discarded outline's scenes that haven't started yet
+                for future in image_futures.values():
+                    future.cancel()
+        if game_data is None:
+            prompt = generate_prompt_from_description(description, num_scenes)
+            scene_stream = SceneDescriptionStream(on_scene_description)
+            unverified_game_json = await run_blocking(call_text, prompt, scene_stream.feed)
+
+            emit("progress", message="Checking the story...")
+            game_data = await run_blocking(verify_game_json, unverified_game_json, call_text)
+
+    emit("progress", message="Placing the items...")
+    # Start scene goes first so it's the first one published
+    scene_items = sorted(game_data["scenes"].items(), key=lambda scene: not scene[0].upper().startswith("START"))
+    ready_scenes = []
+
+    # Icon sheets are painted alongside the coordinate lookups; a scene is ready once both are done
+    icon_futures = {}
+    if ITEM_ICONS:
+        for scene_name, info in scene_items:
+            icon_futures[scene_name] = executor.submit(generate_item_icons, scene_name, list(info["items"]), output_dir)
+    atlas = AtlasBuilder()
+    world_writer = WorldWriter(output_dir)
+
+    async def finish_scene(scene):
+        image_future = image_futures.get((scene[0], scene[1]["scene_description"]))
+        if image_future is not None and image_future.cancelled():
+            image_future = None
+        scene_name, coords = await run_blocking(process_scene, scene, image_future, output_dir)
+        icons = await asyncio.wrap_future(icon_futures[scene_name]) if scene_name in icon_futures else {}
+        return scene_name, coords, icons
+
+    with span("scenes", scenes=len(scene_items)):
+        tasks = [finish_scene(scene) for scene in scene_items]
+        for task in asyncio.as_completed(tasks):
+            scene_name, coords, icons = await task
+            for item_name, (x, y) in coords.items():
+                if item_name in game_data["scenes"][scene_name]["items"]:
+                    game_data["scenes"][scene_name]["items"][item_name]["coordinates"] = (x, y)
+            if icons:
+                atlas.add(scene_name, icons)
+                with span("pack_atlas", scene=scene_name):
+                    atlas.save(output_dir)
+                game_data["item_atlas"] = ATLAS_INDEX
+
+            # Report each scene as soon as its image and coordinates are done, so the game can
+            # start on the START_ scene while the locked scenes are still generating
+            ready_scenes.append(scene_name)
+            with span("publish_world", scene=scene_name):
+                world_writer.publish(game_data, ready_scenes)
+            emit("scene_ready", scene_name=scene_name, ready_scenes=list(ready_scenes), game_data=copy.deepcopy(game_data))
+
+    elapsed = time.perf_counter() - start_time
+    stats = {
+        "scenes": len(ready_scenes),
+        "seconds": round(elapsed, 2),
+        "scenes_per_minute": round(len(ready_scenes) / elapsed * 60, 2) if elapsed > 0 else None,
+        "backends": scheduler_stats(),
+        "hedging": hedging_stats(),
+        "replay": replay.cassette.stats(),
+    }
+    print(f"Generated {stats['scenes']} scenes in {stats['seconds']}s ({stats['scenes_per_minute']} scenes/min)", stats["backends"])
+    print("Hedging:", stats["hedging"])
+
+    emit("done", game_data=copy.deepcopy(game_data), stats=stats)
+    return game_data
+
 def main():
     parser = argparse.ArgumentParser(
         description="Generate game_data.json + images for PnC adventure."
@@ -273,7 +722,45 @@ def main():
         type=str,
         help="A short text description of your scene"
     )
+    parser.add_argument(
+        "--scenes",
+        type=int,
+        default=NUM_SCENES,
+        help="Number of scenes in the world (default: GEN_SCENES or 2)"
+    )
+    parser.add_argument(
+        "--prompt-mode",
+        choices=["outline", "single"],
+        default=PROMPT_MODE,
+        help="outline: outline call + parallel per-scene calls; single: one call for the whole world (default: GEN_PROMPT_MODE or outline)"
+    )
+    parser.add_argument(
+        "--text-backend",
+        choices=["openai", "ollama", "stub"],
+        default=TEXT_BACKEND,
+        help="Model that writes the story: openai (GPT-4), ollama (local, OLLAMA_MODEL) or stub (canned replies) (default: GEN_TEXT_BACKEND or openai)"
+    )
+    parser.add_argument(
+        "--replay",
+        choices=replay.MODES,
+        default=replay.REPLAY_MODE,
+        help="Backend calls: off, record into the cassette, replay from it, or hybrid (replay, record what's missing) (default: GEN_REPLAY or off)"
+    )
+    parser.add_argument(
+        "--cassette",
+        default=replay.CASSETTE_DIR,
+        help="Cassette directory for --replay (default: GEN_CASSETTE or fixtures/cassettes/default)"
+    )
+    parser.add_argument(
+        "--trace",
+        default=TRACE_PATH,
+        help="Write a Chrome/Perfetto trace of the generation to this file (default: GEN_TRACE)"
+    )
     args = parser.parse_args()
+    if args.trace:
+        tracer.enabled = True
+    if args.replay != replay.REPLAY_MODE or args.cassette != replay.CASSETTE_DIR:
+        replay.use_cassette(args.cassette, args.replay)
 
     # read from --desc or stdin
     if args.desc:
@@ -281,52 +768,25 @@ def main():
     else:
         desc = sys.stdin.read().strip()
 
-    prompt = generate_prompt_from_description(desc)
-    unverified_game_json = call_openai(prompt)
-    # unverified_game_json = call_ollama(prompt)
-    prompt = "Fix any syntactical mistakes in this JSON structure, including removing trailing commas that would cause errors, **if it's already valid JSON then return it unchanged, don't say anything else in your reply**. Ensure that at least one leads_to value under the first scene (the one under the item most likely to lead to the second scene) is set to the name of the second scene. Ensure the first element of the 'requirements' key is 'talk', 'use', 'look', or 'pick up'. Ensure that the puzzle only uses items found in the starting scene: {}".format(unverified_game_json)
-    verified_game_json_str = call_openai(prompt)
-    # verified_game_json_str = call_ollama(prompt)
-    match = re.search(r"```json\n(.*?)```", verified_game_json_str, re.DOTALL)
-    if match:
-        payload = match.group(1)
-        verified_game_json = json.loads(payload)
-    else:
-        verified_game_json = json.loads(verified_game_json_str)
-    game_data = verified_game_json
+    def on_event(event):
+        if event["type"] == "progress":
+            print(event["message"])
+        elif event["type"] == "scene_ready":
+            publish_game_data(event["game_data"], event["ready_scenes"])
 
-    def process_scene(scene_tuple):
-        scene_name, info = scene_tuple
-        item_names = list(info["items"].keys())
-        filenames = generate_images_for_scene_and_icons(scene_name, info["scene_description"], item_names)
-        scene_filename = filenames[0]
+    asyncio.run(generate_world(desc, on_event=on_event, num_scenes=args.scenes, prompt_mode=args.prompt_mode, text_backend=args.text_backend))
 
-        coords = {}
-        if item_names:
-            item_coords_str = get_item_coordinates_in_image(scene_filename, item_names)
-            for line in item_coords_str.splitlines():
-                parts = line.strip().split(',')
-                if len(parts) == 3:
-                    item_name = parts[0].strip()
-                    if parts[1] == "n/a" or parts[2] == "n/a":
-                        coords[item_name] = (0.5, 0.5)
-                    else:
-                        x = float(parts[1].strip())
-                        y = float(parts[2].strip())
-                        coords[item_name] = (x, y)
-
-        return scene_name, coords
-
-    from concurrent.futures import ThreadPoolExecutor, as_completed
-    with ThreadPoolExecutor() as executor:
-        futures = [executor.submit(process_scene, scene) for scene in game_data["scenes"].items()]
-        for future in as_completed(futures):
-            scene_name, coords = future.result()
-            for item_name, (x, y) in coords.items():
-                game_data["scenes"][scene_name]["items"][item_name]["coordinates"] = (x, y)
+    if args.trace:
+        tracer.export_chrome_trace(args.trace)
+        print("Trace written to", args.trace, "(open in chrome://tracing or ui.perfetto.dev)")
+        for name, entry in sorted(tracer.summary().items(), key=lambda item: -item[1]["total_ms"]):
+            print(f"  {name:<20} x{entry['count']:<3} total {entry['total_ms']:9.1f} ms  max {entry['max_ms']:9.1f} ms")
+
+def publish_game_data(game_data, ready_scenes, path="game_data.json"):
+    game_data["ready_scenes"] = list(ready_scenes)
+    game_data["generation_complete"] = len(ready_scenes) == len(game_data["scenes"])
 
-    with open("game_data.json", "w") as f:
-        json.dump(game_data, f, indent=2)
+    write_json(path, game_data, indent=2)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,65 @@
+# Puzzle engine built once from game_data["puzzles"]. An (action, item) -> [(puzzle, bit)] index
+# finds the requirements a click satisfies without scanning every puzzle, progress is a bitset per
+# puzzle, and a puzzle unlocks its scene as soon as its last requirement is met.
+
+
+def normalize_requirements(requirements):
+    # Ensure requirements is a list of lists (e.g. [['use', 'door']] instead of ['use', 'door'])
+    if requirements and isinstance(requirements[0], str):
+        return [requirements]
+    return requirements
+
+
+class InteractionResult:
+    def __init__(self):
+        # Puzzles that had a requirement satisfied by this interaction
+        self.progressed = []
+        # Puzzles this interaction completed, and the scenes they unlocked
+        self.solved = []
+        self.unlocked_scenes = []
+
+
+class PuzzleEngine:
+    def __init__(self, puzzles):
+        self.names = list(puzzles.keys())
+        self.puzzles = puzzles
+        self.full_masks = []
+        self.progress = []
+        self.index = {}
+        for p, name in enumerate(self.names):
+            requirements = normalize_requirements(puzzles[name].get("requirements", []))
+            # Duplicate requirements only need to be met once
+            unique = list(dict.fromkeys((action, item) for action, item in requirements))
+            for bit, requirement in enumerate(unique):
+                self.index.setdefault(requirement, []).append((p, 1 << bit))
+            self.full_masks.append((1 << len(unique)) - 1)
+            self.progress.append(0)
+
+    def snapshot(self):
+        # puzzle name -> bitset of the requirements met so far, for saving a session
+        return {name: self.progress[p] for p, name in enumerate(self.names) if self.progress[p]}
+
+    def restore(self, progress):
+        for p, name in enumerate(self.names):
+            self.progress[p] = progress.get(name, 0) & self.full_masks[p]
+
+    def is_solved(self, puzzle_name):
+        p = self.names.index(puzzle_name)
+        return self.progress[p] == self.full_masks[p]
+
+    def interact(self, action, item_name):
+        result = InteractionResult()
+        for p, bit in self.index.get((action, item_name), ()):
+            progress = self.progress[p]
+            if progress & bit:
+                continue
+            progress |= bit
+            self.progress[p] = progress
+            name = self.names[p]
+            result.progressed.append(name)
+            if progress == self.full_masks[p]:
+                result.solved.append(name)
+                unlocked_area = self.puzzles[name].get("result", {}).get("unlocked_area")
+                if unlocked_area is not None:
+                    result.unlocked_scenes.append(unlocked_area)
+        return result
@@ -0,0 +1,114 @@
+import time
+from collections import OrderedDict
+
+import pygame
+
+# Render resources for the game loop: sprites loaded and scaled once, and an LRU of rendered text
+# surfaces so the same label isn't re-rasterized by font.render every frame.
+
+CURSOR_SIZE = (50, 50)
+
+
+class TextCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # Time spent in font.render (misses only)
+        self.render_seconds = 0.0
+        # (font, text, antialias, color) -> Surface, most recently used last
+        self._surfaces = OrderedDict()
+
+    def render(self, font, text, antialias, color):
+        # Same arguments as font.render, plus the font
+        key = (font, text, antialias, tuple(color))
+        surface = self._surfaces.get(key)
+        if surface is not None:
+            self.hits += 1
+            self._surfaces.move_to_end(key)
+            return surface
+        self.misses += 1
+        start = time.perf_counter()
+        surface = font.render(text, antialias, color)
+        self.render_seconds += time.perf_counter() - start
+        self._surfaces[key] = surface
+        if len(self._surfaces) > self.max_entries:
+            self._surfaces.popitem(last=False)
+        return surface
+
+
+class Sprites:
+    def __init__(self):
+        self._surfaces = {}
+
+    def load(self, name, path, size=None, alpha=True):
+        surface = pygame.image.load(path)
+        surface = surface.convert_alpha() if alpha else surface.convert()
+        if size is not None:
+            surface = pygame.transform.scale(surface, size)
+        self._surfaces[name] = surface
+        return surface
+
+    def __getitem__(self, name):
+        return self._surfaces[name]
+
+
+def load_cursors(sprites):
+    sprites.load("cursor", "ms_cursor.png", CURSOR_SIZE)
+    sprites.load("cursor_hover", "ms_cursor2.png", CURSOR_SIZE)
+    return sprites
+
+
+class DirtyRenderer:
+    # Redraws only the parts of the screen whose layers changed since the last frame.
+    # Layers are (surface, rect) pairs in draw order; a layer counts as changed when its surface
+    # object or rect differs from last frame (TextCache hands back the same surface for the same
+    # text, so unchanged labels compare equal). full_redraw=True falls back to fill + flip.
+    def __init__(self, screen, full_redraw=False, clear_color=(0, 0, 0)):
+        self.screen = screen
+        self.full_redraw = full_redraw
+        self.clear_color = clear_color
+        self._last_layers = None
+        # Running totals for profiling: time compositing layers vs. pushing them to the display
+        self.blit_seconds = 0.0
+        self.flip_seconds = 0.0
+
+    def invalidate(self):
+        self._last_layers = None
+
+    def draw(self, layers, overlay=None):
+        # overlay: optional callable(screen) drawn on top of the layers (debug boxes etc.)
+        layers = [(surface, pygame.Rect(rect)) for surface, rect in layers]
+        screen_rect = self.screen.get_rect()
+
+        if self.full_redraw or self._last_layers is None or len(layers) != len(self._last_layers):
+            dirty = [screen_rect]
+        else:
+            dirty = []
+            for (old_surface, old_rect), (surface, rect) in zip(self._last_layers, layers):
+                if old_surface is not surface or old_rect != rect:
+                    dirty.append(old_rect)
+                    dirty.append(rect)
+        self._last_layers = layers
+        if not dirty:
+            return dirty
+
+        start = time.perf_counter()
+        for area in dirty:
+            self.screen.set_clip(area)
+            self.screen.fill(self.clear_color)
+            for surface, rect in layers:
+                if rect.colliderect(area):
+                    self.screen.blit(surface, rect)
+            if overlay is not None:
+                overlay(self.screen)
+        self.screen.set_clip(None)
+        flip_start = time.perf_counter()
+        self.blit_seconds += flip_start - start
+
+        if dirty[0] == screen_rect:
+            pygame.display.flip()
+        else:
+            pygame.display.update(dirty)
+        self.flip_seconds += time.perf_counter() - flip_start
+        return dirty
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+
+from cache import make_key, normalize_prompt
+from world_store import write_bytes, write_json
+
+# Record/replay of backend calls for fast, deterministic pipeline runs (CI regression generations,
+# benchmarks) without the network. Every interaction is stored under a fingerprint computed once
+# from its normalized request: the backend, the model, the whitespace-normalized prompt and any
+# parameters that change the answer. Vision calls include a digest of the image, so scenes whose
+# items share names don't get each other's coordinates; a replayed world's images come from the
+# cassette byte for byte, so their digests still match.
+# Lookups are a dict hit on the fingerprint instead of re-normalizing and comparing every recorded
+# body. A cassette is a directory: index.json holds the fingerprints and text responses, binary
+# responses (SD3 images) go in side files next to it.
+#
+# Modes, per backend (openai, vision, sd3, ollama):
+#   off     call the backend
+#   record  call the backend and store the response (overwriting)
+#   replay  serve stored responses; a request that isn't in the cassette is an error
+#   hybrid  serve stored responses, call and record the ones that are missing
+
+REPLAY_MODE = os.getenv("GEN_REPLAY", "off")
+CASSETTE_DIR = os.getenv("GEN_CASSETTE", os.path.join("fixtures", "cassettes", "default"))
+BACKENDS = ("openai", "vision", "sd3", "ollama")
+MODES = ("off", "record", "replay", "hybrid")
+
+
+class CassetteMiss(Exception):
+    pass
+
+
+def fingerprint(backend, model, prompt, **params):
+    return make_key(f"{backend}:{model}", prompt, **params)
+
+
+class Cassette:
+    def __init__(self, directory=CASSETTE_DIR, mode=REPLAY_MODE, backend_modes=None):
+        self.directory = directory
+        # GEN_REPLAY_<BACKEND> overrides the mode for one backend
+        self.modes = {backend: os.getenv(f"GEN_REPLAY_{backend.upper()}", mode) for backend in BACKENDS}
+        self.modes.update(backend_modes or {})
+        for backend, backend_mode in self.modes.items():
+            if backend_mode not in MODES:
+                raise ValueError(f"unknown replay mode {backend_mode!r} for {backend} (expected one of {', '.join(MODES)})")
+        self.hits = 0
+        self.misses = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._index = None
+
+    def mode(self, backend):
+        return self.modes.get(backend, "off")
+
+    def _load(self):
+        # Caller holds the lock
+        if self._index is None:
+            try:
+                with open(os.path.join(self.directory, "index.json")) as f:
+                    self._index = json.load(f)["interactions"]
+            except FileNotFoundError:
+                self._index = {}
+        return self._index
+
+    def call(self, backend, model, prompt, fn, side_file=None, **params):
+        # Returns fn()'s bytes, or the recorded bytes for the same request, according to the mode.
+        # side_file: extension to store the response under in its own file instead of index.json
+        mode = self.mode(backend)
+        if mode == "off":
+            return fn()
+        key = fingerprint(backend, model, prompt, **params)
+        if mode in ("replay", "hybrid"):
+            data = self._lookup(key)
+            if data is not None:
+                with self._lock:
+                    self.hits += 1
+                return data
+            with self._lock:
+                self.misses += 1
+            if mode == "replay":
+                raise CassetteMiss(f"{backend} request not in cassette {self.directory}: {normalize_prompt(prompt)[:120]!r}")
+        data = fn()
+        self._record(key, backend, model, prompt, data, side_file, params)
+        return data
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._load().get(key)
+        if entry is None:
+            return None
+        if "file" in entry:
+            try:
+                with open(os.path.join(self.directory, entry["file"]), "rb") as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+        return entry["text"].encode("utf-8")
+
+    def _record(self, key, backend, model, prompt, data, side_file, params):
+        entry = {"backend": backend, "model": model, "prompt": normalize_prompt(prompt), "params": {name: str(value) for name, value in params.items()}}
+        os.makedirs(self.directory, exist_ok=True)
+        if side_file:
+            entry["file"] = f"{backend}-{key[:16]}{side_file}"
+            write_bytes(os.path.join(self.directory, entry["file"]), data)
+        else:
+            entry["text"] = data.decode("utf-8")
+        with self._lock:
+            self._load()[key] = entry
+            self.recorded += 1
+            # Written out whole on every record; cassettes hold tens of interactions, not thousands
+            write_json(os.path.join(self.directory, "index.json"), {"version": 1, "interactions": self._index}, sort_keys=True)
+
+    def stats(self):
+        with self._lock:
+            return {"modes": dict(self.modes), "hits": self.hits, "misses": self.misses, "recorded": self.recorded}
+
+
+cassette = Cassette()
+
+
+def use_cassette(directory=None, mode=None):
+    # Swap the process-wide cassette (main.py --replay / --cassette)
+    global cassette
+    cassette = Cassette(directory or CASSETTE_DIR, mode or REPLAY_MODE)
+    return cassette
+
+
+def recorded(backend, model, prompt, fn, side_file=None, **params):
+    return cassette.call(backend, model, prompt, fn, side_file, **params)
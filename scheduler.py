@@ -0,0 +1,209 @@
+import os
+import random
+import threading
+import time
+
+import openai
+import requests
+
+from tracing import span
+
+# Request scheduler for the generation backends. Every network call goes through the limiter for
+# its backend, which caps concurrent requests, spaces them out with a token bucket, and retries
+# 429 / 5xx / connection errors with exponential backoff (honoring Retry-After when given).
+
+
+class RetryableError(Exception):
+    def __init__(self, message, status_code=None, retry_after=None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def parse_retry_after(headers):
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def check_response(response):
+    # Raise RetryableError for responses worth retrying (rate limited or server-side failures)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(
+            f"HTTP {response.status_code}: {response.text[:200]}",
+            status_code=response.status_code,
+            retry_after=parse_retry_after(response.headers),
+        )
+
+
+def retry_delay(error):
+    # Seconds the server asked us to wait, if it said
+    if isinstance(error, RetryableError):
+        return error.retry_after
+    if isinstance(error, openai.APIStatusError):
+        return parse_retry_after(error.response.headers)
+    return None
+
+
+def is_retryable(error):
+    return isinstance(error, (
+        RetryableError,
+        openai.RateLimitError,
+        openai.InternalServerError,
+        openai.APIConnectionError,
+        requests.ConnectionError,
+        requests.Timeout,
+    ))
+
+
+class CallProgress:
+    # Where one limiter call is, for callers watching it from another thread (hedging.py): when the
+    # request now in flight got its slot (None while queued or backing off), how long the request
+    # that succeeded took, how many retries it has needed, and whether it's over
+    def __init__(self):
+        self.changed = threading.Condition()
+        self.request_started = None
+        self.request_seconds = None
+        self.retries = 0
+        self.finished = False
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.changed.notify_all()
+
+
+class BackendLimiter:
+    def __init__(self, name, max_concurrency, requests_per_minute, max_retries=5, base_delay=1.0, max_delay=30.0):
+        self.name = name
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        # Token bucket: refills at requests_per_minute, bursts up to max_concurrency
+        self._rate = requests_per_minute / 60.0
+        self._capacity = float(max_concurrency)
+        self._tokens = self._capacity
+        self._refilled_at = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.requests = 0
+        self.retries = 0
+        self.throttled_seconds = 0.0
+        # Calls holding a slot, and calls queued for a slot or a token
+        self.active = 0
+        self.waiting = 0
+
+    def _take_token(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self._capacity, self._tokens + (now - self._refilled_at) * self._rate)
+                self._refilled_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+                self.throttled_seconds += wait
+            time.sleep(wait)
+
+    def call(self, fn, *args, **kwargs):
+        return self.call_with_progress(CallProgress(), fn, args, kwargs)
+
+    def call_with_progress(self, progress, fn, args=(), kwargs=None, max_retries=None):
+        # call() reporting to progress as it goes; max_retries overrides the limiter's
+        max_retries = self.max_retries if max_retries is None else max_retries
+        try:
+            return self._attempts(progress, fn, args, kwargs or {}, max_retries)
+        finally:
+            progress.update(request_started=None, finished=True)
+
+    def _attempts(self, progress, fn, args, kwargs, max_retries):
+        attempt = 0
+        while True:
+            with self._lock:
+                self.waiting += 1
+            with span(f"{self.name}.wait", "scheduler"):
+                self._take_token()
+                self._slots.acquire()
+            with self._lock:
+                self.waiting -= 1
+                self.active += 1
+                self.requests += 1
+            started = time.monotonic()
+            progress.update(request_started=started)
+            try:
+                with span(f"{self.name}.request", "scheduler", attempt=attempt):
+                    result = fn(*args, **kwargs)
+                progress.update(request_seconds=time.monotonic() - started)
+                return result
+            except Exception as e:
+                if not is_retryable(e) or attempt >= max_retries:
+                    raise
+                error = e
+                progress.update(request_started=None, retries=attempt + 1)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                self._slots.release()
+            # Back off outside the concurrency slot so other requests can proceed
+            delay = retry_delay(error)
+            if delay is None:
+                delay = min(self.max_delay, self.base_delay * (2 ** attempt)) * random.uniform(0.5, 1.0)
+            attempt += 1
+            with self._lock:
+                self.retries += 1
+            print(f"{self.name}: {error} - retry {attempt}/{max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def stats(self):
+        with self._lock:
+            return {"requests": self.requests, "retries": self.retries, "throttled_seconds": round(self.throttled_seconds, 2)}
+
+    def load(self):
+        with self._lock:
+            return {"active": self.active, "waiting": self.waiting, "max_concurrency": self.max_concurrency}
+
+    def saturated(self):
+        # Every slot is busy and more calls are queued behind them
+        with self._lock:
+            return self.active >= self.max_concurrency and self.waiting > 0
+
+
+limiters = {
+    "openai": BackendLimiter(
+        "openai",
+        max_concurrency=int(os.getenv("GEN_OPENAI_CONCURRENCY", "8")),
+        requests_per_minute=float(os.getenv("GEN_OPENAI_RPM", "500")),
+    ),
+    "sd3": BackendLimiter(
+        "sd3",
+        max_concurrency=int(os.getenv("GEN_SD3_CONCURRENCY", "4")),
+        requests_per_minute=float(os.getenv("GEN_SD3_RPM", "600")),
+    ),
+    "ollama": BackendLimiter(
+        "ollama",
+        max_concurrency=int(os.getenv("GEN_OLLAMA_CONCURRENCY", "1")),
+        requests_per_minute=float(os.getenv("GEN_OLLAMA_RPM", "600")),
+    ),
+}
+
+
+def schedule(backend, fn, *args, **kwargs):
+    return limiters[backend].call(fn, *args, **kwargs)
+
+
+def scheduler_stats():
+    return {name: limiter.stats() for name, limiter in limiters.items()}
+
+
+def backend_load():
+    return {name: limiter.load() for name, limiter in limiters.items()}
+
+
+def backends_saturated():
+    return any(limiter.saturated() for limiter in limiters.values())
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import uuid
+
+import pygame
+
+from world_store import write_json
+
+# Save/resume of a play session. What the player has done (current scene, puzzle progress as
+# bitsets, unlocked scenes, inventory, the interaction text on screen) is a small SessionState kept
+# apart from the world, which doesn't change once it's generated. On quit it's written to
+# session.json along with the backgrounds of the current scene and the scenes nearest it, as raw
+# pixels already scaled to the screen, so a resume reaches its first frame without decoding or
+# scaling a JPEG. A snapshot only resumes the world it was saved in.
+
+SESSION_FILE = os.getenv("GEN_SESSION", "session.json")
+# Scene backgrounds saved with a snapshot, current scene first (0 = state only)
+SNAPSHOT_SCENES = int(os.getenv("GEN_SNAPSHOT_SCENES", "3"))
+SNAPSHOT_VERSION = 1
+PIXEL_FORMAT = "RGB"
+
+
+def world_key(world):
+    # Identifies a world across index rewrites: its ready scenes change while it's generated, its
+    # scenes and puzzles don't
+    identity = json.dumps([world.start_scene, world.scene_names, world.puzzles], sort_keys=True)
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+
+
+class SessionState:
+    def __init__(self, current_scene, puzzle_progress=None, unlocked_scenes=(), inventory=(), interaction_text=None):
+        self.current_scene = current_scene
+        # puzzle name -> bitset of the requirements met (PuzzleEngine.snapshot())
+        self.puzzle_progress = dict(puzzle_progress or {})
+        self.unlocked_scenes = sorted(unlocked_scenes)
+        # (scene name, item name) of picked-up items, oldest first
+        self.inventory = [tuple(entry) for entry in inventory]
+        # (text, (r, g, b)) on screen when the session ended, or None
+        self.interaction_text = tuple(interaction_text) if interaction_text else None
+
+    def to_dict(self):
+        return {
+            "current_scene": self.current_scene,
+            "puzzle_progress": self.puzzle_progress,
+            "unlocked_scenes": self.unlocked_scenes,
+            "inventory": [list(entry) for entry in self.inventory],
+            "interaction_text": [self.interaction_text[0], list(self.interaction_text[1])] if self.interaction_text else None,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        text = data.get("interaction_text")
+        return cls(data["current_scene"], data.get("puzzle_progress"), data.get("unlocked_scenes", ()), data.get("inventory", ()),
+                   (text[0], tuple(text[1])) if text else None)
+
+
+def read_snapshot(world, path=SESSION_FILE):
+    # The snapshot at path if it was saved in this world, else None
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION or snapshot.get("world") != world_key(world):
+        return None
+    try:
+        if snapshot["state"]["current_scene"] not in world.ready_scenes:
+            return None
+    except (KeyError, TypeError):
+        return None
+    return snapshot
+
+
+def save_session(state, world, scene_assets=None, path=SESSION_FILE):
+    # Pixels go in their own file (named per save, so session.json never points at a half-written
+    # one), then session.json, then the previous save's pixels are removed
+    directory = os.path.dirname(path) or "."
+    previous_pixels = pixels_path(path)
+    surfaces = []
+    if scene_assets is not None and SNAPSHOT_SCENES > 0:
+        for scene_name in world.reachable(state.current_scene):
+            surface = scene_assets.cached(scene_name)
+            if surface is not None:
+                surfaces.append((scene_name, surface))
+            if len(surfaces) == SNAPSHOT_SCENES:
+                break
+
+    entries = []
+    pixels_file = None
+    if surfaces:
+        pixels_file = f"{os.path.splitext(os.path.basename(path))[0]}_{uuid.uuid4().hex[:8]}.raw"
+        offset = 0
+        with open(os.path.join(directory, pixels_file), "wb") as f:
+            for scene_name, surface in surfaces:
+                pixels = pygame.image.tobytes(surface, PIXEL_FORMAT)
+                f.write(pixels)
+                entries.append({"scene": scene_name, "size": list(surface.get_size()), "offset": offset, "length": len(pixels)})
+                offset += len(pixels)
+
+    write_json(path, {"version": SNAPSHOT_VERSION, "world": world_key(world), "state": state.to_dict(),
+                      "pixels": pixels_file, "surfaces": entries})
+    if previous_pixels is not None:
+        remove_file(previous_pixels)
+
+
+def load_session(world, path=SESSION_FILE):
+    # (SessionState, [(scene name, surface)]) saved in this world, or None. The surfaces share
+    # one buffer read straight from disk and aren't converted to the display format yet.
+    # A damaged snapshot is a fresh start; missing or truncated pixels only cost the saved backgrounds.
+    snapshot = read_snapshot(world, path)
+    if snapshot is None:
+        return None
+    try:
+        state = SessionState.from_dict(snapshot["state"])
+    except (KeyError, TypeError, ValueError, IndexError):
+        return None
+    surfaces = []
+    if snapshot.get("pixels"):
+        try:
+            with open(os.path.join(os.path.dirname(path) or ".", snapshot["pixels"]), "rb") as f:
+                pixels = memoryview(f.read())
+        except OSError:
+            pixels = memoryview(b"")
+        for entry in snapshot.get("surfaces", ()):
+            try:
+                width, height = entry["size"]
+                chunk = pixels[entry["offset"]:entry["offset"] + entry["length"]]
+                # frombuffer raises on a buffer that doesn't match the size
+                if len(chunk) == entry["length"] == width * height * len(PIXEL_FORMAT):
+                    surfaces.append((entry["scene"], pygame.image.frombuffer(chunk, (width, height), PIXEL_FORMAT)))
+            except (KeyError, TypeError, ValueError):
+                continue
+    return state, surfaces
+
+
+def pixels_path(path=SESSION_FILE):
+    # The pixels file of the snapshot at path, whatever world it was saved in
+    try:
+        with open(path) as f:
+            pixels_file = json.load(f).get("pixels")
+    except (OSError, ValueError):
+        return None
+    return os.path.join(os.path.dirname(path) or ".", pixels_file) if pixels_file else None
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clear_session(path=SESSION_FILE):
+    # Starting a new world: drop the snapshot and its pixels
+    pixels = pixels_path(path)
+    if pixels is not None:
+        remove_file(pixels)
+    remove_file(path)
@@ -0,0 +1,94 @@
+import json
+import os
+import re
+
+# Canned replies for the generation prompts, so the pipeline can run with no model at all: the
+# in-process "stub" text backend (GEN_TEXT_BACKEND=stub) and bench/stub_server.py both answer
+# from here. Two-scene prompts get the hand-written fixture, bigger worlds a synthetic corridor.
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "bench", "fixtures")
+
+
+def load_world_fixture():
+    with open(os.path.join(FIXTURE_DIR, "world.json")) as f:
+        return f.read()
+
+
+def make_world(num_scenes):
+    # Synthetic N-scene world: a corridor of rooms, each door locked behind a lever in the room before
+    scenes = {}
+    names = ["START_Room_0"] + [f"Room_{i}" for i in range(1, num_scenes)]
+    for i, name in enumerate(names):
+        items = {}
+        if i > 0:
+            items["back_door"] = {"description": "The way back.", "interactions": {"use": "Back you go."}, "leads_to": names[i - 1]}
+        if i < num_scenes - 1:
+            items[f"door_{i}"] = {"description": "A sturdy door.", "interactions": {"use": "It swings open."}, "leads_to": names[i + 1]}
+            items[f"lever_{i}"] = {"description": "Pull me, maybe.", "interactions": {"use": "Clunk!"}, "leads_to": "n/a"}
+        for j in range(7 - len(items)):
+            items[f"thing_{i}_{j}"] = {"description": "Decorative.", "interactions": {"look": "Nice."}, "leads_to": "n/a"}
+        scenes[name] = {
+            "scene_description": f"Room number {i}, with " + ", ".join(items) + ".",
+            "items": items,
+            "is_locked": i > 0,
+            "hint": "Levers do things.",
+        }
+    puzzles = {
+        f"puzzle_{i}": {
+            "type": "item_usage",
+            "hint": "Try the lever.",
+            "completion_text": "Something unlocked!",
+            "requirements": [["use", f"lever_{i - 1}"]],
+            "result": {"unlocked_area": names[i]},
+        }
+        for i in range(1, num_scenes)
+    }
+    return json.dumps({"scenes": scenes, "puzzles": puzzles}, indent=2)
+
+
+def choose_world(num_scenes):
+    return load_world_fixture() if num_scenes == 2 else make_world(num_scenes)
+
+
+def outline_reply(world_json):
+    # The world cut down to what the outline prompt asks for
+    world = json.loads(world_json)
+    scenes = {
+        name: {"items": {item_name: item.get("leads_to", "n/a") for item_name, item in scene["items"].items()},
+               "is_locked": scene.get("is_locked", False)}
+        for name, scene in world["scenes"].items()
+    }
+    return json.dumps({"scenes": scenes, "puzzles": world["puzzles"]}, indent=2)
+
+
+def scene_detail_reply(world_json, scene_name):
+    scene = json.loads(world_json)["scenes"].get(scene_name, {})
+    items = {name: {"description": item.get("description", ""), "interactions": item.get("interactions", {})}
+             for name, item in scene.get("items", {}).items()}
+    return json.dumps({"scene_description": scene.get("scene_description", ""), "items": items, "hint": scene.get("hint", "")}, indent=2)
+
+
+def coordinates_reply(prompt):
+    # Vision prompt: a grid of positions for whatever items were asked about
+    match = re.search(r"Items: (.*?)\. If you're not sure", prompt)
+    names = match.group(1).split(",") if match else []
+    lines = []
+    for i, name in enumerate(names):
+        lines.append(f"{name},{0.1 + (i % 4) * 0.25:.2f},{0.3 + (i // 4) * 0.4:.2f}")
+    return "\n".join(lines)
+
+
+def reply_text(prompt, world_json=None):
+    # world_json=None: pick a world to fit the number of scenes the prompt asks for
+    match = re.search(r"OUTLINE of the game as a JSON object\. Number of scenes: (\d+)", prompt)
+    if match:
+        return outline_reply(world_json or choose_world(int(match.group(1))))
+    match = re.search(r"The game's scenes: (.*)\.\n\s*Write the scene \"(.*)\"", prompt)
+    if match:
+        return scene_detail_reply(world_json or choose_world(len(match.group(1).split(", "))), match.group(2))
+    if world_json is not None:
+        return world_json
+    match = re.search(r"1\. (\d+) scenes, each with", prompt)
+    if match:
+        return make_world(int(match.group(1)))
+    return load_world_fixture()
@@ -0,0 +1,18 @@
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TESTS_DIR)
+sys.path.insert(0, REPO_DIR)
+sys.path.insert(0, os.path.join(REPO_DIR, "bench"))
+
+# Set before the modules under test read them at import: no generation cache, no latency history
+# or repair stats left behind in the checkout, no window
+_scratch = tempfile.mkdtemp(prefix="gen-tests-")
+os.environ.setdefault("GEN_CACHE", "0")
+os.environ.setdefault("GEN_LATENCY_HISTORY", os.path.join(_scratch, "latency_history.json"))
+os.environ.setdefault("GEN_REPAIR_STATS", os.path.join(_scratch, "repair_stats.json"))
+os.environ.setdefault("OPENAI_API_KEY", "stub")
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
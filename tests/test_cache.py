@@ -0,0 +1,130 @@
+import os
+import threading
+import time
+
+import pytest
+
+from cache import DiskCache, make_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return DiskCache(directory=str(tmp_path / "cache"), max_bytes=1000, enabled=True)
+
+
+def entry_files(cache):
+    return sorted(name for _, _, files in os.walk(cache.directory) for name in files)
+
+
+def test_key_ignores_whitespace_but_not_parameters():
+    assert make_key("gpt-4", "a  haunted\n library ") == make_key("gpt-4", "a haunted library")
+    assert make_key("gpt-4", "a haunted library") != make_key("gpt-4o", "a haunted library")
+    assert make_key("sd3", "x", aspect_ratio="3:2") != make_key("sd3", "x", aspect_ratio="1:1")
+    assert make_key("gpt-4o", "x", image_bytes=b"one") != make_key("gpt-4o", "x", image_bytes=b"two")
+
+
+def test_put_then_get(cache):
+    key = make_key("gpt-4", "prompt")
+    assert cache.get(key) is None
+    cache.put(key, b"reply")
+    assert cache.get(key) == b"reply"
+    # Written through a temp file that's been renamed away
+    assert entry_files(cache) == [key]
+
+
+def test_disabled_cache_stores_nothing(tmp_path):
+    cache = DiskCache(directory=str(tmp_path / "cache"), enabled=False)
+    cache.put("ab" * 32, b"reply")
+    assert cache.get("ab" * 32) is None
+    assert not os.path.exists(cache.directory)
+
+
+def test_concurrent_misses_compute_once(cache):
+    calls = []
+    start = threading.Barrier(8)
+    results = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return b"image"
+
+    def worker():
+        start.wait()
+        results.append(cache.get_or_compute("cd" * 32, compute))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert results == [b"image"] * 8
+    assert cache.misses == 1 and cache.hits == 7
+    assert cache.get_or_compute("cd" * 32, compute) == b"image" and len(calls) == 1
+
+
+def test_failed_compute_reaches_every_waiter_and_is_not_cached(cache):
+    start = threading.Barrier(4)
+    errors = []
+
+    def compute():
+        time.sleep(0.1)
+        raise RuntimeError("HTTP 500")
+
+    def worker():
+        start.wait()
+        try:
+            cache.get_or_compute("ef" * 32, compute)
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(errors) == 4
+    assert cache.get("ef" * 32) is None
+    assert cache.get_or_compute("ef" * 32, lambda: b"ok") == b"ok"
+
+
+def test_least_recently_used_entries_are_evicted(cache):
+    keys = [f"{i:02d}" * 32 for i in range(4)]
+    for i, key in enumerate(keys[:3]):
+        cache.put(key, b"x" * 300)
+        # Distinct access times, oldest first
+        os.utime(cache._path(key), (1000 + i, 1000 + i))
+    # Reading the oldest makes it the most recently used
+    assert cache.get(keys[0]) is not None
+    cache.put(keys[3], b"x" * 300)
+    assert cache.get(keys[1]) is None
+    assert all(cache.get(key) is not None for key in (keys[0], keys[2], keys[3]))
+
+
+def test_puts_under_the_limit_do_not_walk_the_cache(cache):
+    cache.max_bytes = 100000
+    for i in range(50):
+        cache.put(f"{i:02d}" * 32, b"x" * 100)
+    # One walk to learn the size, then a running total
+    assert cache.walks == 1
+    cache.max_bytes = 2000
+    cache.put("ff" * 32, b"x" * 100)
+    assert cache.walks == 2
+    assert sum(os.path.getsize(cache._path(name)) for name in entry_files(cache)) <= 2000 * 0.9
+    # Back under the limit: no walk on the next put
+    cache.put("fe" * 32, b"x" * 100)
+    assert cache.walks == 2
+
+
+def test_cache_keys_depend_on_the_endpoint(monkeypatch):
+    import http_clients
+    import main
+
+    keys = []
+    monkeypatch.setattr(main.generation_cache, "get_or_compute", lambda key, compute: keys.append(key) or b"reply")
+    for url in ("http://127.0.0.1:8765/v1", None):
+        monkeypatch.setattr(http_clients, "OPENAI_BASE_URL", url)
+        main.call_openai("a haunted library")
+    assert keys[0] != keys[1]
+    assert http_clients.base_url("openai") == http_clients.OPENAI_DEFAULT_BASE_URL
@@ -0,0 +1,101 @@
+import json
+import os
+
+import pytest
+
+import game_json
+from game_json import GameJsonError, record_repair_outcome, repair_game_data, repair_game_json
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures", "world.json")
+
+
+def fixture_world():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def chain_world(num_scenes):
+    # START_Room_0 -> Room_1 -> ... each locked behind a puzzle on an item in the room before it
+    names = ["START_Room_0"] + [f"Room_{i}" for i in range(1, num_scenes)]
+    scenes = {}
+    puzzles = {}
+    for i, name in enumerate(names):
+        items = {f"lever_{i}": {"description": "A lever.", "interactions": {"use": "Clunk."}, "leads_to": "n/a"}}
+        if i + 1 < num_scenes:
+            items[f"door_{i}"] = {"description": "A door.", "interactions": {"use": "It opens."}, "leads_to": names[i + 1]}
+            puzzles[f"puzzle_{i}"] = {"requirements": [["use", f"lever_{i}"]], "result": {"unlocked_area": names[i + 1]},
+                                      "completion_text": "Something opened."}
+        scenes[name] = {"scene_description": f"Room {i}.", "items": items, "is_locked": i > 0}
+    return {"scenes": scenes, "puzzles": puzzles}
+
+
+def test_fixture_world_needs_no_repairs():
+    _, repairs = repair_game_data(fixture_world())
+    assert repairs == []
+
+
+def test_repairs_syntax_names_and_actions():
+    world = fixture_world()
+    puzzle = next(iter(world["puzzles"].values()))
+    puzzle["requirements"] = [["examine", "Globe"]]
+    # Fenced, with chatter around it and a trailing comma after the first item's leads_to
+    text = "Here you go:\n```json\n" + json.dumps(world, indent=1).replace('"leads_to": "n/a"\n', '"leads_to": "n/a",\n', 1) + "\n```"
+    game_data, repairs = repair_game_json(text)
+    assert "syntax" in repairs
+    assert next(iter(game_data["puzzles"].values()))["requirements"] == [["look", "globe"]]
+
+
+def test_unnested_requirement_is_wrapped():
+    world = fixture_world()
+    puzzle = next(iter(world["puzzles"].values()))
+    puzzle["requirements"] = ["use", "globe"]
+    game_data, _ = repair_game_data(world)
+    assert next(iter(game_data["puzzles"].values()))["requirements"] == [["use", "globe"]]
+
+
+@pytest.mark.parametrize("break_world", [
+    lambda world: world["scenes"].update(Moonlit_Garden="a garden"),
+    lambda world: world["scenes"]["START_Dusty_Library"]["items"].update(globe="a globe"),
+    lambda world: world["puzzles"].update({name: "spin the globe" for name in world["puzzles"]}),
+    lambda world: [puzzle.update(result="Moonlit_Garden") for puzzle in world["puzzles"].values()],
+    lambda world: [puzzle.update(requirements={"use": "globe"}) for puzzle in world["puzzles"].values()],
+    lambda world: [puzzle.update(requirements=[["use"]]) for puzzle in world["puzzles"].values()],
+])
+def test_malformed_shapes_raise_game_json_error(break_world):
+    world = fixture_world()
+    break_world(world)
+    with pytest.raises(GameJsonError):
+        repair_game_json(json.dumps(world))
+
+
+def test_chained_world_is_reachable():
+    _, repairs = repair_game_data(chain_world(4))
+    assert repairs == []
+
+
+def test_locked_scene_nothing_leads_to_is_rejected():
+    world = chain_world(3)
+    world["scenes"]["Room_1"]["items"]["door_1"]["leads_to"] = "n/a"
+    with pytest.raises(GameJsonError, match="Room_2"):
+        repair_game_data(world)
+
+
+def test_puzzle_needing_an_item_behind_its_own_lock_is_rejected():
+    world = chain_world(3)
+    world["puzzles"]["puzzle_0"]["requirements"] = [["use", "lever_2"]]
+    with pytest.raises(GameJsonError, match="Room_1, Room_2"):
+        repair_game_data(world)
+
+
+def test_repair_stats_are_counted(monkeypatch, tmp_path):
+    monkeypatch.setattr(game_json, "STATS_FILE", str(tmp_path / "repair_stats.json"))
+    record_repair_outcome("valid")
+    assert record_repair_outcome("valid") == {"valid": 2}
+    with open(tmp_path / "repair_stats.json") as f:
+        assert json.load(f) == {"valid": 2}
+    assert os.listdir(tmp_path) == ["repair_stats.json"]
+
+
+def test_unwritable_repair_stats_do_not_fail_generation(monkeypatch, tmp_path):
+    monkeypatch.setattr(game_json, "STATS_FILE", str(tmp_path / "missing" / "repair_stats.json"))
+    assert record_repair_outcome("llm_fallback") == {"llm_fallback": 1}
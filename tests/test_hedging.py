@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import hedging
+import http_clients
+import scheduler
+from hedging import Hedger
+from scheduler import BackendLimiter, RetryableError
+from stub_server import StubState, make_jpeg, start_stub_server
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    limiter = BackendLimiter("test", max_concurrency=4, requests_per_minute=60000, base_delay=0.01)
+    monkeypatch.setitem(scheduler.limiters, "test", limiter)
+    return limiter
+
+
+def warm_hedger(**options):
+    # Hedges once a request has been at the backend for 50ms
+    hedger = Hedger("test", "test", min_samples=1, max_rate=1.0, **options)
+    hedger.load_history([0.05] * 10)
+    return hedger
+
+
+def sequence(*behaviours):
+    # fn whose nth call does behaviours[n]: a number sleeps that long and returns it, an exception is raised
+    calls = []
+    lock = threading.Lock()
+
+    def fn():
+        with lock:
+            behaviour = behaviours[min(len(calls), len(behaviours) - 1)]
+            calls.append(time.monotonic())
+        if isinstance(behaviour, Exception):
+            raise behaviour
+        time.sleep(behaviour)
+        return behaviour
+
+    return fn, calls
+
+
+def test_fast_call_is_not_hedged(limiter):
+    hedger = warm_hedger()
+    fn, calls = sequence(0.0)
+    assert hedger.call(fn) == 0.0
+    assert len(calls) == 1 and hedger.hedges == 0
+
+
+def test_slow_call_is_hedged_and_first_success_wins(limiter):
+    hedger = warm_hedger()
+    fn, calls = sequence(1.0, 0.01)
+    start = time.monotonic()
+    assert hedger.call(fn) == 0.01
+    assert time.monotonic() - start < 0.5
+    assert len(calls) == 2 and calls[1] - calls[0] >= 0.05
+    assert hedger.stats()["hedges"] == 1 and hedger.hedge_wins == 1
+
+
+def test_primary_can_still_win_after_a_hedge(limiter):
+    hedger = warm_hedger()
+    fn, calls = sequence(0.1, 1.0)
+    assert hedger.call(fn) == 0.1
+    assert hedger.hedges == 1 and hedger.hedge_wins == 0
+
+
+def test_no_hedge_while_backing_off(limiter):
+    # The 429 backoff (0.3s) is far past the hedge delay, but a retrying call means the backend is
+    # already struggling
+    hedger = warm_hedger()
+    fn, calls = sequence(RetryableError("HTTP 429", 429, retry_after=0.3), 0.0)
+    assert hedger.call(fn) == 0.0
+    assert len(calls) == 2 and hedger.hedges == 0
+    assert limiter.retries == 1
+
+
+def test_no_hedge_while_the_backend_is_saturated(limiter):
+    # One slot, held by the call being hedged, and another call queued behind it
+    limiter.max_concurrency = 1
+    limiter._slots = threading.BoundedSemaphore(1)
+    hedger = warm_hedger()
+    fn, calls = sequence(0.3)
+    waiter = threading.Timer(0.01, limiter.call, args=(time.sleep, 0.0))
+    waiter.start()
+    assert hedger.call(fn) == 0.3
+    waiter.join()
+    assert len(calls) == 1 and hedger.hedges == 0
+
+
+def test_queue_wait_is_not_latency(limiter):
+    # Queued behind another request for 0.3s, then 0.01s at the backend: no hedge, and only the
+    # 0.01s goes into the history the hedge delay comes from
+    limiter.max_concurrency = 1
+    limiter._slots = threading.BoundedSemaphore(1)
+    hedger = warm_hedger()
+    blocker = threading.Thread(target=limiter.call, args=(time.sleep, 0.3))
+    blocker.start()
+    time.sleep(0.05)
+    fn, calls = sequence(0.01)
+    assert hedger.call(fn) == 0.01
+    blocker.join()
+    assert hedger.hedges == 0
+    assert hedger.history[-1] < 0.1
+    assert hedger.latencies[-1] >= 0.2
+
+
+def test_budget_raises_timeout_error(limiter):
+    hedger = warm_hedger(budget=0.2)
+    fn, calls = sequence(1.0)
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        hedger.call(fn)
+    assert time.monotonic() - start < 0.5
+    assert hedger.timeouts == 1
+
+
+def test_losing_request_is_recorded(limiter):
+    # The hedge wins; the primary's 0.4s still belongs in the history, or the delay only ever sees fast requests
+    hedger = warm_hedger()
+    fn, calls = sequence(0.4, 0.01)
+    assert hedger.call(fn) == 0.01
+    assert len(hedger.history) == 11
+    time.sleep(0.5)
+    assert len(hedger.history) == 12 and max(hedger.history) >= 0.4
+
+
+def test_timed_out_requests_are_recorded_once(limiter):
+    hedger = warm_hedger(budget=0.2)
+    fn, calls = sequence(0.5)
+    with pytest.raises(TimeoutError):
+        hedger.call(fn)
+    # The primary and its hedge, for as long as they'd run
+    new = list(hedger.history)[10:]
+    assert len(new) == 2 and max(new) >= 0.19
+    # Not counted again when they finally answer
+    time.sleep(0.5)
+    assert len(hedger.history) == 12
+
+
+def test_hedge_cap_holds_from_the_first_call(limiter):
+    hedger = Hedger("test", "test", min_samples=1, max_rate=0.5)
+    hedger.load_history([0.05] * 10)
+    fn, calls = sequence(0.2)
+    hedger.call(fn)
+    assert hedger.hedges == 0
+    hedger.call(fn)
+    assert hedger.hedges == 1
+
+
+def test_latency_history_is_kept_per_endpoint(monkeypatch, tmp_path):
+    path = str(tmp_path / "latency_history.json")
+    stub, real = "http://127.0.0.1:8765/v1", None
+
+    def loaded(url):
+        # A fresh process's vision history against url
+        monkeypatch.setattr(http_clients, "OPENAI_BASE_URL", url)
+        monkeypatch.setitem(hedging.hedgers, "vision", Hedger("vision", "openai"))
+        hedging.load_latency_history(path)
+        return hedging.hedgers["vision"]
+
+    loaded(stub).load_history([0.01] * 3)
+    hedging.save_latency_history(path)
+    # A stub run doesn't set the real API's hedge delay
+    assert loaded(real).history_snapshot() == []
+    hedging.hedgers["vision"].load_history([2.0] * 3)
+    hedging.save_latency_history(path)
+    assert loaded(stub).history_snapshot() == [0.01] * 3
+    assert loaded(real).history_snapshot() == [2.0] * 3
+
+
+def test_errors_are_raised_when_nothing_succeeds(limiter):
+    hedger = warm_hedger()
+    fn, calls = sequence(ValueError("bad request"))
+    with pytest.raises(ValueError):
+        hedger.call(fn)
+    assert len(calls) == 1
+
+
+def test_vision_over_budget_places_items_in_the_middle(monkeypatch, tmp_path):
+    import main
+
+    server, base_url = start_stub_server(state=StubState(image_bytes=b"", vision_latency="1"))
+    try:
+        monkeypatch.setattr(http_clients, "OPENAI_BASE_URL", base_url + "/v1")
+        monkeypatch.setattr(http_clients, "_openai_client", None)
+        monkeypatch.setitem(hedging.hedgers, "vision", Hedger("vision", "openai", budget=0.3, enabled=False))
+        image = os.path.join(tmp_path, "scene_Hall")
+        with open(image + ".jpeg", "wb") as f:
+            f.write(make_jpeg(384, 256))
+        image_future = Future()
+        image_future.set_result([image])
+
+        start = time.monotonic()
+        scene_name, coords = main.process_scene(("Hall", {"items": {"lamp": {}, "desk": {}}}), image_future, str(tmp_path))
+        assert time.monotonic() - start < 1.5
+        assert scene_name == "Hall"
+        assert coords == {"lamp": (0.5, 0.5), "desk": (0.5, 0.5)}
+        assert hedging.hedgers["vision"].timeouts == 1
+    finally:
+        # Let the abandoned request get its answer before the stub goes away, or it retries into the void
+        hedging.hedgers["vision"]._pool.shutdown(wait=True)
+        server.shutdown()
@@ -0,0 +1,89 @@
+import json
+
+import pytest
+
+from json_stream import SceneDescriptionStream
+
+WORLD = {
+    "scenes": {
+        "START_Wizard's Tower": {
+            "scene_description": 'A "tower" full of \\ slashes, a tab\there and été \U0001f9d9',
+            "items": {"staff": {"description": "Not a \"scene_description\".", "interactions": {"use": "{[,]}"}, "leads_to": "Cellar"}},
+            "is_locked": False,
+        },
+        "Cellar": {
+            "items": {"barrel": {"description": "Round.", "interactions": {}, "leads_to": "n/a"}},
+            "scene_description": "Damp.\nVery damp.",
+            "is_locked": True,
+        },
+    },
+    "puzzles": {"p1": {"requirements": [["use", "staff"]], "result": {"unlocked_area": "Cellar"}, "scene_description": "not a scene"}},
+}
+
+EXPECTED = [(name, scene["scene_description"]) for name, scene in WORLD["scenes"].items()]
+
+
+def stream(chunks, **options):
+    found = []
+    parser = SceneDescriptionStream(lambda name, description: found.append((name, description)), **options)
+    for chunk in chunks:
+        parser.feed(chunk)
+    return found, parser
+
+
+@pytest.mark.parametrize("text", [
+    json.dumps(WORLD),
+    json.dumps(WORLD, indent=2, ensure_ascii=False),
+])
+def test_every_split_point(text):
+    # Two chunks split at every position: inside escapes (\", \\, \uXXXX), keys, and structure
+    for split in range(len(text) + 1):
+        found, _ = stream([text[:split], text[split:]])
+        assert found == EXPECTED, f"split at {split}: {text[max(0, split - 10):split]!r}|{text[split:split + 10]!r}"
+
+
+def test_one_character_at_a_time():
+    text = json.dumps(WORLD, indent=1)
+    found, parser = stream(text)
+    assert found == EXPECTED
+    assert parser.finished and parser.getvalue() == text
+
+
+def test_fences_and_chatter_are_skipped():
+    text = "Sure! Here is your world:\n```json\n" + json.dumps(WORLD, indent=2) + "\n```\nEnjoy {the game}!"
+    found, parser = stream([text[i:i + 7] for i in range(0, len(text), 7)])
+    assert found == EXPECTED
+    # Everything after the closing brace is ignored, but kept for the full-document parse
+    assert parser.finished and parser.getvalue() == text
+
+
+def test_missing_and_trailing_commas():
+    text = """{
+      "scenes": {
+        "START_Hall": {
+          "scene_description": "A hall."
+          "items": {"door": {"interactions": {"use": "Creak."} "leads_to": "Garden",},},
+          "is_locked": false,
+        }
+        "Garden": {"is_locked": true "scene_description": "Roses."}
+      }
+      "puzzles": {}
+    }"""
+    found, _ = stream([text[i:i + 5] for i in range(0, len(text), 5)])
+    assert found == [("START_Hall", "A hall."), ("Garden", "Roses.")]
+
+
+def test_single_scene_document():
+    detail = {"items": {"lamp": {"scene_description": "nested, not this"}}, "scene_description": "A quiet \"study\".", "hint": "Look up."}
+    text = json.dumps(detail)
+    for split in range(len(text) + 1):
+        found, _ = stream([text[:split], text[split:]], scene_name="Study")
+        assert found == [("Study", 'A quiet "study".')]
+
+
+def test_truncated_description_is_not_reported():
+    text = json.dumps(WORLD)
+    cut = text.index("Damp.") + 3
+    found, parser = stream([text[:cut]])
+    assert found == EXPECTED[:1]
+    assert not parser.finished
@@ -0,0 +1,106 @@
+import asyncio
+import json
+import threading
+import time
+
+import pytest
+
+import main
+from game_json import GameJsonError, merge_scene_details, parse_outline
+
+
+def outline_text(puzzles):
+    return json.dumps({
+        "scenes": {"START_Hall": {"items": {"door": "Garden", "lamp": "n/a"}}, "Garden": {"items": ["rose"]}},
+        "puzzles": puzzles,
+    })
+
+
+def test_outline_is_normalized():
+    outline, repairs = parse_outline(outline_text({"p1": {"requirements": ["use", "lamp"], "result": {"unlocked_area": "Garden"}}}))
+    assert outline["scenes"]["Garden"]["items"] == {"rose": "n/a"}
+    assert outline["puzzles"]["p1"]["requirements"] == [["use", "lamp"]]
+    assert "Garden: item list" in repairs
+
+
+@pytest.mark.parametrize("puzzles", [
+    {"p1": "use the door"},
+    {"p1": {"requirements": "use the lamp"}},
+    {"p1": {"requirements": [["use", "lamp"]], "result": "Garden"}},
+    {"p1": {"requirements": [["use", 3]]}},
+])
+def test_malformed_outline_puzzles_raise_game_json_error(puzzles):
+    with pytest.raises(GameJsonError):
+        parse_outline(outline_text(puzzles))
+
+
+def test_merge_scene_details():
+    outline, _ = parse_outline(outline_text({"p1": {"requirements": [["use", "lamp"]], "result": {"unlocked_area": "Garden"}}}))
+    outline["scenes"]["Garden"]["is_locked"] = True
+    details = {
+        "START_Hall": json.dumps({"scene_description": "A hall.", "items": {"Door": {"description": "Oak.", "interactions": {"use": "Creak."}}}}),
+        "Garden": json.dumps({"scene_description": "A garden.", "items": {"rose": {"description": "Red.", "interactions": {"look": "Pretty."}}}}),
+    }
+    game_data, repairs = merge_scene_details(outline, details)
+    assert game_data["scenes"]["START_Hall"]["items"]["door"]["leads_to"] == "Garden"
+    assert "START_Hall/lamp: missing detail" in repairs
+    details["Garden"] = json.dumps({"items": {}})
+    with pytest.raises(GameJsonError):
+        merge_scene_details(outline, details)
+
+
+def test_fallback_world_does_not_reuse_the_outline_images(monkeypatch, tmp_path):
+    world = json.loads(json.dumps({
+        "scenes": {
+            "START_Hall": {"scene_description": "Fallback hall.", "is_locked": False, "items": {
+                "lamp": {"description": "Bright.", "interactions": {"use": "Click."}, "leads_to": "n/a"},
+                "door": {"description": "Oak.", "interactions": {"use": "Creak."}, "leads_to": "Garden"}}},
+            "Garden": {"scene_description": "Fallback garden.", "is_locked": True, "items": {
+                "rose": {"description": "Red.", "interactions": {"look": "Pretty."}, "leads_to": "n/a"}}},
+        },
+        "puzzles": {"p1": {"requirements": [["use", "lamp"]], "result": {"unlocked_area": "Garden"}, "completion_text": "Open."}},
+    }))
+    outline = outline_text({"p1": {"requirements": [["use", "lamp"]], "result": {"unlocked_area": "Garden"}}})
+    replies = {
+        "OUTLINE": outline,
+        "DETAIL START_Hall": json.dumps({"scene_description": "Outline hall.", "items": {}}),
+        # No scene_description: the details don't fit and the world is written in one call instead
+        "DETAIL Garden": json.dumps({"items": {}}),
+        "WORLD": json.dumps(world),
+    }
+
+    def call_text(prompt, on_text=None):
+        if on_text is not None:
+            on_text(replies[prompt])
+        return replies[prompt]
+
+    painted = []
+    lock = threading.Lock()
+
+    def paint(scene_name, scene_description, scene_items, output_dir="."):
+        start = time.monotonic()
+        time.sleep(0.2)
+        with lock:
+            painted.append((scene_name, scene_description, start, time.monotonic()))
+        return [scene_description]
+
+    placed = {}
+
+    def process_scene(scene, image_future=None, output_dir="."):
+        placed[scene[0]] = image_future.result() if image_future is not None else None
+        return scene[0], {}
+
+    monkeypatch.setitem(main.TEXT_BACKENDS, "fake", call_text)
+    monkeypatch.setattr(main, "generate_outline_prompt", lambda description, num_scenes: "OUTLINE")
+    monkeypatch.setattr(main, "generate_scene_detail_prompt", lambda description, outline, scene_name: "DETAIL " + scene_name)
+    monkeypatch.setattr(main, "generate_prompt_from_description", lambda description, num_scenes: "WORLD")
+    monkeypatch.setattr(main, "generate_images_for_scene_and_icons", paint)
+    monkeypatch.setattr(main, "process_scene", process_scene)
+    monkeypatch.setattr(main, "ITEM_ICONS", False)
+
+    asyncio.run(main.generate_world("a hall", num_scenes=2, prompt_mode="outline", output_dir=str(tmp_path), text_backend="fake"))
+    assert placed == {"START_Hall": ["Fallback hall."], "Garden": ["Fallback garden."]}
+    # The outline's hall was already painting; the fallback's hall is painted after it, not over it
+    outline_hall = next(entry for entry in painted if entry[1] == "Outline hall.")
+    fallback_hall = next(entry for entry in painted if entry[1] == "Fallback hall.")
+    assert fallback_hall[2] >= outline_hall[3]
@@ -0,0 +1,104 @@
+import json
+import os
+
+import pytest
+
+import replay
+from replay import Cassette, CassetteMiss, fingerprint
+
+
+def backend(reply):
+    # fn for Cassette.call that counts how often the backend was really called
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return reply
+
+    return fn, calls
+
+
+def unreachable():
+    raise AssertionError("the backend was called")
+
+
+def test_fingerprint_ignores_whitespace_but_not_the_request():
+    assert fingerprint("openai", "gpt-4", "a  haunted\n library ") == fingerprint("openai", "gpt-4", "a haunted library")
+    assert fingerprint("openai", "gpt-4", "x") != fingerprint("ollama", "gpt-4", "x")
+    assert fingerprint("openai", "gpt-4", "x") != fingerprint("openai", "gpt-4o", "x")
+    assert fingerprint("sd3", "sd3-ultra", "x", aspect_ratio="3:2") != fingerprint("sd3", "sd3-ultra", "x", aspect_ratio="1:1")
+
+
+def test_record_then_replay(tmp_path):
+    directory = str(tmp_path / "cassette")
+    fn, calls = backend(b"a story")
+    recorder = Cassette(directory, mode="record")
+    assert recorder.call("openai", "gpt-4", "Write a story", fn) == b"a story"
+    image_fn, _ = backend(b"\xff\xd8jpeg")
+    recorder.call("sd3", "sd3-ultra", "A hall", image_fn, side_file=".jpeg", aspect_ratio="3:2")
+    assert len(calls) == 1 and recorder.stats()["recorded"] == 2
+
+    # Binary responses live in their own files, text in the index
+    with open(os.path.join(directory, "index.json")) as f:
+        index = json.load(f)["interactions"]
+    image_entry = index[fingerprint("sd3", "sd3-ultra", "A hall", aspect_ratio="3:2")]
+    assert os.path.exists(os.path.join(directory, image_entry["file"]))
+    assert index[fingerprint("openai", "gpt-4", "Write a story")]["text"] == "a story"
+
+    player = Cassette(directory, mode="replay")
+    assert player.call("openai", "gpt-4", " Write  a story\n", unreachable) == b"a story"
+    assert player.call("sd3", "sd3-ultra", "A hall", unreachable, side_file=".jpeg", aspect_ratio="3:2") == b"\xff\xd8jpeg"
+    assert player.stats()["hits"] == 2
+
+
+def test_replay_miss_is_an_error(tmp_path):
+    player = Cassette(str(tmp_path / "empty"), mode="replay")
+    with pytest.raises(CassetteMiss, match="Write a story"):
+        player.call("openai", "gpt-4", "Write a story", unreachable)
+    assert player.stats()["misses"] == 1
+
+
+def test_hybrid_records_only_what_is_missing(tmp_path):
+    directory = str(tmp_path / "cassette")
+    Cassette(directory, mode="record").call("openai", "gpt-4", "first", backend(b"one")[0])
+
+    hybrid = Cassette(directory, mode="hybrid")
+    assert hybrid.call("openai", "gpt-4", "first", unreachable) == b"one"
+    fn, calls = backend(b"two")
+    assert hybrid.call("openai", "gpt-4", "second", fn) == b"two"
+    assert hybrid.call("openai", "gpt-4", "second", fn) == b"two"
+    assert len(calls) == 1
+    assert hybrid.stats() == {"modes": hybrid.modes, "hits": 2, "misses": 1, "recorded": 1}
+    assert Cassette(directory, mode="replay").call("openai", "gpt-4", "second", unreachable) == b"two"
+
+
+def test_modes_are_per_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv("GEN_REPLAY_SD3", "off")
+    cassette = Cassette(str(tmp_path / "cassette"), mode="replay")
+    fn, calls = backend(b"image")
+    assert cassette.call("sd3", "sd3-ultra", "A hall", fn) == b"image"
+    assert len(calls) == 1 and not os.path.exists(cassette.directory)
+    with pytest.raises(ValueError, match="sometimes"):
+        Cassette(str(tmp_path / "cassette"), backend_modes={"vision": "sometimes"})
+
+
+def test_vision_replies_depend_on_the_image(tmp_path, monkeypatch):
+    import main
+
+    # Two scenes with the same items but different images
+    images = []
+    for name, content in (("scene_Hall", b"hall pixels"), ("scene_Cellar", b"cellar pixels")):
+        with open(tmp_path / (name + ".jpeg"), "wb") as f:
+            f.write(content)
+        images.append(str(tmp_path / name))
+    replies = iter([b"lamp,0.1,0.2", b"lamp,0.8,0.9"])
+    monkeypatch.setattr(main, "hedged", lambda stage, fn: next(replies))
+
+    directory = str(tmp_path / "cassette")
+    monkeypatch.setattr(replay, "cassette", Cassette(directory, mode="record"))
+    recorded = [main.call_openai_with_image(image, "Where is the lamp?") for image in images]
+    assert recorded == ["lamp,0.1,0.2", "lamp,0.8,0.9"]
+
+    monkeypatch.setattr(main, "hedged", lambda stage, fn: unreachable())
+    monkeypatch.setattr(replay, "cassette", Cassette(directory, mode="replay"))
+    assert [main.call_openai_with_image(image, "Where is the lamp?") for image in reversed(images)] == recorded[::-1]
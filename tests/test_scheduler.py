@@ -0,0 +1,90 @@
+import time
+
+import pytest
+import requests
+
+from scheduler import BackendLimiter, CallProgress, RetryableError, check_response
+from stub_server import StubState, start_stub_server
+
+
+@pytest.fixture
+def stub():
+    servers = []
+
+    def start(**state):
+        server, base_url = start_stub_server(state=StubState(image_bytes=b"jpeg", **state))
+        servers.append(server)
+        return server.state, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+
+
+def image_request(base_url):
+    # What call_sd3 sends, minus the prompt
+    def request():
+        response = requests.post(f"{base_url}/v2beta/stable-image/generate/ultra", files={"none": ""}, data={"prompt": "test"}, timeout=5)
+        check_response(response)
+        return response.content
+    return request
+
+
+def test_retries_until_every_call_succeeds(stub):
+    # --error-rate 0.3 --retry-after 0
+    state, base_url = stub(error_rate=0.3, retry_after=0, seed=1)
+    limiter = BackendLimiter("test", max_concurrency=2, requests_per_minute=60000, max_retries=10, base_delay=0.01)
+    results = [limiter.call(image_request(base_url)) for _ in range(30)]
+    assert results == [b"jpeg"] * 30
+    assert state.errors > 0
+    assert limiter.retries == state.errors
+    assert limiter.requests == state.requests == 30 + state.errors
+    assert limiter.load() == {"active": 0, "waiting": 0, "max_concurrency": 2}
+
+
+def test_gives_up_after_max_retries_honoring_retry_after(stub):
+    state, base_url = stub(error_rate=1.0, retry_after=0.2)
+    limiter = BackendLimiter("test", max_concurrency=2, requests_per_minute=60000, max_retries=2, base_delay=5.0)
+    progress = CallProgress()
+    start = time.monotonic()
+    with pytest.raises(RetryableError) as error:
+        limiter.call_with_progress(progress, image_request(base_url))
+    elapsed = time.monotonic() - start
+    assert error.value.status_code == 429 and error.value.retry_after == 0.2
+    assert state.requests == 3
+    # Two Retry-After waits, not the 5s base delay
+    assert 0.4 <= elapsed < 2.0
+    assert progress.retries == 2 and progress.finished and progress.request_started is None
+
+
+def test_exponential_backoff_without_retry_after(stub):
+    state, base_url = stub(error_rate=1.0, error_status=503)
+    limiter = BackendLimiter("test", max_concurrency=1, requests_per_minute=60000, max_retries=3, base_delay=0.05)
+    start = time.monotonic()
+    with pytest.raises(RetryableError):
+        limiter.call(image_request(base_url))
+    # 0.05 + 0.1 + 0.2 seconds, each jittered down to no less than half
+    assert time.monotonic() - start >= (0.05 + 0.1 + 0.2) * 0.5
+    assert limiter.retries == 3 and state.requests == 4
+
+
+def test_other_errors_are_not_retried():
+    limiter = BackendLimiter("test", max_concurrency=1, requests_per_minute=60000, base_delay=0.01)
+    calls = []
+
+    def broken():
+        calls.append(1)
+        raise ValueError("bad prompt")
+
+    with pytest.raises(ValueError):
+        limiter.call(broken)
+    assert len(calls) == 1 and limiter.retries == 0
+
+
+def test_progress_reports_the_successful_request_only(stub):
+    state, base_url = stub(error_rate=0.5, retry_after=0, seed=3, image_latency="0.05")
+    limiter = BackendLimiter("test", max_concurrency=1, requests_per_minute=60000, max_retries=10, base_delay=0.01)
+    progress = CallProgress()
+    assert limiter.call_with_progress(progress, image_request(base_url)) == b"jpeg"
+    assert progress.finished and progress.retries == state.errors
+    assert 0.05 <= progress.request_seconds < 0.5
@@ -0,0 +1,109 @@
+import json
+import os
+
+import pygame
+import pytest
+
+from assets import SceneAssets
+from session import SessionState, load_session, read_snapshot, save_session
+from world_store import World
+
+
+def room(leads_to, is_locked=True):
+    return {"scene_description": "A room.", "is_locked": is_locked,
+            "items": {"door": {"description": "A door.", "interactions": {"use": "Creak."}, "leads_to": leads_to}}}
+
+
+def make_world(start="START_Hall"):
+    return World.from_game_data({
+        "scenes": {start: room("Kitchen", is_locked=False), "Kitchen": room("Cellar"), "Cellar": room("n/a")},
+        "puzzles": {"p1": {"requirements": [["use", "door"]], "result": {"unlocked_area": "Kitchen"}}},
+    })
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "session.json")
+
+
+@pytest.fixture
+def saved(path):
+    # A session in the kitchen with the kitchen's and the cellar's backgrounds cached
+    world = make_world()
+    scene_assets = SceneAssets(size=(30, 20))
+    for scene_name, color in (("Kitchen", (200, 10, 10)), ("Cellar", (10, 200, 10))):
+        surface = pygame.Surface((30, 20))
+        surface.fill(color)
+        scene_assets.put(scene_name, surface)
+    state = SessionState("Kitchen", {"p1": 1}, ["Kitchen"], [("START_Hall", "door")], ("It opens.", (255, 255, 255)))
+    save_session(state, world, scene_assets, path)
+    return world, state
+
+
+def pixels_file(path):
+    with open(path) as f:
+        return os.path.join(os.path.dirname(path), json.load(f)["pixels"])
+
+
+def test_round_trip(path, saved):
+    world, state = saved
+    loaded, surfaces = load_session(world, path)
+    assert loaded.to_dict() == state.to_dict()
+    # Current scene first, then the nearest
+    assert [scene_name for scene_name, _ in surfaces] == ["Kitchen", "Cellar"]
+    assert surfaces[0][1].get_size() == (30, 20)
+    assert surfaces[0][1].get_at((5, 5))[:3] == (200, 10, 10)
+    assert surfaces[1][1].get_at((29, 19))[:3] == (10, 200, 10)
+
+
+def test_saving_again_replaces_the_pixels(path, saved):
+    world, state = saved
+    first = pixels_file(path)
+    save_session(state, world, None, path)
+    assert not os.path.exists(first)
+    assert load_session(world, path)[1] == []
+
+
+def test_other_world_does_not_resume(path, saved):
+    other = make_world(start="START_Porch")
+    assert read_snapshot(other, path) is None
+    assert load_session(other, path) is None
+
+
+def test_missing_pixels_resume_without_backgrounds(path, saved):
+    world, state = saved
+    os.remove(pixels_file(path))
+    loaded, surfaces = load_session(world, path)
+    assert loaded.current_scene == "Kitchen" and surfaces == []
+
+
+def test_truncated_pixels_keep_the_complete_backgrounds(path, saved):
+    world, _ = saved
+    with open(pixels_file(path), "r+b") as f:
+        f.truncate(30 * 20 * 3 + 100)
+    _, surfaces = load_session(world, path)
+    assert [scene_name for scene_name, _ in surfaces] == ["Kitchen"]
+
+
+def test_pixels_that_do_not_match_their_size_are_skipped(path, saved):
+    world, _ = saved
+    with open(path) as f:
+        snapshot = json.load(f)
+    snapshot["surfaces"][0]["size"] = [40, 20]
+    with open(path, "w") as f:
+        json.dump(snapshot, f)
+    _, surfaces = load_session(world, path)
+    assert [scene_name for scene_name, _ in surfaces] == ["Cellar"]
+
+
+def test_damaged_snapshot_is_a_fresh_start(path, saved):
+    world, _ = saved
+    with open(path) as f:
+        snapshot = json.load(f)
+    snapshot["state"]["inventory"] = 7
+    with open(path, "w") as f:
+        json.dump(snapshot, f)
+    assert load_session(world, path) is None
+    with open(path, "w") as f:
+        f.write('{"version": 1, "world"')
+    assert read_snapshot(world, path) is None
@@ -0,0 +1,94 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import world_pool
+from world_pool import WorldPool
+from world_store import WORLD_INDEX, shard_file, write_json
+
+GAME_DATA = {
+    "scenes": {
+        "START_Library": {"scene_description": "Books.", "items": {}, "is_locked": False},
+        "Vault": {"scene_description": "Gold.", "items": {}, "is_locked": True},
+    },
+    "puzzles": {},
+}
+
+
+@pytest.fixture
+def pool(tmp_path):
+    return WorldPool(str(tmp_path / "pool"), size=2, match_threshold=0.3)
+
+
+def write_world(directory, game_data=GAME_DATA):
+    os.makedirs(directory, exist_ok=True)
+    write_json(os.path.join(directory, "game_data.json"), game_data)
+    write_json(os.path.join(directory, WORLD_INDEX), {"scenes": list(game_data["scenes"])})
+    for scene_name, scene in game_data["scenes"].items():
+        write_json(os.path.join(directory, shard_file(scene_name)), scene)
+        with open(os.path.join(directory, f"scene_{scene_name}.jpeg"), "wb") as f:
+            f.write(b"jpeg")
+
+
+def test_live_world_is_added_and_claimed(pool, tmp_path):
+    assert pool.claim("A haunted library full of whispering books", str(tmp_path)) is None
+    live = str(tmp_path / "live")
+    write_world(live)
+    with open(os.path.join(live, "unrelated.txt"), "w") as f:
+        f.write("not part of the world")
+    pool.add("A haunted library full of whispering books", GAME_DATA, live)
+
+    # Nothing queued for a fill to generate the same description again
+    assert not os.path.exists(os.path.join(pool.directory, "wanted.json"))
+    assert pool.stats()["ready"] == 1 and pool.stats()["added"] == 1
+
+    dest = str(tmp_path / "game")
+    os.makedirs(dest)
+    assert pool.claim("A library where the books whisper", dest) == GAME_DATA
+    assert sorted(os.listdir(dest)) == sorted(
+        ["game_data.json", WORLD_INDEX, "scene_START_Library.json", "scene_START_Library.jpeg", "scene_Vault.json", "scene_Vault.jpeg"])
+    assert pool.stats()["ready"] == 0
+
+
+def test_failed_copy_falls_back_to_live(pool, tmp_path, monkeypatch):
+    live = str(tmp_path / "live")
+    write_world(live)
+    pool.add("A haunted library", GAME_DATA, live)
+    copies = []
+
+    def copy(src, dst):
+        if copies:
+            raise OSError(28, "No space left on device")
+        copies.append(dst)
+        return shutil.copyfile(src, dst)
+
+    monkeypatch.setattr(world_pool.shutil, "copy", copy)
+    dest = str(tmp_path / "game")
+    os.makedirs(dest)
+    assert pool.claim("A haunted library", dest) is None
+    # No half-copied world left behind, and the pooled world is gone rather than handed out twice
+    assert os.listdir(dest) == []
+    assert pool.stats()["failed"] == 1 and pool.stats()["ready"] == 0
+
+
+def test_fill_survives_a_failed_generation(pool, monkeypatch):
+    descriptions = []
+
+    def generate(description, num_scenes=None):
+        descriptions.append(description)
+        if len(descriptions) == 1:
+            raise RuntimeError("HTTP 500")
+        world_dir = os.path.join(pool.ready_dir, str(len(descriptions)))
+        write_world(world_dir)
+        with open(os.path.join(world_dir, "meta.json"), "w") as f:
+            json.dump({"description": description, "created": 1e12, "scenes": 2}, f)
+
+    monkeypatch.setattr(pool, "generate", generate)
+    assert pool.fill() == 1
+    assert len(descriptions) == 2
+    assert pool.stats()["failed"] == 1
+    assert not os.path.exists(pool.lock_file)
+    # The missing world is retried on the next fill
+    assert pool.fill() == 1 and pool.stats()["ready"] == 2
@@ -0,0 +1,118 @@
+import copy
+import json
+import os
+import threading
+
+from world_store import WORLD_INDEX, World, WorldWriter, convert, shard_file, write_json
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bench", "fixtures", "world.json")
+
+
+def fixture_world():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def scene(leads_to=(), is_locked=True):
+    items = {f"door_{i}": {"description": "A door.", "interactions": {"use": "Creak."}, "leads_to": target}
+             for i, target in enumerate(leads_to)}
+    return {"scene_description": "A room.", "items": items, "is_locked": is_locked}
+
+
+def house():
+    # START_Hall -> Kitchen, Library; Library -> Kitchen, back to the hall; Kitchen -> Cellar; nothing reaches the Attic
+    return {
+        "scenes": {
+            "START_Hall": scene(["Kitchen", "n/a", "Library"], is_locked=False),
+            "Library": scene(["Kitchen", "START_Hall"]),
+            "Kitchen": scene(["Cellar", "Pantry"]),
+            "Cellar": scene(),
+            "Attic": scene(["Cellar"]),
+        },
+        "puzzles": {"p1": {"requirements": [["use", "door_0"]], "result": {"unlocked_area": "Kitchen"}}},
+    }
+
+
+def test_write_json_is_atomic_under_concurrent_writers(tmp_path):
+    path = str(tmp_path / "stats.json")
+    errors = []
+
+    def writer(n):
+        try:
+            for i in range(50):
+                write_json(path, {"writer": n, "i": i})
+        except OSError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    with open(path) as f:
+        assert json.load(f)["i"] == 49
+    assert os.listdir(tmp_path) == ["stats.json"]
+
+
+def test_converted_world_matches_its_game_data(tmp_path):
+    game_data = fixture_world()
+    original = copy.deepcopy(game_data)
+    convert(game_data, str(tmp_path))
+    world = World.load(str(tmp_path))
+
+    assert game_data == original
+    assert world.scene_names == list(game_data["scenes"])
+    assert world.start_scene == "START_Dusty_Library"
+    assert world.puzzles == game_data["puzzles"]
+    assert world.ready_scenes == set(game_data["scenes"])
+    for scene_name, scene_data in game_data["scenes"].items():
+        assert world.scene(scene_name) == scene_data
+        assert world.is_locked(scene_name) == scene_data["is_locked"]
+    world.unlock("Moonlit_Garden")
+    assert not world.is_locked("Moonlit_Garden")
+    # The in-memory form of the same world reads the same
+    in_memory = World.from_game_data(game_data)
+    assert in_memory.index == world.index
+    assert all(in_memory.scene(name) == world.scene(name) for name in game_data["scenes"])
+
+
+def test_refresh_picks_up_newly_published_scenes(tmp_path):
+    game_data = house()
+    writer = WorldWriter(str(tmp_path))
+    writer.publish(game_data, ["START_Hall"])
+    world = World.load(str(tmp_path))
+    assert world.ready_scenes == {"START_Hall"}
+    assert not os.path.exists(tmp_path / shard_file("Kitchen"))
+    assert world.refresh() == []
+
+    # Kitchen's shard read early (a download that landed before the index), before its coordinates were in
+    write_json(str(tmp_path / shard_file("Kitchen")), game_data["scenes"]["Kitchen"])
+    assert "coordinates" not in world.scene("Kitchen")["items"]["door_0"]
+
+    game_data["scenes"]["Kitchen"]["items"]["door_0"]["coordinates"] = [0.4, 0.6]
+    writer.publish(game_data, ["START_Hall", "Kitchen", "Library"])
+    assert world.refresh() == ["Kitchen", "Library"]
+    assert world.ready_scenes == {"START_Hall", "Kitchen", "Library"}
+    assert world.scene("Kitchen")["items"]["door_0"]["coordinates"] == [0.4, 0.6]
+    with open(tmp_path / WORLD_INDEX) as f:
+        assert not json.load(f)["generation_complete"]
+
+
+def test_reachable_is_breadth_first():
+    world = World.from_game_data(house())
+    assert world.reachable("START_Hall") == ["START_Hall", "Kitchen", "Library", "Cellar"]
+    assert world.reachable("Attic") == ["Attic", "Cellar"]
+
+
+def test_least_recently_used_shards_are_dropped(tmp_path):
+    convert(house(), str(tmp_path))
+    world = World.load(str(tmp_path), max_resident=2)
+    world.scene("START_Hall")
+    world.scene("Kitchen")
+    world.scene("START_Hall")
+    world.scene("Library")
+    assert world.resident_scenes() == ["START_Hall", "Library"]
+    assert world.evictions == 1
+    world.scene("START_Hall")
+    assert world.loads == 3
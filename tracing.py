@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from world_store import write_json
+
+# Nested timing spans for the generation pipeline, exportable as Chrome trace JSON (load it in
+# chrome://tracing or https://ui.perfetto.dev). Each span records the thread it ran on plus
+# whatever args the caller attaches (request/response sizes, cache hit/miss, scene name...).
+# Off unless GEN_TRACE is set (or main.py --trace is given), so nothing accumulates in normal runs.
+
+# Where main() writes the trace when it's done
+TRACE_PATH = os.getenv("GEN_TRACE")
+
+
+class Tracer:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self.thread_names = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._origin = time.perf_counter()
+
+    def reset(self):
+        with self._lock:
+            self.events = []
+            self.thread_names = {}
+            self._origin = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, category="gen", **args):
+        # Yields the span's args dict; anything added to it before the block ends is recorded
+        if not self.enabled:
+            yield args
+            return
+
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        if stack:
+            args["parent"] = stack[-1]
+        stack.append(name)
+        thread = threading.current_thread()
+        start = time.perf_counter()
+        try:
+            yield args
+        except BaseException as e:
+            args["error"] = repr(e)
+            raise
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            event = {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((start - self._origin) * 1e6, 1),
+                "dur": round((end - start) * 1e6, 1),
+                "pid": os.getpid(),
+                "tid": thread.native_id,
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+                self.thread_names[thread.native_id] = thread.name
+
+    def chrome_trace(self):
+        with self._lock:
+            events = list(self.events)
+            thread_names = dict(self.thread_names)
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid, "args": {"name": name}}
+            for tid, name in thread_names.items()
+        ]
+        return {"traceEvents": metadata + sorted(events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"}
+
+    def export_chrome_trace(self, path):
+        write_json(path, self.chrome_trace(), indent=None)
+
+    def summary(self):
+        # name -> {"count", "total_ms", "max_ms"}, e.g. for printing where the time went
+        totals = {}
+        with self._lock:
+            for event in self.events:
+                entry = totals.setdefault(event["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+                entry["count"] += 1
+                entry["total_ms"] += event["dur"] / 1000
+                entry["max_ms"] = max(entry["max_ms"], event["dur"] / 1000)
+        for entry in totals.values():
+            entry["total_ms"] = round(entry["total_ms"], 1)
+            entry["max_ms"] = round(entry["max_ms"], 1)
+        return totals
+
+
+tracer = Tracer(enabled=bool(TRACE_PATH))
+
+
+def span(name, category="gen", **args):
+    return tracer.span(name, category, **args)
@@ -0,0 +1,72 @@
+import base64
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import pygame
+
+# Image payloads for the gpt-4o coordinate call. Item coordinates are answered as ratios of the
+# image size, so the model doesn't need the full 1536x1024 SD3 render: a downscaled copy uploads
+# faster and costs fewer image tokens. Encoded payloads are kept in a small LRU keyed by a hash
+# of the file contents (not its path), so a regenerated scene_X.jpeg is never served stale.
+
+# Longest side of the image sent to the vision model; 0 sends the original file untouched
+VISION_MAX_SIDE = int(os.getenv("GEN_VISION_MAX_SIDE", "768"))
+# gpt-4o image detail: "auto", "low" (one 512px tile, fixed token cost) or "high"
+VISION_DETAIL = os.getenv("GEN_VISION_DETAIL", "auto")
+
+
+def downscale_jpeg(image_bytes, max_side):
+    # Returns JPEG bytes no larger than max_side on the longest side (the input if it already fits
+    # or can't be decoded; the model copes with the original either way)
+    if max_side <= 0:
+        return image_bytes
+    try:
+        image = pygame.image.load(io.BytesIO(image_bytes), "scene.jpeg")
+    except pygame.error:
+        return image_bytes
+    width, height = image.get_size()
+    if max(width, height) <= max_side:
+        return image_bytes
+    scale = max_side / max(width, height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    if image.get_bitsize() < 24:
+        image = image.convert(24)
+    image = pygame.transform.smoothscale(image, size)
+    buf = io.BytesIO()
+    pygame.image.save(image, buf, "scene.jpeg")
+    return buf.getvalue()
+
+
+class VisionImageCache:
+    def __init__(self, max_entries=16, max_side=VISION_MAX_SIDE):
+        self.max_entries = max_entries
+        self.max_side = max_side
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # (sha256 of the original bytes, max_side) -> data URL, most recently used last
+        self._urls = OrderedDict()
+
+    def data_url(self, image_bytes):
+        key = (hashlib.sha256(image_bytes).hexdigest(), self.max_side)
+        with self._lock:
+            url = self._urls.get(key)
+            if url is not None:
+                self.hits += 1
+                self._urls.move_to_end(key)
+                return url
+            self.misses += 1
+
+        payload = downscale_jpeg(image_bytes, self.max_side)
+        url = "data:image/jpeg;base64," + base64.b64encode(payload).decode("ascii")
+        with self._lock:
+            self._urls[key] = url
+            while len(self._urls) > self.max_entries:
+                self._urls.popitem(last=False)
+        return url
+
+
+vision_images = VisionImageCache()
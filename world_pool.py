@@ -0,0 +1,346 @@
+import argparse
+import asyncio
+import json
+import os
+import re
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import uuid
+
+from world_store import WORLD_INDEX, shard_file, write_json
+
+# Warm pool of complete, pre-generated worlds (game_data.json, world index + scene shards, images) kept
+# on disk, so game.py can start a game instantly instead of waiting a minute for generation.
+# Worlds are generated from seed descriptions; a world game.py had to generate live because nothing
+# matched is added too, so the next player asking for something like it starts instantly. A claim
+# takes the pooled world whose description is most similar to the player's; claiming is an atomic
+# directory rename, so concurrent games never share a world.
+#
+#   python world_pool.py fill             top the pool up once
+#   python world_pool.py daemon           keep it topped up
+#   python world_pool.py status           pool contents and hit rate
+
+# Worlds to keep ready; 0 turns the pool off (game.py then always generates live)
+POOL_SIZE = int(os.getenv("GEN_POOL_SIZE", "0"))
+POOL_DIR = os.getenv("GEN_POOL_DIR", ".world_pool")
+# Worlds older than this are dropped on the next fill (prompts and models change)
+POOL_MAX_AGE_HOURS = float(os.getenv("GEN_POOL_MAX_AGE_HOURS", "168"))
+# Which worlds to drop when the pool is over size: "oldest" first, or "duplicates" (the worlds
+# most similar to another pooled world) first to keep the pool varied
+POOL_EVICTION = os.getenv("GEN_POOL_EVICTION", "oldest")
+# Minimum description similarity (0..1) for a claim to count as a match
+POOL_MATCH = float(os.getenv("GEN_POOL_MATCH", "0.3"))
+# Hand out the closest world even when nothing matches, rather than generating live
+POOL_ACCEPT_ANY = os.getenv("GEN_POOL_ACCEPT_ANY", "0") == "1"
+
+SEED_DESCRIPTIONS = [
+    "A haunted library where the books whisper secrets at midnight.",
+    "A pirate ship stranded in a desert of singing sand dunes.",
+    "A clockwork village where every resident is slightly broken.",
+    "A wizard's tower that has been taken over by talking cats.",
+    "An abandoned space station orbiting a purple gas giant.",
+    "A cozy mountain inn hiding a smuggler's tunnel.",
+]
+
+STOPWORDS = {"a", "an", "the", "of", "in", "on", "at", "and", "or", "with", "where", "that", "is", "are", "to", "by", "has", "been", "every"}
+
+_stats_lock = threading.Lock()
+
+
+def description_words(description):
+    return {word for word in re.findall(r"[a-z0-9']+", description.lower()) if word not in STOPWORDS}
+
+
+def similarity(a, b):
+    # Jaccard overlap of the descriptions' content words
+    words_a, words_b = description_words(a), description_words(b)
+    if not words_a or not words_b:
+        return 0.0
+    return len(words_a & words_b) / len(words_a | words_b)
+
+
+class WorldPool:
+    def __init__(self, directory=POOL_DIR, size=POOL_SIZE, max_age_hours=POOL_MAX_AGE_HOURS,
+                 eviction=POOL_EVICTION, match_threshold=POOL_MATCH, accept_any=POOL_ACCEPT_ANY):
+        self.directory = directory
+        self.size = size
+        self.max_age_seconds = max_age_hours * 3600
+        self.eviction = eviction
+        self.match_threshold = match_threshold
+        self.accept_any = accept_any
+        self.ready_dir = os.path.join(directory, "ready")
+        self.claimed_dir = os.path.join(directory, "claimed")
+        self.building_dir = os.path.join(directory, "building")
+        self.stats_file = os.path.join(directory, "pool_stats.json")
+        self.lock_file = os.path.join(directory, "fill.lock")
+        for path in (self.ready_dir, self.claimed_dir, self.building_dir):
+            os.makedirs(path, exist_ok=True)
+
+    # --- pool contents
+
+    def worlds(self):
+        # [(world_dir, meta)] for every complete world, oldest first
+        worlds = []
+        for name in os.listdir(self.ready_dir):
+            world_dir = os.path.join(self.ready_dir, name)
+            try:
+                with open(os.path.join(world_dir, "meta.json")) as f:
+                    worlds.append((world_dir, json.load(f)))
+            except (OSError, json.JSONDecodeError):
+                continue
+        return sorted(worlds, key=lambda world: world[1]["created"])
+
+    def evict(self):
+        # Drop expired worlds, then trim to size according to the eviction policy
+        evicted = 0
+        now = time.time()
+        worlds = []
+        for world_dir, meta in self.worlds():
+            if now - meta["created"] > self.max_age_seconds:
+                shutil.rmtree(world_dir, ignore_errors=True)
+                evicted += 1
+            else:
+                worlds.append((world_dir, meta))
+
+        while len(worlds) > self.size:
+            if self.eviction == "duplicates" and len(worlds) > 1:
+                def redundancy(world):
+                    return max(similarity(world[1]["description"], other[1]["description"]) for other in worlds if other is not world)
+                victim = max(worlds, key=redundancy)
+            else:
+                victim = worlds[0]
+            worlds.remove(victim)
+            shutil.rmtree(victim[0], ignore_errors=True)
+            evicted += 1
+
+        if evicted:
+            self._count("evicted", evicted)
+        return evicted
+
+    # --- claiming
+
+    def claim(self, description, dest_dir="."):
+        # Copies the best-matching world's files into dest_dir and returns its game_data, or None
+        # on a miss or a failed copy (the caller generates live, and can add the result)
+        candidates = []
+        for world_dir, meta in self.worlds():
+            candidates.append((similarity(description, meta["description"]), world_dir, meta))
+        candidates.sort(key=lambda candidate: -candidate[0])
+
+        for score, world_dir, meta in candidates:
+            if score < self.match_threshold and not self.accept_any:
+                break
+            # Whoever renames the directory first owns the world
+            claimed_path = os.path.join(self.claimed_dir, f"{os.path.basename(world_dir)}-{os.getpid()}")
+            try:
+                os.rename(world_dir, claimed_path)
+            except OSError:
+                continue
+            copied = []
+            try:
+                for name in os.listdir(claimed_path):
+                    if name != "meta.json":
+                        shutil.copy(os.path.join(claimed_path, name), os.path.join(dest_dir, name))
+                        copied.append(name)
+                with open(os.path.join(dest_dir, "game_data.json")) as f:
+                    game_data = json.load(f)
+            except (OSError, ValueError) as e:
+                # Disk full, or a damaged world: don't leave half a world for the live generation to mix with
+                print(f"Couldn't claim pooled world \"{meta['description']}\": {e}")
+                for name in copied:
+                    try:
+                        os.remove(os.path.join(dest_dir, name))
+                    except OSError:
+                        pass
+                self._count("failed")
+                return None
+            finally:
+                shutil.rmtree(claimed_path, ignore_errors=True)
+            self._count("hits" if score >= self.match_threshold else "any_hits")
+            print(f"Claimed pooled world \"{meta['description']}\" (similarity {score:.2f})")
+            return game_data
+
+        self._count("misses")
+        return None
+
+    # --- filling
+
+    def fill(self, num_scenes=None):
+        # Generate worlds until the pool is full. Only one filler runs at a time.
+        if not self._acquire_fill_lock():
+            print("Another fill is already running")
+            return 0
+        try:
+            self.evict()
+            self._clear_stale_builds()
+            generated = 0
+            # One attempt per missing world; a failed one is retried on the next fill
+            for _ in range(self.size - len(self.worlds())):
+                try:
+                    self.generate(self._next_description(), num_scenes)
+                except Exception as e:
+                    print("Couldn't generate a pooled world:", e)
+                    self._count("failed")
+                    continue
+                generated += 1
+            return generated
+        finally:
+            os.remove(self.lock_file)
+
+    def generate(self, description, num_scenes=None):
+        # Imported here so claiming a world doesn't pay for loading the generator
+        from main import generate_world, publish_game_data
+
+        world_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        build_dir = os.path.join(self.building_dir, world_id)
+        os.makedirs(build_dir)
+        try:
+            start = time.perf_counter()
+            game_data = asyncio.run(generate_world(description, num_scenes=num_scenes, output_dir=build_dir))
+            publish_game_data(game_data, game_data["scenes"].keys(), os.path.join(build_dir, "game_data.json"))
+            with open(os.path.join(build_dir, "meta.json"), "w") as f:
+                json.dump({
+                    "description": description,
+                    "created": time.time(),
+                    "scenes": len(game_data["scenes"]),
+                    "generation_seconds": round(time.perf_counter() - start, 2),
+                }, f, indent=2)
+            # Appears in the pool only once it's complete
+            os.rename(build_dir, os.path.join(self.ready_dir, world_id))
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        self._count("generated")
+        print(f"Pooled world \"{description}\"")
+
+    def add(self, description, game_data, source_dir="."):
+        # Pools a copy of a world generated live in source_dir (after a miss), instead of having a
+        # later fill generate the same description again. Over-size pools are trimmed on the next fill.
+        from atlas import ATLAS_IMAGE, ATLAS_INDEX
+
+        names = ["game_data.json", WORLD_INDEX]
+        for scene_name in game_data["scenes"]:
+            names += [shard_file(scene_name), f"scene_{scene_name}.jpeg"]
+        if game_data.get("item_atlas"):
+            names += [ATLAS_IMAGE, ATLAS_INDEX]
+
+        world_id = f"{int(time.time())}-{uuid.uuid4().hex[:8]}"
+        build_dir = os.path.join(self.building_dir, world_id)
+        os.makedirs(build_dir)
+        try:
+            for name in names:
+                # Scenes whose image failed have none
+                if os.path.exists(os.path.join(source_dir, name)):
+                    shutil.copy(os.path.join(source_dir, name), os.path.join(build_dir, name))
+            write_json(os.path.join(build_dir, "meta.json"), {
+                "description": description,
+                "created": time.time(),
+                "scenes": len(game_data["scenes"]),
+                "generation_seconds": None,
+            }, indent=2)
+            os.rename(build_dir, os.path.join(self.ready_dir, world_id))
+        except BaseException:
+            shutil.rmtree(build_dir, ignore_errors=True)
+            raise
+        self._count("added")
+
+    def _next_description(self):
+        # The seed least represented in the pool
+        pooled = [meta["description"] for _, meta in self.worlds()]
+        return min(SEED_DESCRIPTIONS, key=lambda seed: sum(similarity(seed, other) for other in pooled))
+
+    def _clear_stale_builds(self):
+        # Left behind by fills that were killed halfway
+        for name in os.listdir(self.building_dir):
+            shutil.rmtree(os.path.join(self.building_dir, name), ignore_errors=True)
+
+    def _acquire_fill_lock(self):
+        try:
+            fd = os.open(self.lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(self.lock_file) as f:
+                    pid = int(f.read() or 0)
+                os.kill(pid, 0)
+                return False
+            except (OSError, ValueError):
+                # The filler that held it is gone
+                os.remove(self.lock_file)
+                return self._acquire_fill_lock()
+        with os.fdopen(fd, "w") as f:
+            f.write(str(os.getpid()))
+        return True
+
+    # --- metrics
+
+    def _count(self, counter, amount=1):
+        with _stats_lock:
+            stats = self._read_json(self.stats_file, {})
+            stats[counter] = stats.get(counter, 0) + amount
+            try:
+                write_json(self.stats_file, stats, indent=2)
+            except OSError as e:
+                # Metrics only; never worth failing a claim or a fill over
+                print("Couldn't update pool stats:", e)
+
+    def stats(self):
+        with _stats_lock:
+            stats = self._read_json(self.stats_file, {})
+        claims = stats.get("hits", 0) + stats.get("any_hits", 0) + stats.get("misses", 0)
+        stats["claims"] = claims
+        stats["hit_rate"] = round((stats.get("hits", 0) + stats.get("any_hits", 0)) / claims, 3) if claims else None
+        stats["ready"] = len(self.worlds())
+        stats["size"] = self.size
+        return stats
+
+    def _read_json(self, path, default):
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return default
+
+
+def spawn_refill(directory=POOL_DIR):
+    # Tops the pool up in a detached process, so it keeps going after the game exits
+    return subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "fill", "--dir", directory],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep a pool of pre-generated worlds ready for game.py")
+    parser.add_argument("command", choices=["fill", "daemon", "status"])
+    parser.add_argument("--dir", default=POOL_DIR)
+    parser.add_argument("--size", type=int, default=POOL_SIZE or 3)
+    parser.add_argument("--scenes", type=int, default=None, help="scenes per world (default: GEN_SCENES)")
+    parser.add_argument("--interval", type=float, default=60.0, help="daemon: seconds between fills")
+    args = parser.parse_args()
+
+    pool = WorldPool(args.dir, size=args.size)
+    if args.command == "status":
+        for world_dir, meta in pool.worlds():
+            age_hours = (time.time() - meta["created"]) / 3600
+            print(f"{os.path.basename(world_dir)}  {meta['scenes']} scenes  {age_hours:5.1f}h  {meta['description']}")
+        print(json.dumps(pool.stats(), indent=2))
+    elif args.command == "fill":
+        print(f"Generated {pool.fill(args.scenes)} worlds;", pool.stats())
+    else:
+        while True:
+            try:
+                pool.fill(args.scenes)
+            except Exception as e:
+                # Keep the pool alive through a full disk or a bad deploy; the next round tries again
+                print("Fill failed:", e)
+                pool._count("failed")
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
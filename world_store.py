@@ -0,0 +1,219 @@
+import argparse
+import json
+import os
+import tempfile
+from collections import OrderedDict
+
+# Sharded world format. A world is stored as a small index (world_index.json: scene names, the
+# start scene, lock state, the leads_to edges between scenes, the puzzles, which scenes are ready)
+# plus one shard per scene (scene_<name>.json: its description, items, interactions and hint).
+# The game reads the index at startup and loads a scene's shard the first time it's entered; only
+# the most recently used shards stay in memory. main.py writes each scene's shard, then the index,
+# as the scene finishes, so the index never lists a shard that isn't there yet.
+
+WORLD_INDEX = "world_index.json"
+FORMAT_VERSION = 1
+# Scene shards kept in memory at once (the most recently entered ones)
+RESIDENT_SCENES = int(os.getenv("GEN_WORLD_RESIDENT_SCENES", "4"))
+
+
+def shard_file(scene_name):
+    return "scene_" + scene_name + ".json"
+
+
+def scene_edges(scene):
+    # Distinct scenes this scene's items lead to, in item order
+    targets = (item.get("leads_to", "n/a") for item in scene.get("items", {}).values())
+    return list(dict.fromkeys(target for target in targets if target != "n/a"))
+
+
+def find_start_scene(scene_names):
+    # The (last) START_ scene, or the first scene if none is marked
+    start = scene_names[0]
+    for scene_name in scene_names:
+        if "START" in scene_name.upper():
+            start = scene_name
+    return start
+
+
+def build_index(game_data, ready_scenes):
+    scenes = game_data["scenes"]
+    ready = [scene_name for scene_name in ready_scenes if scene_name in scenes]
+    # Everything but the scenes themselves (puzzles, item_atlas, ...) is small and goes in as is
+    index = {key: value for key, value in game_data.items() if key not in ("scenes", "ready_scenes", "generation_complete")}
+    index.update({
+        "version": FORMAT_VERSION,
+        "start_scene": find_start_scene(list(scenes)),
+        "scenes": {
+            scene_name: {"is_locked": scene.get("is_locked", False), "leads_to": scene_edges(scene), "shard": shard_file(scene_name)}
+            for scene_name, scene in scenes.items()
+        },
+        "ready_scenes": ready,
+        "generation_complete": len(ready) == len(scenes),
+    })
+    return index
+
+
+def write_bytes(path, data):
+    # Temp file then rename, so readers never see a half-written file. The temp name is unique, so
+    # threads or processes writing the same file (the game and a pool refill, say) can't collide.
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_json(path, data, indent=1, sort_keys=False):
+    write_bytes(path, json.dumps(data, indent=indent, sort_keys=sort_keys).encode("utf-8"))
+
+
+class WorldWriter:
+    # Writes a world as it's generated: each newly ready scene's shard, then the index
+    def __init__(self, directory="."):
+        self.directory = directory
+        self._written = set()
+
+    def publish(self, game_data, ready_scenes):
+        for scene_name in ready_scenes:
+            if scene_name not in self._written:
+                write_json(os.path.join(self.directory, shard_file(scene_name)), game_data["scenes"][scene_name])
+                self._written.add(scene_name)
+        write_json(os.path.join(self.directory, WORLD_INDEX), build_index(game_data, ready_scenes))
+
+
+def convert(game_data, directory="."):
+    # An existing game_data.json world -> index + shards. Every scene gets a shard; the ones the
+    # file doesn't list as ready (if it lists any) stay not ready.
+    for scene_name, scene in game_data["scenes"].items():
+        write_json(os.path.join(directory, shard_file(scene_name)), scene)
+    ready_scenes = game_data.get("ready_scenes", list(game_data["scenes"]))
+    index = build_index(game_data, ready_scenes)
+    write_json(os.path.join(directory, WORLD_INDEX), index)
+    return index
+
+
+class World:
+    # Read side of the format. Scene shards are loaded on first use and the least recently used are
+    # dropped past max_resident. Scenes unlocked during play are tracked here, on top of the index.
+    def __init__(self, index, directory=".", shards=None, max_resident=RESIDENT_SCENES):
+        self.index = index
+        self.directory = directory
+        self.max_resident = max_resident
+        # Scenes that only exist in memory (World.from_game_data); these are never dropped
+        self._fixed = dict(shards or {})
+        # scene name -> shard; LRU order, most recently used last
+        self._shards = OrderedDict()
+        self.unlocked = set()
+        self.loads = 0
+        self.evictions = 0
+
+    @classmethod
+    def load(cls, directory=".", max_resident=RESIDENT_SCENES):
+        # The index in directory, or None if there isn't one (yet)
+        try:
+            with open(os.path.join(directory, WORLD_INDEX)) as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(index, directory, max_resident=max_resident)
+
+    @classmethod
+    def from_game_data(cls, game_data):
+        # A whole game_data dict already in memory (a pooled world from before the format, a fixture)
+        ready_scenes = game_data.get("ready_scenes", list(game_data["scenes"]))
+        return cls(build_index(game_data, ready_scenes), directory=None, shards=game_data["scenes"])
+
+    @property
+    def scene_names(self):
+        return list(self.index["scenes"])
+
+    @property
+    def start_scene(self):
+        return self.index["start_scene"]
+
+    @property
+    def puzzles(self):
+        return self.index.get("puzzles", {})
+
+    @property
+    def item_atlas(self):
+        return self.index.get("item_atlas")
+
+    @property
+    def ready_scenes(self):
+        return set(self.index.get("ready_scenes", ()))
+
+    def is_locked(self, scene_name):
+        return scene_name not in self.unlocked and self.index["scenes"][scene_name]["is_locked"]
+
+    def unlock(self, scene_name):
+        self.unlocked.add(scene_name)
+
+    def reachable(self, start_scene):
+        # Breadth-first over the leads_to edges, nearest scenes first
+        order = [start_scene]
+        seen = {start_scene}
+        for scene_name in order:
+            for target in self.index["scenes"].get(scene_name, {}).get("leads_to", ()):
+                if target in self.index["scenes"] and target not in seen:
+                    seen.add(target)
+                    order.append(target)
+        return order
+
+    def scene(self, scene_name):
+        if scene_name in self._fixed:
+            return self._fixed[scene_name]
+        shard = self._shards.get(scene_name)
+        if shard is None:
+            with open(os.path.join(self.directory, self.index["scenes"][scene_name]["shard"])) as f:
+                shard = json.load(f)
+            self.loads += 1
+            self._shards[scene_name] = shard
+            while len(self._shards) > max(1, self.max_resident):
+                self._shards.popitem(last=False)
+                self.evictions += 1
+        self._shards.move_to_end(scene_name)
+        return shard
+
+    def resident_scenes(self):
+        return list(self._fixed) + list(self._shards)
+
+    def refresh(self):
+        # Re-read the index after the generator publishes more scenes. Shards of scenes that have
+        # just become ready are dropped, in case they were read before their coordinates were in.
+        if self.directory is None:
+            return []
+        updated = World.load(self.directory)
+        if updated is None:
+            return []
+        new_scenes = [scene_name for scene_name in updated.index.get("ready_scenes", ()) if scene_name not in self.ready_scenes]
+        self.index = updated.index
+        for scene_name in new_scenes:
+            self._shards.pop(scene_name, None)
+        return new_scenes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a game_data.json world to the sharded format (world_index.json + scene_<name>.json)")
+    parser.add_argument("game_data", nargs="?", default="game_data.json")
+    parser.add_argument("--dest", help="directory to write to (default: next to game_data)")
+    args = parser.parse_args()
+
+    with open(args.game_data) as f:
+        game_data = json.load(f)
+    dest = args.dest or os.path.dirname(os.path.abspath(args.game_data))
+    os.makedirs(dest, exist_ok=True)
+    index = convert(game_data, dest)
+    index_bytes = os.path.getsize(os.path.join(dest, WORLD_INDEX))
+    print(f"Wrote {WORLD_INDEX} ({index_bytes} bytes) and {len(index['scenes'])} scene shards to {dest}")
+
+
+if __name__ == "__main__":
+    main()